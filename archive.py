@@ -0,0 +1,188 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from coms import COMS
+
+
+class ArchiveIndex:
+    """
+    archive.py
+    https://github.com/sam210723/coms-1
+
+    Persistent SQLite index of LRIT/HRIT header fields.
+    Rescans only parse files that are new or whose size or modification time changed.
+    """
+
+    # Indexed columns: column name -> SQL type
+    columns = {}
+    columns['path'] = "TEXT PRIMARY KEY"
+    columns['size'] = "INTEGER"
+    columns['mtime'] = "INTEGER"  # Nanoseconds
+    columns['valid'] = "INTEGER"
+
+    # Primary header
+    columns['file_type'] = "INTEGER"
+    columns['total_header_len'] = "INTEGER"
+    columns['data_field_len'] = "INTEGER"
+
+    # Image structure header
+    columns['bits_per_pixel'] = "INTEGER"
+    columns['num_cols'] = "INTEGER"
+    columns['num_lines'] = "INTEGER"
+    columns['image_type'] = "INTEGER"
+    columns['image_compression'] = "INTEGER"
+
+    # Image navigation header
+    columns['longitude'] = "TEXT"
+    columns['col_scaling'] = "INTEGER"
+    columns['line_scaling'] = "INTEGER"
+    columns['col_offset'] = "INTEGER"
+    columns['line_offset'] = "INTEGER"
+
+    # Image data function header, annotation header
+    columns['channel'] = "TEXT"
+    columns['text_data'] = "TEXT"
+
+    # Timestamp header
+    columns['timestamp'] = "TEXT"  # ISO 8601, UTC
+
+    # Image segmentation information header
+    columns['segment_num'] = "INTEGER"
+    columns['segment_total'] = "INTEGER"
+    columns['line_num_of_segment'] = "INTEGER"
+
+    # Header fields copied straight into columns of the same name
+    headerColumns = {}
+    headerColumns['primaryHeader'] = ('file_type', 'total_header_len', 'data_field_len')
+    headerColumns['imageStructureHeader'] = ('bits_per_pixel', 'num_cols', 'num_lines', 'image_type', 'image_compression')
+    headerColumns['imageNavigationHeader'] = ('longitude', 'col_scaling', 'line_scaling', 'col_offset', 'line_offset')
+    headerColumns['annotationTextHeader'] = ('text_data',)
+    headerColumns['imageSegmentationInformationHeader'] = ('segment_num', 'segment_total', 'line_num_of_segment')
+
+
+    def __init__(self, path="lrit-index.db"):
+        """
+        Opens index database, creating it if needed
+        :param path: SQLite database path
+        """
+        self.path = path
+        self.db = sqlite3.connect(self.path)
+
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS files ({0})".format(
+                ", ".join("{0} {1}".format(name, sqlType) for name, sqlType in self.columns.items())))
+            self.db.execute("CREATE INDEX IF NOT EXISTS files_image ON files (channel, image_type, timestamp)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS files_type ON files (file_type, timestamp)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+
+    # Scanning methods
+    def scan(self, paths, workers=4, prune=True):
+        """
+        Indexes new and changed files. Unchanged files are not opened.
+        :param paths: Files, directories or glob patterns to scan
+        :param workers: Number of parser threads
+        :param prune: Remove index entries for files under scanned directories that no longer exist
+        :return: Tuple of (files indexed, files removed)
+        """
+
+        # Stat everything first, only changed files get parsed
+        found = {}
+        for path in COMS.findFiles(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns)
+
+        known = {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT path, size, mtime FROM files")}
+        changed = [path for path, state in found.items() if known.get(path) != state]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(self.buildRow, changed, [found[path] for path in changed]))
+
+        removed = []
+        if prune:
+            roots = tuple(os.path.join(os.path.abspath(path), "") for path in paths if os.path.isdir(path))
+            removed = [(path,) for path in known if path.startswith(roots) and path not in found]
+
+        names = list(self.columns)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files ({0}) VALUES ({1})".format(
+                ", ".join(names), ", ".join("?" * len(names))), [[row.get(name) for name in names] for row in rows])
+            self.db.executemany("DELETE FROM files WHERE path = ?", removed)
+
+        return len(rows), len(removed)
+
+    def buildRow(self, path, state):
+        """
+        Parses headers of a file into an index row
+        :param path: Absolute file path
+        :param state: Tuple of (size, mtime) from stat
+        :return: Row dict. Files that cannot be read or parsed get a row with valid = 0, so they are skipped until they change.
+        """
+
+        row = {'path': path, 'size': state[0], 'mtime': state[1], 'valid': 0}
+        try:
+            result = COMS.parse(path)
+        except (OSError, ValueError):
+            return row
+
+        row['valid'] = int(result.primaryHeader.valid)
+        for attribute, names in self.headerColumns.items():
+            header = getattr(result, attribute)
+            if header.valid:
+                for name in names:
+                    row[name] = header.get(name)
+
+        if result.imageDataFunctionHeader.valid:
+            row['channel'] = result.imageDataFunctionHeader.getChannel()
+        if result.timestampHeader.valid:
+            row['timestamp'] = result.timestampHeader.toDatetime().isoformat(sep=" ")
+
+        return row
+
+
+    # Query methods
+    def query(self, fileType=None, imageType=None, channel=None, start=None, end=None, segment=None):
+        """
+        Finds indexed files matching all given criteria. Does not touch the files themselves.
+        :param fileType: File type (see COMS.fileTypes)
+        :param imageType: Image type (see COMS.imageTypes)
+        :param channel: Channel name, e.g. "IR1"
+        :param start: Earliest timestamp, datetime or ISO 8601 string (inclusive)
+        :param end: Latest timestamp, datetime or ISO 8601 string (exclusive)
+        :param segment: Segment number
+        :return: List of file paths ordered by timestamp and segment number
+        """
+
+        conditions = ["valid = 1"]
+        params = []
+        for column, value in (('file_type', fileType), ('image_type', imageType), ('channel', channel), ('segment_num', segment)):
+            if value is not None:
+                conditions.append("{0} = ?".format(column))
+                params.append(value)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(str(start))
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(str(end))
+
+        sql = "SELECT path FROM files WHERE {0} ORDER BY timestamp, segment_num, path".format(" AND ".join(conditions))
+        return [row[0] for row in self.db.execute(sql, params)]
+
+    def count(self):
+        """
+        Gets number of indexed files
+        :return: File count
+        """
+        return self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
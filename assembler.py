@@ -0,0 +1,387 @@
+import os
+import struct
+import zlib
+from time import perf_counter
+import numpy as np
+from codec import SegmentCodec, SegmentDecoder
+from coms import COMS
+
+
+def getPassName(result):
+    """
+    Gets name shared by all segments of one image, e.g. "IMG_ENH_01_IR1_20120101_000920"
+    :param result: ParseResult or COMS instance with parsed headers
+    :return: Pass name
+    """
+
+    name = result.annotationTextHeader.get('text_data') or os.path.basename(result.path)
+    name = os.path.splitext(name.strip("\x00 "))[0]
+    if result.imageSegmentationInformationHeader.valid:
+        name = name.rsplit("_", 1)[0]  # Drop segment number
+    return name
+
+
+def getPixelType(bitsPerPixel):
+    """
+    Gets NumPy pixel type for image data
+    :param bitsPerPixel: Bits per pixel from Image Structure header
+    :return: NumPy dtype
+    """
+
+    if bitsPerPixel == 8:
+        return np.dtype(np.uint8)
+    elif bitsPerPixel == 16:
+        return np.dtype("<u2")  # COMS HRIT stores 10 bit samples in little-endian 16 bit words
+    raise ValueError("Unsupported bits per pixel: {0}".format(bitsPerPixel))
+
+
+def writePng(path, image):
+    """
+    Writes 8 or 16 bit greyscale (optionally with alpha), or 8 bit RGB image to PNG, compressing one row at a time
+    :param path: Output file path
+    :param image: 2D (greyscale) or 3D (greyscale and alpha, or RGB) NumPy array
+    """
+
+    def chunk(chunkType, data):
+        return struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", zlib.crc32(chunkType + data))
+
+    if COMS.metrics is not None:
+        start = perf_counter()
+
+    bitDepth = 16 if image.dtype.itemsize == 2 else 8
+    colourType = 0
+    if image.ndim == 3:
+        colourType = 4 if image.shape[2] == 2 else 2
+    rowType = ">u2" if bitDepth == 16 else np.uint8
+
+    with open(path, "wb") as pngFile:
+        pngFile.write(b"\x89PNG\r\n\x1a\n")
+        pngFile.write(chunk(b"IHDR", struct.pack(">IIBBBBB", image.shape[1], image.shape[0], bitDepth, colourType, 0, 0, 0)))
+
+        compressor = zlib.compressobj(6)
+        for row in image:
+            data = compressor.compress(b"\x00" + row.astype(rowType, copy=False).tobytes())
+            if data:
+                pngFile.write(chunk(b"IDAT", data))
+        pngFile.write(chunk(b"IDAT", compressor.flush()))
+        pngFile.write(chunk(b"IEND", b""))
+
+    if COMS.metrics is not None:
+        COMS.metrics.addStage("writePng", perf_counter() - start, image.nbytes)
+
+
+class SegmentAssembler:
+    """
+    assembler.py
+    https://github.com/sam210723/coms-1
+
+    Streams IMG segment data fields into one preallocated image, optionally backed by np.memmap.
+    Each segment is copied once, straight from the mapped file into its line range.
+    """
+
+    def __init__(self, numCols, numLines, bitsPerPixel=8, rawPath=None):
+        """
+        Allocates image
+        :param numCols: Image width
+        :param numLines: Image height (upper bound, see getImage())
+        :param bitsPerPixel: Bits per pixel of segments
+        :param rawPath: Back image with a raw file at this path instead of memory
+        """
+
+        self.numCols = numCols
+        self.numLines = numLines
+        self.pixelType = getPixelType(bitsPerPixel)
+        self.rawPath = rawPath
+        self.received = set()  # Segment numbers copied so far
+        self.ranges = []  # Line ranges copied so far, 0-based and exclusive
+        self.segmentTotal = None
+        self.lineCount = 0  # Last image line written
+
+        if rawPath is None:
+            self.image = np.zeros((numLines, numCols), dtype=self.pixelType)
+        else:
+            self.image = np.memmap(rawPath, dtype=self.pixelType, mode="w+", shape=(numLines, numCols))
+
+    @classmethod
+    def fromSegment(cls, lrit, rawPath=None):
+        """
+        Creates assembler sized from headers of any one segment of an image
+        :param lrit: COMS instance or ParseResult with parsed headers
+        :param rawPath: Back image with a raw file at this path instead of memory
+        :return: SegmentAssembler
+        """
+
+        structure = lrit.imageStructureHeader
+        segmentation = lrit.imageSegmentationInformationHeader
+
+        # Later segments are never longer than this one, except for the one line added by uneven splits
+        numLines = structure.num_lines
+        if segmentation.valid:
+            remaining = segmentation.segment_total - segmentation.segment_num + 1
+            numLines = segmentation.line_num_of_segment - 1 + structure.num_lines * remaining
+            if segmentation.segment_num > 1:
+                numLines += remaining
+
+        return cls(structure.num_cols, numLines, structure.bits_per_pixel, rawPath)
+
+    @classmethod
+    def fromFiles(cls, paths, rawPath=None, workers=None):
+        """
+        Assembles image from segment files. Headers are read first to size the image exactly.
+        :param paths: Segment file paths, in any order
+        :param rawPath: Back image with a raw file at this path instead of memory
+        :param workers: Processes decoding compressed segments concurrently (default: number of CPUs), 0 to decode in this process
+        :return: SegmentAssembler
+        """
+
+        results = COMS.parseMany(paths)
+        first = results[0]
+        numLines = max(r.imageSegmentationInformationHeader.get('line_num_of_segment', 1) - 1 + r.imageStructureHeader.num_lines for r in results)
+
+        assembler = cls(first.imageStructureHeader.num_cols, numLines, first.imageStructureHeader.bits_per_pixel, rawPath)
+        compressed = [r for r in results if r.imageStructureHeader.image_compression != 0]
+        if compressed and workers != 0 and len(compressed) > 1:
+            with SegmentDecoder(workers) as decoder:
+                for result, (path, pixels) in zip(compressed, decoder.decodeFiles([r.path for r in compressed])):
+                    assembler.addSegment(result, pixels)
+            paths = [r.path for r in results if r.imageStructureHeader.image_compression == 0]
+
+        for path in paths:
+            with COMS(path, useMmap=True) as lrit:
+                lrit.walkHeaders()
+                assembler.addSegment(lrit)
+        return assembler
+
+    def addSegment(self, lrit, pixels=None):
+        """
+        Copies data field of a segment into its line range, decoding it first if it is compressed
+        :param lrit: COMS instance with parsed headers, or ParseResult if pixels are given
+        :param pixels: Decoded segment from SegmentDecoder, shaped (lines, columns)
+        :return: Tuple of (first line, last line) written, 0-based and exclusive
+        """
+
+        structure = lrit.imageStructureHeader
+        segmentation = lrit.imageSegmentationInformationHeader
+        if structure.num_cols != self.numCols:
+            raise ValueError("Segment has {0} columns, image has {1}".format(structure.num_cols, self.numCols))
+
+        firstLine = 0
+        segmentNum = 1
+        if segmentation.valid:
+            firstLine = segmentation.line_num_of_segment - 1
+            segmentNum = segmentation.segment_num
+            self.segmentTotal = segmentation.segment_total
+        lastLine = min(firstLine + structure.num_lines, self.numLines)
+
+        if pixels is None and structure.image_compression != 0:
+            pixels = SegmentCodec.decodeSegment(lrit)
+
+        if COMS.metrics is not None:
+            start = perf_counter()
+
+        if pixels is not None:
+            self.image[firstLine:lastLine] = pixels[:lastLine - firstLine]
+        else:
+            # View straight onto the segment data field, copied once into the image
+            data = lrit.getDataField()
+            pixels = np.frombuffer(data, dtype=self.pixelType, count=(lastLine - firstLine) * self.numCols)
+            self.image[firstLine:lastLine] = pixels.reshape(lastLine - firstLine, self.numCols)
+            del pixels
+            data.release()
+
+        if COMS.metrics is not None:
+            COMS.metrics.addStage("addSegment", perf_counter() - start, (lastLine - firstLine) * self.numCols * self.pixelType.itemsize)
+
+        self.received.add(segmentNum)
+        self.ranges.append((firstLine, lastLine))
+        self.lineCount = max(self.lineCount, lastLine)
+        return firstLine, lastLine
+
+    def isComplete(self):
+        """
+        Checks if all segments of the image have been added
+        :return: True if complete
+        """
+        return self.segmentTotal is not None and len(self.received) == self.segmentTotal
+
+    def getImage(self):
+        """
+        Gets assembled image, trimmed to the last line written
+        :return: NumPy array view
+        """
+        return self.image[:self.lineCount]
+
+    def writePng(self, path):
+        """
+        Writes assembled image to PNG
+        :param path: Output file path
+        """
+        writePng(path, self.getImage())
+
+    def getMask(self, numLines=None):
+        """
+        Gets lines copied so far
+        :param numLines: Mask length (default: last line written)
+        :return: NumPy bool array, True for lines of segments received
+        """
+
+        mask = np.zeros(numLines or self.lineCount, dtype=bool)
+        for firstLine, lastLine in self.ranges:
+            mask[firstLine:lastLine] = True
+        return mask
+
+    def writeMaskedPng(self, path, numLines=None):
+        """
+        Writes partly assembled image to PNG with an alpha channel, lines of missing segments transparent
+        :param path: Output file path
+        :param numLines: Image height, e.g. expected height when the last segment is missing (default: last line written)
+        """
+
+        numLines = numLines or self.lineCount
+        masked = np.zeros((numLines, self.numCols, 2), dtype=self.pixelType)
+        lines = min(numLines, self.lineCount)
+        masked[:lines, :, 0] = self.image[:lines]
+        masked[self.getMask(numLines), :, 1] = np.iinfo(self.pixelType).max
+        writePng(path, masked)
+
+    def writeRaw(self, path=None):
+        """
+        Writes assembled image as raw pixels. A memmap-backed image is flushed in place.
+        :param path: Output file path, defaults to the memmap path
+        """
+
+        if self.rawPath is not None and (path is None or os.path.abspath(path) == os.path.abspath(self.rawPath)):
+            self.image.flush()
+            if self.lineCount < self.numLines:
+                del self.image
+                os.truncate(self.rawPath, self.lineCount * self.numCols * self.pixelType.itemsize)
+                self.image = np.memmap(self.rawPath, dtype=self.pixelType, mode="r+", shape=(self.lineCount, self.numCols))
+                self.numLines = self.lineCount
+        else:
+            self.getImage().tofile(path)
+
+
+class PassTracker:
+    """
+    Tracks segments received of one pass: a bitmap of segment numbers, their line ranges and arrival times.
+    Used to write partial products while segments are missing, and to decide when to stop waiting for them.
+    The pass image is kept in a SegmentAssembler, each segment is added to it once as it arrives.
+    """
+
+    def __init__(self, name, segmentTotal, now):
+        """
+        :param name: Pass name
+        :param segmentTotal: Number of segments expected
+        :param now: Arrival time of the first segment (monotonic seconds)
+        """
+
+        self.name = name
+        self.segmentTotal = segmentTotal
+        self.bitmap = 0  # Bit n - 1 is set once segment n is received
+        self.segments = {}  # Segment number -> (path, first line, lines), 0-based
+        self.firstArrival = now
+        self.lastArrival = now
+        self.finalized = False  # Set when complete or timed out, late segments are still added
+        self.lastWrite = None  # Monotonic time of the last product written
+        self.assembler = None  # Image of segments assembled so far, None until the first assemble() or after release()
+        self.pending = set()  # Segment numbers received but not assembled yet
+
+    def __repr__(self):
+        return "PassTracker({0}, {1}/{2} segments)".format(self.name, len(self.segments), self.segmentTotal)
+
+    def add(self, result, now):
+        """
+        Records a segment
+        :param result: ParseResult or COMS instance with parsed headers
+        :param now: Arrival time (monotonic seconds)
+        :return: True if the segment is new, or a copy of it from another file replaces the one received before
+        """
+
+        segmentation = result.imageSegmentationInformationHeader
+        segmentNum = segmentation.get('segment_num', 1)
+        if segmentNum in self.segments and self.segments[segmentNum][0] == result.path:
+            return False
+
+        self.bitmap |= 1 << (segmentNum - 1)
+        self.segments[segmentNum] = (result.path, segmentation.get('line_num_of_segment', 1) - 1, result.imageStructureHeader.num_lines)
+        self.pending.add(segmentNum)
+        self.lastArrival = now
+        return True
+
+    def takePending(self):
+        """
+        Gets segments received since the last call, to be passed to assemble()
+        :return: List of (segment number, path)
+        """
+
+        segments = [(segmentNum, self.segments[segmentNum][0]) for segmentNum in sorted(self.pending)]
+        self.pending.clear()
+        return segments
+
+    def assemble(self, segments):
+        """
+        Adds segments to the pass image, sizing it from the first one. May run on a worker thread while add() is called,
+        as long as only one assemble() runs at a time.
+        :param segments: List of (segment number, path) from takePending()
+        :return: SegmentAssembler
+        """
+
+        for segmentNum, path in segments:
+            with COMS(path, useMmap=True) as lrit:
+                lrit.walkHeaders()
+                if self.assembler is None:
+                    self.assembler = SegmentAssembler.fromSegment(lrit)
+                self.assembler.addSegment(lrit)
+        if self.assembler is None:
+            raise ValueError("Pass {0} has no segments to assemble".format(self.name))
+        return self.assembler
+
+    def release(self):
+        """
+        Frees the pass image once its final product is written. Segments arriving later rebuild it from all segments.
+        """
+        self.assembler = None
+        self.pending.update(self.segments)
+
+    def isComplete(self):
+        return self.bitmap == (1 << self.segmentTotal) - 1
+
+    def getPaths(self):
+        """
+        :return: Paths of segments received, in segment order
+        """
+        return [self.segments[n][0] for n in sorted(self.segments)]
+
+    def getMissing(self):
+        """
+        :return: Segment numbers not received yet
+        """
+        return [n for n in range(1, self.segmentTotal + 1) if not self.bitmap >> (n - 1) & 1]
+
+    def getNumLines(self):
+        """
+        Gets image height. Exact once the last segment is received, otherwise estimated from the last segment received,
+        as later segments are never longer than earlier ones.
+        :return: Number of lines
+        """
+
+        segmentNum = max(self.segments)
+        path, firstLine, numLines = self.segments[segmentNum]
+        return firstLine + numLines * (self.segmentTotal - segmentNum + 1)
+
+    def getGaps(self):
+        """
+        Gets line ranges of missing segments
+        :return: List of (first line, last line), 0-based and exclusive
+        """
+
+        gaps = []
+        line = 0
+        for segmentNum in sorted(self.segments):
+            path, firstLine, numLines = self.segments[segmentNum]
+            if firstLine > line:
+                gaps.append((line, firstLine))
+            line = max(line, firstLine + numLines)
+        if line < self.getNumLines():
+            gaps.append((line, self.getNumLines()))
+        return gaps
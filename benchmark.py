@@ -0,0 +1,230 @@
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from coms import COMS
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows, peak RSS is not reported
+
+
+# Benchmark cases. Each takes the classified corpus and returns (operations, bytes processed).
+def benchHeaders(corpus):
+    """
+    Maps each file and walks its headers (every parse*Header)
+    """
+    for path in corpus['files']:
+        with COMS(path, useMmap=True) as lrit:
+            lrit.walkHeaders()
+    return len(corpus['files']), corpus['headerBytes']
+
+
+def benchLoad(corpus):
+    """
+    Reads each whole file into memory and walks its headers, the default COMS mode
+    """
+    for path in corpus['files']:
+        with COMS(path) as lrit:
+            lrit.walkHeaders()
+    return len(corpus['files']), corpus['fileBytes']
+
+
+def benchExtract(corpus):
+    """
+    Extracts each Additional Data payload to a temporary directory
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for path in corpus['data']:
+            with COMS(path, useMmap=True) as lrit:
+                lrit.walkHeaders()
+                lrit.extractDataField(directory)
+    return len(corpus['data']), corpus['dataBytes']
+
+
+def benchAssemble(corpus):
+    """
+    Assembles each image pass in memory
+    """
+    from assembler import SegmentAssembler
+
+    for paths in corpus['passes']:
+        SegmentAssembler.fromFiles(paths).getImage()
+    return len(corpus['passes']), corpus['imageBytes']
+
+
+def benchCalibrate(corpus):
+    """
+    Converts each image segment to physical units
+    """
+    from calibration import Calibration
+
+    for path in corpus['images']:
+        with COMS(path, useMmap=True) as lrit:
+            lrit.walkHeaders()
+            Calibration.fromHeader(lrit).calibrateSegment(lrit)
+    return len(corpus['images']), corpus['imageBytes']
+
+
+def benchDecode(corpus):
+    """
+    Decodes each compressed image segment in this process
+    """
+    from codec import SegmentCodec
+
+    for path in corpus['compressed']:
+        with COMS(path, useMmap=True) as lrit:
+            lrit.walkHeaders()
+            SegmentCodec.decodeSegment(lrit)
+    return len(corpus['compressed']), corpus['compressedBytes']
+
+
+def runCase(name, corpus, repeat):
+    """
+    Runs one case, keeping the fastest of several runs. Called in a fresh process so peak RSS belongs to this case.
+    :param name: Case name
+    :param corpus: Classified corpus, see Benchmark.classify()
+    :param repeat: Number of runs
+    :return: Result dictionary
+    """
+
+    function = globals()[Benchmark.cases[name]]
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        ops, size = function(corpus)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peakRss = None
+    if resource is not None:
+        peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peakRss //= 1024  # Bytes on macOS, kilobytes elsewhere
+
+    return {
+        'ops': ops,
+        'bytes': size,
+        'seconds': round(best, 6),
+        'ops_per_s': round(ops / best, 3) if best else 0.0,
+        'mb_per_s': round(size / best / 1e6, 3) if best else 0.0,
+        'peak_rss_kb': peakRss
+    }
+
+
+class Benchmark:
+    """
+    benchmark.py
+    https://github.com/sam210723/coms-1
+
+    Times header parsing, payload extraction, segment assembly, calibration and decoding over a corpus of LRIT/HRIT files
+    (see synthetic.py), reporting ops/s, MB/s and peak RSS. Results can be saved and compared against a baseline.
+    """
+
+    # Case name -> function
+    cases = {}
+    cases['headers'] = "benchHeaders"
+    cases['load'] = "benchLoad"
+    cases['extract'] = "benchExtract"
+    cases['assemble'] = "benchAssemble"
+    cases['calibrate'] = "benchCalibrate"
+    cases['decode'] = "benchDecode"
+
+    def __init__(self, paths):
+        """
+        :param paths: Corpus files, directories or glob patterns
+        """
+        self.corpus = self.classify(COMS.findFiles(paths))
+
+    @staticmethod
+    def classify(files):
+        """
+        Sorts corpus by what each case needs, so parsing for this is not timed
+        :param files: File paths
+        :return: Dictionary of file lists and byte counts
+        """
+        from assembler import getPassName
+
+        corpus = {'files': [], 'images': [], 'compressed': [], 'data': [], 'passes': [],
+                  'headerBytes': 0, 'fileBytes': 0, 'imageBytes': 0, 'compressedBytes': 0, 'dataBytes': 0}
+        passes = {}
+        for result in COMS.parseMany(files):
+            primary = result.primaryHeader
+            if not primary.valid:
+                continue
+
+            dataBytes = (primary.data_field_len + 7) // 8
+            corpus['files'].append(result.path)
+            corpus['headerBytes'] += primary.total_header_len
+            corpus['fileBytes'] += primary.total_header_len + dataBytes
+
+            if primary.file_type == 0 and result.imageDataFunctionHeader.valid and result.imageStructureHeader.image_compression == 0:
+                corpus['images'].append(result.path)
+                corpus['imageBytes'] += dataBytes
+                passes.setdefault(getPassName(result), []).append(result.path)
+            elif primary.file_type == 0 and result.imageStructureHeader.valid and result.imageStructureHeader.image_compression != 0:
+                corpus['compressed'].append(result.path)
+                corpus['compressedBytes'] += dataBytes
+            elif primary.file_type in COMS.dataExtensions:
+                corpus['data'].append(result.path)
+                corpus['dataBytes'] += dataBytes
+
+        corpus['passes'] = [passes[name] for name in sorted(passes)]
+        return corpus
+
+    def run(self, cases=None, repeat=3):
+        """
+        Runs cases, each in a fresh process
+        :param cases: Case names (default: all)
+        :param repeat: Runs per case, the fastest is kept
+        :return: Results dictionary
+        """
+
+        results = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'files': len(self.corpus['files']),
+            'cases': {}
+        }
+
+        context = multiprocessing.get_context("spawn")
+        for name in cases or self.cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results['cases'][name] = executor.submit(runCase, name, self.corpus, repeat).result()
+        return results
+
+    @staticmethod
+    def save(results, path):
+        """
+        Saves results as JSON, for use as a baseline
+        """
+        with open(path, "w") as resultsFile:
+            json.dump(results, resultsFile, indent=2)
+
+    @staticmethod
+    def compare(results, baselinePath, threshold=10.0):
+        """
+        Compares results with a saved baseline
+        :param results: Results dictionary
+        :param baselinePath: Baseline JSON path
+        :param threshold: Slowdown in ops/s (percent) counted as a regression
+        :return: Dictionary of case name -> (ops/s change in percent, True if regressed), for cases in both
+        """
+
+        with open(baselinePath) as baselineFile:
+            baseline = json.load(baselineFile)
+
+        changes = {}
+        for name, result in results['cases'].items():
+            previous = baseline['cases'].get(name)
+            if not previous or not previous['ops_per_s']:
+                continue
+            change = (result['ops_per_s'] / previous['ops_per_s'] - 1) * 100
+            changes[name] = (change, change < -threshold)
+        return changes
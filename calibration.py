@@ -0,0 +1,117 @@
+import hashlib
+import numpy as np
+from assembler import getPixelType
+
+
+class Calibration:
+    """
+    calibration.py
+    https://github.com/sam210723/coms-1
+
+    Radiometric calibration lookup table parsed from an Image Data Function Data Definition Block (DDB).
+    Converts raw counts to physical units (Kelvin or albedo %) with a single NumPy take.
+    """
+
+    # Parsed tables keyed by SHA-1 of DDB text. Identical DDBs repeat across segments and passes.
+    cache = {}
+    cacheSize = 64
+
+    def __init__(self, channel, name, unit, lut):
+        """
+        :param channel: Channel ID, e.g. "IR1"
+        :param name: Channel name, e.g. "VISIBLE"
+        :param unit: Unit of calibrated values, e.g. "KELVIN"
+        :param lut: NumPy lookup table indexed by count
+        """
+        self.channel = channel
+        self.name = name
+        self.unit = unit
+        self.lut = lut
+
+    def __repr__(self):
+        return "Calibration({0}, {1}, {2} entries)".format(self.channel, self.unit, len(self.lut))
+
+    @classmethod
+    def fromDataDefinitionBlock(cls, ddb):
+        """
+        Gets calibration for a DDB, parsing it only if the same content has not been seen before
+        :param ddb: DDB text
+        :return: Calibration
+        """
+
+        key = hashlib.sha1(ddb.encode()).digest()
+        calibration = cls.cache.get(key)
+        if calibration is None:
+            calibration = cls.parse(ddb)
+            if len(cls.cache) >= cls.cacheSize:
+                cls.cache.pop(next(iter(cls.cache)))  # Drop oldest entry
+            cls.cache[key] = calibration
+        return calibration
+
+    @classmethod
+    def fromHeader(cls, lrit):
+        """
+        Gets calibration for a file with parsed headers
+        :param lrit: COMS instance or ParseResult
+        :return: Calibration
+        """
+
+        if not lrit.imageDataFunctionHeader.valid:
+            raise ValueError("No Image Data Function header")
+        return cls.fromDataDefinitionBlock(lrit.imageDataFunctionHeader.data_definition_block)
+
+    @classmethod
+    def parse(cls, ddb):
+        """
+        Parses DDB text into a lookup table. Table size is a power of two covering all defined counts,
+        undefined counts are NaN.
+        :param ddb: DDB text
+        :return: Calibration
+        """
+
+        fields = {}
+        counts = []
+        values = []
+        for line in ddb.splitlines():
+            key, sep, value = line.partition(":=")
+            if not sep:
+                continue
+            if key.isdigit():
+                counts.append(int(key))
+                values.append(float(value))
+            else:
+                fields[key] = value.strip()
+
+        if not counts:
+            raise ValueError("DDB has no calibration entries")
+
+        size = 256
+        while size <= max(counts):
+            size *= 2
+
+        lut = np.full(size, np.nan, dtype=np.float32)
+        lut[counts] = values
+        lut.flags.writeable = False  # Shared through the cache
+
+        return cls(fields.get("CHANNEL"), fields.get("_NAME"), fields.get("_UNIT"), lut)
+
+    def calibrate(self, counts, out=None):
+        """
+        Converts raw counts to physical units. Counts beyond the table are clipped to the last entry.
+        :param counts: NumPy array of counts, e.g. an assembled image or one segment
+        :param out: Optional float32 output array of the same shape
+        :return: Float32 array of calibrated values
+        """
+        return self.lut.take(counts, mode="clip", out=out)
+
+    def calibrateSegment(self, lrit):
+        """
+        Converts data field of a segment to physical units without copying the raw counts
+        :param lrit: COMS instance with parsed headers
+        :return: Float32 array of calibrated values, shaped (lines, columns)
+        """
+
+        structure = lrit.imageStructureHeader
+        pixelType = getPixelType(structure.bits_per_pixel)
+        counts = np.frombuffer(lrit.getDataField(), dtype=pixelType, count=structure.num_cols * structure.num_lines)
+        return self.calibrate(counts.reshape(structure.num_lines, structure.num_cols))
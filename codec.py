@@ -0,0 +1,546 @@
+import heapq
+import io
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import numpy as np
+from coms import COMS
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Lossy segments need Pillow, everything else works without it
+
+
+def decodeSegment(path):
+    """
+    Decodes data field of one segment. Runs in a worker process.
+    :param path: Segment file path
+    :return: Tuple of (path, pixels)
+    """
+
+    with COMS(path, useMmap=True) as lrit:
+        lrit.walkHeaders()
+        return path, SegmentCodec.decodeSegment(lrit)
+
+
+class SegmentCodec:
+    """
+    codec.py
+    https://github.com/sam210723/coms-1
+
+    Decodes compressed image segment data fields into pixel arrays, by the Image Structure header compression type.
+    Lossless segments (1) are lossless JPEG (ITU-T T.81 process 14, SOF3), decoded with NumPy. Lossy segments (2)
+    are baseline JPEG, decoded with Pillow. Both have encoders too, for locally made test fixtures.
+    """
+
+    # Markers
+    SOI = 0xD8
+    EOI = 0xD9
+    SOF3 = 0xC3
+    DHT = 0xC4
+    SOS = 0xDA
+    DRI = 0xDD
+    segmentLayout = struct.Struct(">BBH")  # 0xFF, marker, length
+
+    @classmethod
+    def decodeSegment(cls, lrit, data=None):
+        """
+        Decodes data field of a segment, whatever its compression type
+        :param lrit: COMS instance or ParseResult with parsed headers
+        :param data: Data field bytes (default: read with getDataField())
+        :return: NumPy array shaped (lines, columns), uint8 or uint16, never a view of data
+        """
+
+        structure = lrit.imageStructureHeader
+        if data is None:
+            # Copied, so the file can be closed whether decoding succeeds or not
+            view = lrit.getDataField()
+            data = bytes(view)
+            view.release()
+        if COMS.metrics is not None:
+            start = perf_counter()
+
+        if structure.image_compression == 0:
+            pixelType = np.dtype(np.uint8) if structure.bits_per_pixel == 8 else np.dtype("<u2")
+            pixels = np.frombuffer(data, dtype=pixelType, count=structure.num_cols * structure.num_lines).reshape(structure.num_lines, structure.num_cols).copy()
+        elif structure.image_compression == 1:
+            pixels = cls.decodeLossless(data)
+        elif structure.image_compression == 2:
+            pixels = cls.decodeLossy(data)
+        else:
+            raise ValueError("Unknown compression type {0}".format(structure.image_compression))
+
+        if pixels.shape != (structure.num_lines, structure.num_cols):
+            raise ValueError("Decoded segment is {0}x{1}, Image Structure header says {2}x{3}".format(
+                pixels.shape[1], pixels.shape[0], structure.num_cols, structure.num_lines))
+        if COMS.metrics is not None:
+            COMS.metrics.addStage("decodeSegment", perf_counter() - start, len(data))
+        return pixels
+
+
+    # Lossless JPEG
+    @classmethod
+    def readMarkers(cls, data):
+        """
+        Reads marker segments of a lossless JPEG stream up to the start of scan
+        :param data: JPEG bytes
+        :return: Tuple of (frame, Huffman tables, restart interval, scan, entropy-coded data offset)
+        """
+
+        if data[0] != 0xFF or data[1] != cls.SOI:
+            raise ValueError("Data field is not a JPEG stream")
+
+        frame = None
+        tables = {}
+        restartInterval = 0
+        offset = 2
+        while True:
+            # Fill bytes may come before any marker
+            while data[offset] == 0xFF and data[offset + 1] == 0xFF:
+                offset += 1
+            fill, marker, length = cls.segmentLayout.unpack_from(data, offset)
+            if fill != 0xFF:
+                raise ValueError("Expected JPEG marker at offset {0}".format(offset))
+            body = bytes(data[offset + 4:offset + 2 + length])
+            offset += 2 + length
+
+            if marker in (0xC0, 0xC1, 0xC2, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                raise ValueError("Lossless segment uses JPEG process {0:02X}, only SOF3 is supported".format(marker))
+            elif marker == cls.SOF3:
+                precision, numLines, numCols, components = struct.unpack_from(">BHHB", body)
+                if components != 1:
+                    raise ValueError("Lossless segment has {0} components, expected 1".format(components))
+                frame = (precision, numLines, numCols)
+            elif marker == cls.DHT:
+                position = 0
+                while position < len(body):
+                    tableId = body[position] & 0x0F  # Lossless scans only use DC tables
+                    bits = list(body[position + 1:position + 17])
+                    values = list(body[position + 17:position + 17 + sum(bits)])
+                    tables[tableId] = (bits, values)
+                    position += 17 + sum(bits)
+            elif marker == cls.DRI:
+                restartInterval = struct.unpack_from(">H", body)[0]
+            elif marker == cls.SOS:
+                if frame is None:
+                    raise ValueError("Start of scan before SOF3 frame header")
+                tableId = body[2] >> 4
+                predictor, pointTransform = body[3], body[5] & 0x0F
+                if tableId not in tables:
+                    raise ValueError("Scan uses undefined Huffman table {0}".format(tableId))
+                return frame, tables[tableId], restartInterval, (predictor, pointTransform), offset
+            elif marker == cls.EOI:
+                raise ValueError("JPEG stream has no scan")
+            # Other segments (APPn, COM, ...) are skipped
+
+    @staticmethod
+    def getHuffmanCodes(bits, values):
+        """
+        Generates canonical Huffman codes (T.81 Annex C)
+        :param bits: Number of codes of each length, 1 to 16
+        :param values: Symbols in code order
+        :return: Dictionary of symbol -> (code, length)
+        """
+
+        codes = {}
+        code = 0
+        index = 0
+        for length in range(1, 17):
+            for i in range(bits[length - 1]):
+                codes[values[index]] = (code, length)
+                code += 1
+                index += 1
+            code <<= 1
+        return codes
+
+    @classmethod
+    def getLookupTable(cls, bits, values):
+        """
+        Builds lookup table indexed by the next 16 bits of the stream
+        :return: List of (code length << 8 | symbol), 0 where no code matches
+        """
+
+        table = [0] * 65536
+        for symbol, (code, length) in cls.getHuffmanCodes(bits, values).items():
+            first = code << (16 - length)
+            table[first:first + (1 << (16 - length))] = [length << 8 | symbol] * (1 << (16 - length))
+        return table
+
+    @staticmethod
+    def unstuff(data):
+        """
+        Removes stuffed zero bytes after 0xFF from entropy-coded data
+        :param data: NumPy uint8 array
+        :return: NumPy uint8 array
+        """
+        stuffed = np.flatnonzero((data[:-1] == 0xFF) & (data[1:] == 0x00)) + 1
+        return np.delete(data, stuffed) if len(stuffed) else data
+
+    @classmethod
+    def decodeDifferences(cls, data, table, count):
+        """
+        Huffman decodes prediction differences of one restart interval
+        :param data: Entropy-coded bytes, unstuffed, NumPy uint8 array
+        :param table: Lookup table from getLookupTable()
+        :param count: Number of samples
+        :return: NumPy int64 array of differences
+        """
+
+        # 16 bit window starting at every bit position, so each code or magnitude is one lookup
+        padded = np.concatenate((data, np.zeros(4, dtype=np.uint8))).astype(np.uint32)
+        words = padded[:-3] << 24 | padded[1:-2] << 16 | padded[2:-1] << 8 | padded[3:]
+        windows = ((words[:, None] >> (16 - np.arange(8, dtype=np.uint32))) & 0xFFFF).astype(np.uint16).ravel()
+        window = memoryview(windows)
+
+        differences = np.empty(count, dtype=np.int64)
+        output = memoryview(differences)
+        position = 0
+        try:
+            for i in range(count):
+                entry = table[window[position]]
+                if not entry:
+                    raise ValueError("Invalid Huffman code at bit {0}".format(position))
+                position += entry >> 8
+                size = entry & 0xFF
+                if size == 0:
+                    output[i] = 0
+                elif size == 16:
+                    output[i] = 32768
+                else:
+                    value = window[position] >> (16 - size)
+                    position += size
+                    output[i] = value if value >> (size - 1) else value - (1 << size) + 1
+        except IndexError:
+            position = len(windows)  # Ran off the end of the data
+
+        if position > len(data) * 8:
+            raise ValueError("Lossless segment is truncated")
+        return differences
+
+    @staticmethod
+    def reconstruct(differences, predictor, initial):
+        """
+        Reverses prediction over lines that start a restart interval (T.81 H.1.2.1)
+        :param differences: NumPy int64 array shaped (lines, columns)
+        :param predictor: Predictor selection value, 1 to 7
+        :param initial: Prediction of the first sample, 2^(P-Pt-1)
+        :return: NumPy int64 array of samples, modulo 2^16
+        """
+
+        # First line: first sample from the initial prediction, the rest from the left (Ra)
+        samples = np.empty_like(differences)
+        first = differences[0].copy()
+        first[0] += initial
+        samples[0] = np.cumsum(first) & 0xFFFF
+        if len(differences) == 1:
+            return samples
+
+        rest = differences[1:]
+        if predictor == 1:
+            # Ra, first column from above (Rb)
+            rest = rest.copy()
+            rest[:, 0] = samples[0, 0] + np.cumsum(rest[:, 0])
+            samples[1:] = np.cumsum(rest, axis=1) & 0xFFFF
+        elif predictor == 2:
+            # Rb
+            samples[1:] = (samples[0] + np.cumsum(rest, axis=0)) & 0xFFFF
+        elif predictor == 4:
+            # Ra + Rb - Rc, so each line is the line above plus the running sum of its differences
+            samples[1:] = (samples[0] + np.cumsum(np.cumsum(rest, axis=1), axis=0)) & 0xFFFF
+        else:
+            for line in range(1, len(differences)):
+                above = samples[line - 1]
+                row = samples[line]
+                row[0] = (above[0] + differences[line, 0]) & 0xFFFF
+                if predictor == 3:
+                    # Rc
+                    row[1:] = (above[:-1] + differences[line, 1:]) & 0xFFFF
+                elif predictor == 5:
+                    # Ra + ((Rb - Rc) >> 1), linear along the line once the line above is known
+                    steps = differences[line, 1:] + ((above[1:] - above[:-1]) >> 1)
+                    row[1:] = (row[0] + np.cumsum(steps)) & 0xFFFF
+                elif predictor in (6, 7):
+                    # Rb + ((Ra - Rc) >> 1) and (Ra + Rb) >> 1 depend on the previous sample, one at a time
+                    above = above.tolist()
+                    lineDifferences = differences[line].tolist()
+                    left = int(row[0])
+                    values = [left]
+                    for col in range(1, len(above)):
+                        if predictor == 6:
+                            prediction = above[col] + ((left - above[col - 1]) >> 1)
+                        else:
+                            prediction = (left + above[col]) >> 1
+                        left = (prediction + lineDifferences[col]) & 0xFFFF
+                        values.append(left)
+                    row[:] = values
+                else:
+                    raise ValueError("Unknown lossless predictor {0}".format(predictor))
+        return samples
+
+    @classmethod
+    def decodeLossless(cls, data):
+        """
+        Decodes a lossless JPEG (SOF3) stream with one component
+        :param data: JPEG bytes
+        :return: NumPy array shaped (lines, columns), uint8 for up to 8 bit precision, otherwise uint16
+        """
+
+        (precision, numLines, numCols), (bits, values), restartInterval, (predictor, pointTransform), offset = cls.readMarkers(data)
+        if not 1 <= predictor <= 7:
+            raise ValueError("Unknown lossless predictor {0}".format(predictor))
+
+        # Entropy-coded data runs to the first marker other than a restart (RSTn)
+        entropy = np.frombuffer(data, dtype=np.uint8, offset=offset)
+        markers = np.flatnonzero(entropy[:-1] == 0xFF)
+        markers = markers[entropy[markers + 1] != 0x00]
+        restarts = markers[(entropy[markers + 1] >= 0xD0) & (entropy[markers + 1] <= 0xD7)]
+        end = markers[(entropy[markers + 1] < 0xD0) | (entropy[markers + 1] > 0xD7)]
+        end = end[0] if len(end) else len(entropy)
+        restarts = restarts[restarts < end]
+
+        # Restart intervals of whole lines start their first line like the first line of the image
+        total = numLines * numCols
+        interval = restartInterval or total
+        if interval % numCols:
+            raise ValueError("Restart interval of {0} samples is not a whole number of lines".format(interval))
+        starts = np.concatenate(([0], restarts + 2))
+        stops = np.concatenate((restarts, [end]))
+        if len(starts) != -(-total // interval):
+            raise ValueError("Lossless segment has {0} restart intervals, expected {1}".format(len(starts), -(-total // interval)))
+
+        table = cls.getLookupTable(bits, values)
+        initial = 1 << (precision - pointTransform - 1)
+        samples = np.empty((numLines, numCols), dtype=np.int64)
+        linesPerInterval = interval // numCols
+        for index, (start, stop) in enumerate(zip(starts, stops)):
+            firstLine = index * linesPerInterval
+            lines = min(linesPerInterval, numLines - firstLine)
+            differences = cls.decodeDifferences(cls.unstuff(entropy[start:stop]), table, lines * numCols)
+            samples[firstLine:firstLine + lines] = cls.reconstruct(differences.reshape(lines, numCols), predictor, initial)
+
+        if pointTransform:
+            samples <<= pointTransform
+        return samples.astype(np.uint8 if precision <= 8 else np.uint16)
+
+    @staticmethod
+    def getHuffmanTable(frequencies):
+        """
+        Builds an optimal Huffman table with codes up to 16 bits and no all-ones code (T.81 Annex K.2)
+        :param frequencies: Occurrences of each symbol
+        :return: Tuple of (bits, values), see getHuffmanCodes()
+        """
+
+        # One extra symbol reserves the all-ones code, it is given the longest code and dropped
+        symbols = [symbol for symbol, frequency in enumerate(frequencies) if frequency] + [len(frequencies)]
+        weights = [frequency for frequency in frequencies if frequency] + [1]
+        lengths = dict.fromkeys(symbols, 0)
+        heap = [(weight, -symbol, [symbol]) for symbol, weight in zip(symbols, weights)]
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            weight1, key1, group1 = heapq.heappop(heap)
+            weight2, key2, group2 = heapq.heappop(heap)
+            for symbol in group1 + group2:
+                lengths[symbol] += 1
+            heapq.heappush(heap, (weight1 + weight2, min(key1, key2), group1 + group2))
+
+        bits = [0] * 33
+        for length in lengths.values():
+            bits[max(length, 1)] += 1
+
+        # Shorten codes longer than 16 bits (Figure K.3)
+        length = 32
+        while length > 16:
+            if bits[length] > 0:
+                shorter = length - 2
+                while bits[shorter] == 0:
+                    shorter -= 1
+                bits[length] -= 2
+                bits[length - 1] += 1
+                bits[shorter + 1] += 2
+                bits[shorter] -= 1
+            else:
+                length -= 1
+
+        # Drop the reserved code, the longest one
+        while bits[length] == 0:
+            length -= 1
+        bits[length] -= 1
+
+        ordered = sorted(symbols, key=lambda symbol: (lengths[symbol], symbol == len(frequencies), symbol))
+        return bits[1:17], [symbol for symbol in ordered if symbol != len(frequencies)]
+
+    @staticmethod
+    def getDifferences(samples, predictor, precision):
+        """
+        Gets prediction differences of lines that start a restart interval (T.81 H.1.2.1)
+        :param samples: NumPy int64 array shaped (lines, columns)
+        :param predictor: Predictor selection value, 1 to 7
+        :param precision: Sample precision in bits
+        :return: NumPy int64 array of differences modulo 2^16, in (-32768, 32768]
+        """
+
+        left = np.zeros_like(samples)
+        left[:, 1:] = samples[:, :-1]
+        above = np.zeros_like(samples)
+        above[1:] = samples[:-1]
+        corner = np.zeros_like(samples)
+        corner[1:, 1:] = samples[:-1, :-1]
+        predictions = {
+            1: lambda: left,
+            2: lambda: above,
+            3: lambda: corner,
+            4: lambda: left + above - corner,
+            5: lambda: left + ((above - corner) >> 1),
+            6: lambda: above + ((left - corner) >> 1),
+            7: lambda: (left + above) >> 1
+        }
+        if predictor not in predictions:
+            raise ValueError("Unknown lossless predictor {0}".format(predictor))
+
+        # First line from the left, first column from above, first sample from the initial prediction
+        prediction = predictions[predictor]()
+        prediction[0, 1:] = samples[0, :-1]
+        prediction[1:, 0] = samples[:-1, 0]
+        prediction[0, 0] = 1 << (precision - 1)
+
+        differences = (samples - prediction) & 0xFFFF
+        differences[differences > 32768] -= 65536
+        return differences
+
+    @staticmethod
+    def packBits(fields, lengths):
+        """
+        Packs variable length bit fields into entropy-coded bytes, padded with ones and with 0xFF stuffed
+        :param fields: NumPy int64 array of fields, up to 32 bits each
+        :param lengths: NumPy int64 array of field lengths in bits
+        :return: Bytes
+        """
+
+        # Each field is OR'd into the bytes it spans (at most 5), fields never overlap so OR is addition
+        starts = np.cumsum(lengths) - lengths
+        totalBits = int(starts[-1] + lengths[-1]) if len(lengths) else 0
+        aligned = fields << (40 - (starts & 7) - lengths)
+        byteIndex = starts >> 3
+        size = (totalBits + 7) // 8
+        packed = np.zeros(size + 5, dtype=np.float64)
+        for k in range(5):
+            packed += np.bincount(byteIndex + k, weights=(aligned >> (8 * (4 - k))) & 0xFF, minlength=size + 5)[:size + 5]
+        packed = packed[:size].astype(np.uint8)
+        if totalBits % 8:
+            packed[-1] |= (1 << (8 - totalBits % 8)) - 1
+        return np.insert(packed, np.flatnonzero(packed == 0xFF) + 1, 0).tobytes()
+
+    @classmethod
+    def encodeLossless(cls, image, precision=None, predictor=1, restartLines=0):
+        """
+        Encodes an image as lossless JPEG (SOF3) with one optimal Huffman table, e.g. for test fixtures
+        :param image: 2D NumPy array of unsigned samples
+        :param precision: Sample precision in bits (default: 8 for uint8, otherwise 16)
+        :param predictor: Predictor selection value, 1 to 7
+        :param restartLines: Lines per restart interval, 0 for none
+        :return: JPEG bytes
+        """
+
+        numLines, numCols = image.shape
+        precision = precision or (8 if image.dtype.itemsize == 1 else 16)
+        samples = image.astype(np.int64)
+        blockLines = restartLines or numLines
+        blocks = [cls.getDifferences(samples[line:line + blockLines], predictor, precision) for line in range(0, numLines, blockLines)]
+
+        # Category SSSS of each difference, 16 is 32768 with no magnitude bits
+        sizes = [np.frexp(np.abs(differences).astype(np.float64))[1].astype(np.int64) for differences in blocks]
+        bits, values = cls.getHuffmanTable(sum(np.bincount(size.ravel(), minlength=17) for size in sizes).tolist())
+        codeTable = np.zeros(17, dtype=np.int64)
+        lengthTable = np.zeros(17, dtype=np.int64)
+        for symbol, (code, length) in cls.getHuffmanCodes(bits, values).items():
+            codeTable[symbol] = code
+            lengthTable[symbol] = length
+
+        entropy = []
+        for index, (differences, size) in enumerate(zip(blocks, sizes)):
+            differences = differences.ravel()
+            size = size.ravel()
+            extraSizes = np.where(size == 16, 0, size)
+            extra = np.where(differences < 0, differences + (1 << extraSizes) - 1, differences) & ((1 << extraSizes) - 1)
+            if index:
+                entropy.append(bytes([0xFF, 0xD0 + (index - 1) % 8]))
+            entropy.append(cls.packBits((codeTable[size] << extraSizes) | extra, lengthTable[size] + extraSizes))
+
+        def segment(marker, body):
+            return cls.segmentLayout.pack(0xFF, marker, len(body) + 2) + body
+
+        return b"".join([
+            bytes([0xFF, cls.SOI]),
+            segment(cls.SOF3, struct.pack(">BHHBBBB", precision, numLines, numCols, 1, 1, 0x11, 0)),
+            segment(cls.DRI, struct.pack(">H", blockLines * numCols)) if restartLines else b"",
+            segment(cls.DHT, bytes([0x00] + bits + values)),
+            segment(cls.SOS, bytes([1, 1, 0x00, predictor, 0, 0]))
+        ] + entropy + [bytes([0xFF, cls.EOI])])
+
+
+    # Lossy JPEG
+    @staticmethod
+    def decodeLossy(data):
+        """
+        Decodes a baseline JPEG stream with Pillow
+        :param data: JPEG bytes
+        :return: NumPy uint8 array shaped (lines, columns)
+        """
+
+        if Image is None:
+            raise ImportError("Lossy segments need Pillow (pip install pillow)")
+        with Image.open(io.BytesIO(data)) as image:
+            return np.asarray(image.convert("L") if image.mode != "L" else image)
+
+    @staticmethod
+    def encodeLossy(image, quality=90):
+        """
+        Encodes an 8 bit image as baseline JPEG with Pillow, e.g. for test fixtures
+        :param image: 2D NumPy uint8 array
+        :param quality: JPEG quality, 1 to 95
+        :return: JPEG bytes
+        """
+
+        if Image is None:
+            raise ImportError("Lossy segments need Pillow (pip install pillow)")
+        if image.dtype != np.uint8:
+            raise ValueError("Lossy compression is only supported for 8 bit images")
+        output = io.BytesIO()
+        Image.fromarray(image, "L").save(output, "JPEG", quality=quality)
+        return output.getvalue()
+
+
+class SegmentDecoder:
+    """
+    Decodes segments on a process pool, so the segments of one frame are decoded concurrently.
+    """
+
+    def __init__(self, workers=None):
+        """
+        :param workers: Number of worker processes (default: number of CPUs), 0 to decode in this process
+        """
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers != 0 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down worker processes
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def decodeFiles(self, paths):
+        """
+        Decodes segment files
+        :param paths: Segment file paths
+        :return: Generator of (path, pixels), in the order of paths
+        """
+
+        mapper = self.executor.map if self.executor is not None else map
+        return mapper(decodeSegment, paths)
@@ -0,0 +1,172 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import numpy as np
+from assembler import SegmentAssembler, getPassName, writePng
+from calibration import Calibration
+from coms import COMS
+
+
+def calibrateChannel(paths, outputPath):
+    """
+    Assembles segments of one channel and converts them to physical units. Runs in a worker process,
+    the result is written to a memory-mapped .npy file so the image does not cross the process boundary.
+    :param paths: Segment file paths
+    :param outputPath: Output .npy path
+    :return: Output path
+    """
+
+    counts = SegmentAssembler.fromFiles(paths, workers=0).getImage()
+    calibration = Calibration.fromHeader(COMS.parse(paths[0]))
+    values = np.lib.format.open_memmap(outputPath, mode="w+", dtype=np.float32, shape=counts.shape)
+    calibration.calibrate(counts, out=values)
+    values.flush()
+    return outputPath
+
+
+class CompositeEngine:
+    """
+    composite.py
+    https://github.com/sam210723/coms-1
+
+    Combines channels of the same image type and time slot into false colour RGB and band math products.
+    Channels are decoded and calibrated in parallel worker processes, products are computed with NumPy.
+    """
+
+    # Product name -> bands (one for greyscale, three for RGB). Each band is a linear combination of
+    # calibrated channels, {channel: weight}, scaled from low (0) to high (255). Low above high inverts the band.
+    products = {}
+    products['FALSE_COLOUR'] = (({"VIS": 1.0}, 0.0, 100.0), ({"VIS": 1.0}, 0.0, 100.0), ({"IR1": 1.0}, 320.0, 200.0))
+    products['VIS_IR_WV'] = (({"VIS": 1.0}, 0.0, 100.0), ({"IR1": 1.0}, 320.0, 200.0), ({"WV": 1.0}, 260.0, 200.0))
+    products['IR1_WV'] = (({"IR1": 1.0, "WV": -1.0}, -5.0, 40.0),)  # Near zero over deep convection
+    products['SPLIT_WINDOW'] = (({"IR1": 1.0, "IR2": -1.0}, -2.0, 6.0),)  # Thin cirrus and dust
+    products['FOG'] = (({"IR1": 1.0, "SWIR": -1.0}, -2.0, 8.0),)  # Night-time fog and low cloud
+
+    def __init__(self, workers=None):
+        """
+        :param workers: Number of worker processes (default: number of CPUs)
+        """
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down worker processes
+        """
+        self.executor.shutdown()
+
+    @staticmethod
+    def groupFiles(paths):
+        """
+        Groups image segments by image type and timestamp, then by channel, using headers only
+        :param paths: LRIT/HRIT file paths
+        :return: Dictionary of group name (e.g. "IMG_ENH_01_20120101_000920") -> {channel: [segment paths]}
+        """
+
+        names = {}
+        groups = {}
+        for result in COMS.parseMany(paths):
+            if not result.primaryHeader.valid or result.primaryHeader.file_type != 0 or not result.imageDataFunctionHeader.valid:
+                continue
+
+            channel = result.imageDataFunctionHeader.getChannel()
+            name = getPassName(result).replace("_{0}_".format(channel), "_", 1)
+            timestamp = result.timestampHeader.toDatetime() if result.timestampHeader.valid else name
+            key = (result.imageStructureHeader.image_type, timestamp)
+
+            name = names.setdefault(key, name)
+            groups.setdefault(name, {}).setdefault(channel, []).append(result.path)
+        return groups
+
+    @classmethod
+    def getProducts(cls, channels):
+        """
+        Gets products that can be made from a set of channels
+        :param channels: Channel names
+        :return: List of product names
+        """
+        return [name for name, bands in cls.products.items() if all(set(terms) <= set(channels) for terms, low, high in bands)]
+
+    def calibrateChannels(self, channelPaths, directory):
+        """
+        Calibrates channels in parallel
+        :param channelPaths: Dictionary of channel -> segment paths
+        :param directory: Directory for calibrated .npy files
+        :return: Dictionary of channel -> float32 array (memory-mapped), trimmed to the same number of lines
+        """
+
+        channels = list(channelPaths)
+        outputPaths = [os.path.join(directory, "{0}.npy".format(channel)) for channel in channels]
+        list(self.executor.map(calibrateChannel, [channelPaths[c] for c in channels], outputPaths))
+
+        images = {channel: np.load(path, mmap_mode="r") for channel, path in zip(channels, outputPaths)}
+        numLines = min(image.shape[0] for image in images.values())
+        return {channel: image[:numLines] for channel, image in images.items()}
+
+    @classmethod
+    def makeProduct(cls, name, channels):
+        """
+        Computes a product from calibrated channels
+        :param name: Product name, see products
+        :param channels: Dictionary of channel -> calibrated float32 array
+        :return: uint8 array, shaped (lines, columns) or (lines, columns, 3) for RGB
+        """
+
+        bands = []
+        for terms, low, high in cls.products[name]:
+            value = None
+            for channel, weight in terms.items():
+                term = np.multiply(channels[channel], np.float32(weight))
+                value = term if value is None else np.add(value, term, out=value)
+
+            # Scale to 0-255, undefined counts (NaN) are black
+            value -= np.float32(low)
+            value *= np.float32(255.0 / (high - low))
+            np.nan_to_num(value, copy=False)
+            np.clip(value, 0, 255, out=value)
+            bands.append(value.astype(np.uint8))
+
+        return bands[0] if len(bands) == 1 else np.dstack(bands)
+
+    def compose(self, name, channelPaths, outputDir, products=None):
+        """
+        Calibrates channels of one group and writes its products as PNG
+        :param name: Group name, used as output file name prefix
+        :param channelPaths: Dictionary of channel -> segment paths, see groupFiles()
+        :param outputDir: Output directory
+        :param products: Product names (default: all that can be made from the channels)
+        :return: List of output paths
+        """
+
+        available = self.getProducts(channelPaths)
+        products = [p for p in products if p in available] if products is not None else available
+        if not products:
+            return []
+
+        # Only channels used by the requested products are decoded
+        used = {channel for product in products for terms, low, high in self.products[product] for channel in terms}
+
+        outputPaths = []
+        with tempfile.TemporaryDirectory() as directory:
+            channels = self.calibrateChannels({c: p for c, p in channelPaths.items() if c in used}, directory)
+
+            for product in products:
+                if COMS.metrics is not None:
+                    start = perf_counter()
+
+                image = self.makeProduct(product, channels)
+                outputPath = os.path.join(outputDir, "{0}_{1}.png".format(name, product))
+                writePng(outputPath, image)
+                outputPaths.append(outputPath)
+
+                if COMS.metrics is not None:
+                    COMS.metrics.addStage("composite", perf_counter() - start, image.nbytes)
+
+            del channels  # Release maps before the directory is removed
+        return outputPaths
@@ -1,4 +1,330 @@
+import glob
+import mmap
+import os
+import struct
 from datetime import datetime, timedelta
+from time import perf_counter
+
+
+class HeaderRecord:
+    """
+    Compact, immutable record of a single LRIT header.
+    Fields can be read as attributes or by key, e.g. record['header_len'].
+    Fields are decoded from the raw header bytes when first read, so tools reading one field skip decoding the rest.
+    """
+
+    __slots__ = ('valid', 'header_type', 'header_len', 'header_offset', '_raw')
+
+    # Fields decoded on first read: field name -> method decoding it (and the fields decoded with it) from the raw bytes
+    lazyFields = {}
+
+    def __init__(self, valid, header_type, header_len=0, header_offset=0, raw=None, **fields):
+        """
+        :param raw: Header bytes following the 3 byte type/length record, decoded by lazyFields methods
+        :param fields: Fields set directly instead of decoding them
+        """
+        setField = object.__setattr__
+        setField(self, 'valid', valid)
+        setField(self, 'header_type', header_type)
+        setField(self, 'header_len', header_len)
+        setField(self, 'header_offset', header_offset)
+        setField(self, '_raw', raw)
+        for key, value in fields.items():
+            setField(self, key, value)
+
+    def __getattr__(self, key):
+        # Only called for fields not set yet
+        decoder = self.lazyFields.get(key)
+        if decoder is None or self._raw is None:
+            raise AttributeError(key)
+
+        # Decoding happens here rather than in the header walk, so it is timed here while instrumentation is enabled
+        metrics = COMS.metrics
+        if metrics is None:
+            fields = getattr(self, decoder)()
+        else:
+            start = perf_counter()
+            fields = getattr(self, decoder)()
+            metrics.addStage(COMS.decodeStages[self.header_type], perf_counter() - start)
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+        return fields[key]
+
+    def __setattr__(self, key, value):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+    def __delattr__(self, key):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+    def __getstate__(self):
+        # Fields not read yet stay undecoded
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                try:
+                    state[name] = object.__getattribute__(self, name)
+                except AttributeError:
+                    pass
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, self.toDict())
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def fields(self):
+        """
+        Gets names of all fields in record, base fields first
+        :return: List of field names
+        """
+        names = []
+        for cls in reversed(type(self).__mro__):
+            names.extend(name for name in cls.__dict__.get('__slots__', ()) if not name.startswith('_'))
+        return names
+
+    def toDict(self):
+        """
+        Converts record to a dict of its set fields
+        :return: Field dict
+        """
+        return {name: getattr(self, name) for name in self.fields() if hasattr(self, name)}
+
+
+class PrimaryHeader(HeaderRecord):
+    __slots__ = ('file_type', 'total_header_len', 'data_field_len')
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        fileType, totalHeaderLen, dataFieldLen = COMS.primaryLayout.unpack_from(self._raw)
+        return {'file_type': fileType, 'total_header_len': totalHeaderLen, 'data_field_len': dataFieldLen}
+
+
+class ImageStructureHeader(HeaderRecord):
+    __slots__ = ('bits_per_pixel', 'num_cols', 'num_lines', 'image_type', 'image_compression')
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        bitsPerPixel, numCols, numLines, compression = COMS.imageStructureLayout.unpack_from(self._raw)
+
+        # Image type based on column and line count
+        imageType = None
+        if numCols == 2200 and numLines == 2200:
+            imageType = 0  # FD
+        elif numCols == 2750:
+            imageType = 0  # FD (HRIT)
+        elif numCols == 1547 and (numLines == 308 or numLines == 309):
+            imageType = 1  # ENH
+        elif numCols == 1547 and numLines == 318:
+            imageType = 2  # LSH
+        elif numCols == 810 and numLines == 611:
+            imageType = 3  # APNH
+
+        return {'bits_per_pixel': bitsPerPixel, 'num_cols': numCols, 'num_lines': numLines,
+                'image_type': imageType, 'image_compression': compression}
+
+
+class ImageNavigationHeader(HeaderRecord):
+    __slots__ = ('projection', 'longitude', 'col_scaling', 'line_scaling', 'col_offset', 'line_offset')
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        projectionBytes, colScaling, lineScaling, colOffset, lineOffset = COMS.imageNavigationLayout.unpack_from(self._raw)
+
+        # Projection and longitude
+        projectionString = projectionBytes.decode('ascii', 'replace')
+        projection = None
+        if "GEOS" in projectionString:
+            projection = "Normalized Geostationary Projection (GEOS)"
+        longitude = projectionString[projectionString.find("(") + 1:projectionString.find(")")]
+
+        return {'projection': projection, 'longitude': longitude,
+                'col_scaling': colScaling, 'line_scaling': lineScaling,
+                'col_offset': colOffset, 'line_offset': lineOffset}
+
+
+class ImageDataFunctionHeader(HeaderRecord):
+    __slots__ = ('data_definition_block',)
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        # Kept in memory only, see exportDataDefinitionBlock()
+        return {'data_definition_block': str(self._raw, 'utf-8', 'replace')}
+
+    def getChannel(self):
+        """
+        Gets channel name from Data Definition Block (e.g. "IR1")
+        :return: Channel name, or None if not defined
+        """
+        for line in self.data_definition_block.splitlines():
+            if line.startswith("CHANNEL:="):
+                return line[9:].strip()
+        return None
+
+
+class AnnotationTextHeader(HeaderRecord):
+    __slots__ = ('text_data',)
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        return {'text_data': str(self._raw, 'utf-8', 'replace')}
+
+
+class TimestampHeader(HeaderRecord):
+    __slots__ = ('p_field', 'p_field_ext_flag', 'p_field_time_code', 'p_field_detail_bits',
+                 't_field', 't_field_day_count', 't_field_current_date', 't_field_millis', 't_field_current_time')
+    lazyFields = dict.fromkeys(__slots__[:4], 'decodePField')
+    lazyFields.update(dict.fromkeys(__slots__[4:], 'decodeTField'))
+
+    def decodePField(self):
+        pField = self._raw[0]
+
+        # Bit 0 - Extension flag, Bits 1-3 - Time code ID, Bits 4-7 - Detail bits
+        if pField >> 7:
+            extFlag = "1 (Extended field)"
+        else:
+            extFlag = "0 (No extension)"
+
+        return {'p_field': "{0:08b}".format(pField),
+                'p_field_ext_flag': extFlag,
+                'p_field_time_code': COMS.timeCodes.get((pField >> 4) & 0x07),
+                'p_field_detail_bits': "{0:04b}".format(pField & 0x0F)}
+
+    def decodeTField(self):
+        # Bits 0-16 - Days since epoch, Bits 16-48 - Milliseconds of day
+        pField, dayCount, millis = COMS.timestampLayout.unpack_from(self._raw)
+        year, month, day = COMS.cdsToDate(dayCount)
+        seconds = millis // 1000 % 86400
+
+        return {'t_field': "{0:048b}".format((dayCount << 32) | millis),
+                't_field_day_count': dayCount,
+                't_field_current_date': "{0:02d}/{1:02d}/{2:04d}".format(day, month, year),
+                't_field_millis': millis,
+                't_field_current_time': "{0:02d}:{1:02d}:{2:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)}
+
+    def toDatetime(self):
+        """
+        Converts CDS T field to a datetime
+        :return: Datetime (UTC)
+        """
+        return COMS.cdsEpoch + timedelta(days=self.t_field_day_count, milliseconds=self.t_field_millis)
+
+
+class AncillaryTextHeader(HeaderRecord):
+    __slots__ = ('text_data',)
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        return {'text_data': str(self._raw, 'utf-8', 'replace')}
+
+
+class KeyHeader(HeaderRecord):
+    __slots__ = ('key',)
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        return {'key': COMS.keyLayout.unpack_from(self._raw)[0]}
+
+
+class ImageSegmentationInformationHeader(HeaderRecord):
+    __slots__ = ('segment_num', 'segment_total', 'line_num_of_segment')
+    lazyFields = dict.fromkeys(__slots__, 'decodeFields')
+
+    def decodeFields(self):
+        segmentNum, segmentTotal, lineNum = COMS.imageSegmentationLayout.unpack_from(self._raw)
+        return {'segment_num': segmentNum, 'segment_total': segmentTotal, 'line_num_of_segment': lineNum}
+
+
+class ParseResult:
+    """
+    Immutable result of parsing all headers of one LRIT file.
+    Headers are attributes named as on COMS (e.g. result.primaryHeader), headers not present are invalid records.
+    """
+
+    __slots__ = ('path', 'headers', 'primaryHeader', 'imageStructureHeader', 'imageNavigationHeader',
+                 'imageDataFunctionHeader', 'annotationTextHeader', 'timestampHeader', 'ancillaryTextHeader',
+                 'keyHeader', 'imageSegmentationInformationHeader')
+
+    def __init__(self, path, headers):
+        """
+        :param path: LRIT file path
+        :param headers: Header records in file order
+        """
+        setField = object.__setattr__
+        setField(self, 'path', path)
+        setField(self, 'headers', tuple(headers))
+
+        for headerType, (attribute, decoder, printer) in COMS.headerRegistry.items():
+            setField(self, attribute, HeaderRecord(False, headerType))
+        for record in self.headers:
+            setField(self, COMS.headerRegistry[record.header_type][0], record)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ParseResult is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError("ParseResult is immutable")
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
+
+    def __repr__(self):
+        return "ParseResult({0!r}, {1} headers)".format(self.path, len(self.headers))
+
+    def toDict(self):
+        """
+        Converts result to a dict of valid headers keyed by attribute name
+        :return: Header dict
+        """
+        result = {'path': self.path}
+        for record in self.headers:
+            if record.valid:
+                result[COMS.headerRegistry[record.header_type][0]] = record.toDict()
+        return result
+
+    def getField(self, name, default=None):
+        """
+        Gets a field from whichever valid header has it, decoding only that field
+        :param name: Field name, e.g. "segment_num"
+        :param default: Value if no valid header has the field
+        :return: Field value
+        """
+        for record in self.headers:
+            if record.valid and name in record.fields():
+                return getattr(record, name, default)
+        return default
+
+    def toRecord(self):
+        """
+        Flattens fields of all valid headers into a single dict, for tabular output.
+        Common fields (valid, header_type, header_len, header_offset) are left out.
+        :return: Field dict
+        """
+        result = {'path': self.path}
+        for record in self.headers:
+            if record.valid:
+                for name in record.fields()[4:]:
+                    if hasattr(record, name):
+                        result[name] = getattr(record, name)
+        return result
+
 
 class COMS:
     """
@@ -46,6 +372,55 @@ class COMS:
     compressionTypes[1] = "Lossless"
     compressionTypes[2] = "Lossy"
 
+    # Additional Data (ADD) payload file extensions by file type
+    dataExtensions = {}
+    dataExtensions[2] = "txt"  # Alphanumeric Text (ANT)
+    dataExtensions[128] = "png"  # CMDPS Data (CT, CTT, CTH)
+    dataExtensions[130] = "jpg"  # GOCI (seems to have 2 file type codes)
+    dataExtensions[132] = "jpg"
+
+    # LRIT/HRIT file extensions picked up when searching directories
+    fileExtensions = (".lrit", ".hrit")
+
+    # Optional Metrics instance (see metrics.py) filled in while parsing, None disables instrumentation
+    metrics = None
+
+    # Buffer size for copying data fields when the kernel cannot copy between the files directly
+    copyChunkSize = 1024 * 1024
+
+    # CCSDS Day Segmented time code epoch
+    cdsEpoch = datetime(1958, 1, 1)
+
+    # CDS P field time code IDs
+    timeCodes = {}
+    timeCodes[4] = "100 (1958 January 1 epoch - Level 1 Time Code)"
+    timeCodes[2] = "010 (Agency-defined epoch - Level 2 Time Code)"
+
+    # Header registry: header type -> (attribute, decode method, print method)
+    headerRegistry = {}
+    headerRegistry[0] = ("primaryHeader", "decodePrimaryHeader", "printPrimaryHeader")
+    headerRegistry[1] = ("imageStructureHeader", "decodeImageStructureHeader", "printImageStructureHeader")
+    headerRegistry[2] = ("imageNavigationHeader", "decodeImageNavigationHeader", "printImageNavigationHeader")
+    headerRegistry[3] = ("imageDataFunctionHeader", "decodeImageDataFunctionHeader", "printImageDataFunctionHeader")
+    headerRegistry[4] = ("annotationTextHeader", "decodeAnnotationTextHeader", "printAnnotationTextHeader")
+    headerRegistry[5] = ("timestampHeader", "decodeTimestampHeader", "printTimestampHeader")
+    headerRegistry[6] = ("ancillaryTextHeader", "decodeAncillaryTextHeader", None)
+    headerRegistry[7] = ("keyHeader", "decodeKeyHeader", "printKeyHeader")
+    headerRegistry[128] = ("imageSegmentationInformationHeader", "decodeImageSegmentationInformationHeader", "printImageSegmentationInformationHeader")
+
+    # Stage names used for instrumentation, by header type: walking a header into a record, and decoding its fields on first read
+    headerStages = {headerType: "parse" + attribute[0].upper() + attribute[1:] for headerType, (attribute, decoder, printer) in headerRegistry.items()}
+    decodeStages = {headerType: "decode" + attribute[0].upper() + attribute[1:] for headerType, (attribute, decoder, printer) in headerRegistry.items()}
+
+    # Precompiled header layouts (big-endian), following the 3 byte type/length record
+    recordLayout = struct.Struct(">BH")  # Header type, header length
+    primaryLayout = struct.Struct(">BIQ")  # File type, total header length, data field length
+    imageStructureLayout = struct.Struct(">BHHB")  # Bits per pixel, columns, lines, compression
+    imageNavigationLayout = struct.Struct(">32sIIII")  # Projection, CFAC, LFAC, COFF, LOFF
+    timestampLayout = struct.Struct(">BHI")  # CDS P field, T field days, T field milliseconds
+    keyLayout = struct.Struct(">I")  # Encryption key
+    imageSegmentationLayout = struct.Struct(">BBH")  # Segment number, segment total, line number
+
     # Console colour characters
     colours = {}
     colours['HEADER'] = '\033[95m'
@@ -57,26 +432,168 @@ class COMS:
     colours['BOLD'] = '\033[1m'
     colours['UNDERLINE'] = '\033[4m'
 
-    primaryHeader = {}
-    imageStructureHeader = {}
-    imageNavigationHeader = {}
-    imageDataFunctionHeader = {}
-    annotationTextHeader = {}
-    timestampHeader = {}
-    ancillaryTextHeader = {}
-    keyHeader = {}
-    imageSegmentationInformationHeader = {}
 
-    # Byte counter for tracking progress through file
-    byteOffset = 0
+    def __init__(self, path, useMmap=False, data=None):
+        """
+        Loads LRIT file into memory, or maps it when useMmap is set
+        :param path: LRIT file path (or just a name when data is given)
+        :param useMmap: Memory-map the file instead of reading it
+        :param data: Bytes-like file contents to parse instead of opening path, used without copying
+        """
+        self.path = path  # LRIT file path
+        self.lritFile = None
+        self.lritMap = None
+
+        # Parser state, per instance so files can be parsed concurrently
+        for headerType, (attribute, decoder, printer) in self.headerRegistry.items():
+            setattr(self, attribute, HeaderRecord(False, headerType))
+
+        # Byte counter for tracking progress through file
+        self.byteOffset = 0
+
+        # Load LRIT file (empty files cannot be mapped)
+        if data is not None:
+            self.lritString = memoryview(data)
+            return
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = perf_counter()
+
+        self.lritFile = open(self.path, mode="rb")
+        if useMmap and os.fstat(self.lritFile.fileno()).st_size > 0:
+            # Only pages that are actually read get faulted in
+            self.lritMap = mmap.mmap(self.lritFile.fileno(), 0, access=mmap.ACCESS_READ)
+            self.lritString = memoryview(self.lritMap)
+        else:
+            self.lritString = memoryview(self.lritFile.read())
+            self.lritFile.close()
 
+        if metrics is not None:
+            metrics.addStage("map" if self.lritMap is not None else "load", perf_counter() - start, len(self.lritString))
 
-    def __init__(self, path):
-        self.path = path  # LRIT file path
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Releases the file handle and memory map.
+        Views returned by readbytes() and getDataField() are invalid after closing.
+        """
+        self.lritString.release()
+        if self.lritMap is not None:
+            try:
+                self.lritMap.close()
+            except BufferError:
+                pass  # Caller still holds a view, map is freed with the last one
+            self.lritMap = None
+        if self.lritFile is not None:
+            self.lritFile.close()
+
+    @classmethod
+    def findFiles(cls, paths):
+        """
+        Expands files, directories and glob patterns into a list of LRIT/HRIT files
+        :param paths: Input paths
+        :return: List of file paths
+        """
+
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(cls.fileExtensions))
+            elif glob.has_magic(path):
+                files.extend(sorted(glob.glob(path, recursive=True)))
+            else:
+                files.append(path)
+        return files
+
+    @classmethod
+    def parse(cls, path, useMmap=True):
+        """
+        Parses all headers of an LRIT file and releases it
+        :param path: LRIT file path
+        :param useMmap: Memory-map the file instead of reading it
+        :return: ParseResult
+        """
+        with cls(path, useMmap) as lrit:
+            return ParseResult(path, lrit.walkHeaders())
+
+    @classmethod
+    def parseMany(cls, paths, workers=4):
+        """
+        Parses headers of many LRIT files concurrently on a thread pool
+        :param paths: LRIT file paths
+        :param workers: Number of worker threads
+        :return: List of ParseResult in the same order as paths
+        """
+        from concurrent.futures import ThreadPoolExecutor  # Not needed by single-file tools, which start faster without it
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(cls.parse, paths))
+
+
+    @classmethod
+    def exportDataDefinitionBlock(cls, lrit, directory=None):
+        """
+        Writes Data Definition Block of a parsed file to a text file. Parsing never writes it.
+        :param lrit: COMS instance or ParseResult
+        :param directory: Write one file per unique DDB into this directory, named by channel and content hash.
+                          Existing files are not rewritten. Defaults to "<file name>_IDF-DDB.txt" next to the file.
+        :return: Path of DDB file, or None if file has no Image Data Function header
+        """
+
+        header = lrit.imageDataFunctionHeader
+        if not header.valid:
+            return None
+
+        if directory is None:
+            ddbPath = os.path.splitext(lrit.path)[0] + "_IDF-DDB.txt"
+        else:
+            import hashlib
+
+            digest = hashlib.sha1(header.data_definition_block.encode()).hexdigest()[:16]
+            ddbPath = os.path.join(directory, "{0}_{1}_IDF-DDB.txt".format(header.getChannel(), digest))
+            if os.path.exists(ddbPath):
+                return ddbPath
+
+        if cls.metrics is not None:
+            start = perf_counter()
 
-        # Load LRIT file
-        lritFile = open(self.path, mode="rb")
-        self.lritString = lritFile.read()
+        # Write then rename, so concurrent exports of the same block never see a partial file
+        tempPath = "{0}.{1}.tmp".format(ddbPath, os.getpid())
+        with open(tempPath, 'w') as ddbFile:
+            ddbFile.write(header.data_definition_block)
+        os.replace(tempPath, ddbPath)
+
+        if cls.metrics is not None:
+            cls.metrics.addStage("exportDataDefinitionBlock", perf_counter() - start, len(header.data_definition_block))
+        return ddbPath
+
+    @classmethod
+    def exportDataDefinitionBlocks(cls, results, directory):
+        """
+        Writes Data Definition Blocks of many parsed files, one file per unique block
+        :param results: ParseResults
+        :param directory: Output directory
+        :return: Dict of LRIT file path -> DDB file path
+        """
+
+        ddbPaths = {}
+        written = {}
+        for result in results:
+            header = result.imageDataFunctionHeader
+            if header.valid:
+                block = header.data_definition_block
+                if block not in written:
+                    written[block] = cls.exportDataDefinitionBlock(result, directory)
+                ddbPaths[result.path] = written[block]
+        return ddbPaths
 
 
     # Tool methods
@@ -85,10 +602,19 @@ class COMS:
         Reads n bytes at x offset
         :param offset: Start position offset 
         :param length: Number of bytes to return
-        :return: Bytes  
+        :return: Zero-copy memoryview of bytes
         """
         return self.lritString[self.byteOffset+offset:self.byteOffset+offset+length]
 
+    def getDataField(self):
+        """
+        Gets data field following the LRIT headers. Primary header must be parsed first.
+        :return: Zero-copy memoryview of data field
+        """
+        start = self.primaryHeader['total_header_len']
+        length = (self.primaryHeader['data_field_len'] + 7) // 8  # Length is in bits
+        return self.lritString[start:start+length]
+
     def intToHexStr(self, int, fill=0):
         """
         Converts integer into hex string representation
@@ -106,243 +632,301 @@ class COMS:
         print(self.colours[colour], end='')
 
 
-    # Header parsing methods
-    def parsePrimaryHeader(self, printInfo=False):
+    def extractDataField(self, directory=None):
         """
-        Parses LRIT Primary header (type 0, required)
-        :param printInfo: Print info after parsing
+        Writes data field to "<file name>_DATA.<extension>". Primary header must be parsed first.
+        Data is copied from file to file in the kernel where possible, without passing through Python.
+        :param directory: Output directory, defaults to directory of the LRIT file
+        :return: Output file path
         """
 
-        if self.readbytes(0, 3) == b'\x00\x00\x10':
-            self.primaryHeader['valid'] = True
-            self.primaryHeader['header_type'] = 0
-            self.primaryHeader['header_len'] = 16
-            self.primaryHeader['header_offset'] = self.byteOffset
-            self.primaryHeader['file_type'] = int.from_bytes(self.readbytes(3), byteorder='big')
-            self.primaryHeader['total_header_len'] = int.from_bytes(self.readbytes(4, 4), byteorder='big')
-            self.primaryHeader['data_field_len'] = int.from_bytes(self.readbytes(8, 8), byteorder='big')
+        extension = self.dataExtensions.get(self.primaryHeader['file_type'], "bin")
+        outputPath = os.path.splitext(self.path)[0] + "_DATA.{0}".format(extension)
+        if directory is not None:
+            outputPath = os.path.join(directory, os.path.basename(outputPath))
 
-            self.byteOffset += self.primaryHeader['header_len']
-            if printInfo:
-                self.printPrimaryHeader()
-        else:
-            self.primaryHeader['valid'] = False
+        if self.metrics is not None:
+            startTime = perf_counter()
 
-    def parseImageStructureHeader(self, printInfo=False):
-        """
-        Parses LRIT Image Structure header (type 1)
-        :param printInfo: Print info after parsing
-        """
+        with open(outputPath, 'wb', buffering=0) as dumpFile:
+            start = self.primaryHeader['total_header_len']
+            length = min((self.primaryHeader['data_field_len'] + 7) // 8, len(self.lritString) - start)  # Length is in bits
+            if self.lritFile is not None and not self.lritFile.closed:
+                self.copyRange(self.lritFile, dumpFile, start, length)
+            else:
+                dumpFile.write(self.getDataField())  # File is already in memory
 
-        if self.readbytes(0, 3) == b'\x01\x00\x09':
-            self.imageStructureHeader['valid'] = True
-            self.imageStructureHeader['header_type'] = 1
-            self.imageStructureHeader['header_len'] = 9
-            self.imageStructureHeader['header_offset'] = self.byteOffset
+        if self.metrics is not None:
+            self.metrics.addStage("extract", perf_counter() - startTime, length)
+        return outputPath
 
-            self.imageStructureHeader['bits_per_pixel'] = self.readbytes(3)  # Always 8bpp
-            self.imageStructureHeader['num_cols'] = int.from_bytes(self.readbytes(4, 2), byteorder='big')
-            self.imageStructureHeader['num_lines'] = int.from_bytes(self.readbytes(6, 2), byteorder='big')
+    @classmethod
+    def copyRange(cls, source, destination, offset, length):
+        """
+        Copies a byte range of one file to the current position of another.
+        Uses copy_file_range or sendfile, falling back to reading chunks into one reused buffer.
+        :param source: Source file object
+        :param destination: Unbuffered destination file object
+        :param offset: Offset of range in source
+        :param length: Length of range
+        :return: Number of bytes copied
+        """
 
-            # Image type based on column and line count
-            if self.imageStructureHeader['num_cols'] == 2200 and self.imageStructureHeader['num_lines'] == 2200:
-                self.imageStructureHeader['image_type'] = 0  # FD
-            elif self.imageStructureHeader['num_cols'] == 1547 and (self.imageStructureHeader['num_lines'] == 308 or self.imageStructureHeader['num_lines'] == 309):
-                self.imageStructureHeader['image_type'] = 1  # ENH
-            elif self.imageStructureHeader['num_cols'] == 1547 and self.imageStructureHeader['num_lines'] == 318:
-                self.imageStructureHeader['image_type'] = 2  # LSH
-            elif self.imageStructureHeader['num_cols'] == 810 and self.imageStructureHeader['num_lines'] == 611:
-                self.imageStructureHeader['image_type'] = 3  # APNH
+        copied = 0
+        for method in ("copy_file_range", "sendfile"):
+            if not hasattr(os, method):
+                continue
+            try:
+                while copied < length:
+                    if method == "copy_file_range":
+                        count = os.copy_file_range(source.fileno(), destination.fileno(), length - copied, offset + copied)
+                    else:
+                        count = os.sendfile(destination.fileno(), source.fileno(), offset + copied, length - copied)
+                    if count == 0:
+                        return copied  # Source is shorter than expected
+                    copied += count
+                return copied
+            except OSError:
+                pass  # Not supported for these files, try next method from where this one stopped
+
+        buffer = memoryview(bytearray(min(cls.copyChunkSize, length - copied) or 1))
+        source.seek(offset + copied)
+        while copied < length:
+            count = source.readinto(buffer[:length - copied])
+            if not count:
+                break
+            chunk = buffer[:count]
+            while chunk:
+                chunk = chunk[destination.write(chunk):]  # Unbuffered writes may be partial
+            copied += count
+        return copied
 
-            self.imageStructureHeader['image_compression'] = int.from_bytes(self.readbytes(8), byteorder='big')
 
-            self.byteOffset += self.imageStructureHeader['header_len']
-            if printInfo:
-                self.printImageStructureHeader()
-        else:
-            self.imageStructureHeader['valid'] = False
+    # Header parsing methods
+    def walkHeaders(self, printInfo=False):
+        """
+        Parses all LRIT headers in a single pass, following the type/length records
+        from the Primary header up to the total header length. Header order does not matter.
+        Unknown header types are skipped.
+        :param printInfo: Print info after parsing each header
+        :return: List of header records in file order
+        """
 
-    def parseImageNavigationHeader(self, printInfo=False):
+        metrics = self.metrics
+        self.byteOffset = 0
+        self.parsePrimaryHeader(printInfo)
+        headers = [self.primaryHeader]
+        if not self.primaryHeader['valid']:
+            return headers
+
+        end = min(self.primaryHeader['total_header_len'], len(self.lritString))
+        offset = self.primaryHeader['header_len']
+        while offset + 3 <= end:
+            headerType, headerLen = self.recordLayout.unpack_from(self.lritString, offset)
+            if headerLen < 3 or offset + headerLen > end:
+                break  # Corrupt record, stop walking
+
+            if headerType in self.headerRegistry and headerType != 0:
+                attribute, decoder, printer = self.headerRegistry[headerType]
+                if metrics is not None:
+                    start = perf_counter()
+                record = getattr(self, decoder)(offset, headerLen)
+                if metrics is not None:
+                    metrics.addStage(self.headerStages[headerType], perf_counter() - start, headerLen)
+
+                if record is not None:
+                    setattr(self, attribute, record)
+                    headers.append(record)
+                    if printInfo and printer is not None:
+                        self.printHeader(printer)
+
+            offset += headerLen
+
+        self.byteOffset = offset
+        return headers
+
+    def parseHeader(self, headerType, printInfo=False):
         """
-        Parses LRIT Image Navigation header (type 2)
+        Parses header of a given type at the current byte offset
+        :param headerType: Header type to expect
         :param printInfo: Print info after parsing
         """
 
-        if self.readbytes(0, 3) == b'\x02\x00\x33':
-            self.imageNavigationHeader['valid'] = True
-            self.imageNavigationHeader['header_type'] = 2
-            self.imageNavigationHeader['header_len'] = 51
-            self.imageNavigationHeader['header_offset'] = self.byteOffset
+        attribute, decoder, printer = self.headerRegistry[headerType]
+        metrics = self.metrics
+        if metrics is not None:
+            start = perf_counter()
 
-            # Projection and longitude
-            projectionString = self.readbytes(3, 32).decode()
-            if projectionString.__contains__("GEOS"):
-                self.imageNavigationHeader['projection'] = "Normalized Geostationary Projection (GEOS)"
-            self.imageNavigationHeader['longitude'] = projectionString[projectionString.index("(") + 1:projectionString.index(")")]
+        record = None
+        if self.byteOffset + 3 <= len(self.lritString):
+            recordType, recordLen = self.recordLayout.unpack_from(self.lritString, self.byteOffset)
+            if recordType == headerType and self.byteOffset + recordLen <= len(self.lritString):
+                record = getattr(self, decoder)(self.byteOffset, recordLen)
 
-            # Scaling factors
-            self.imageNavigationHeader['col_scaling'] = int.from_bytes(self.readbytes(35, 4), byteorder='big')
-            self.imageNavigationHeader['line_scaling'] = int.from_bytes(self.readbytes(39, 4), byteorder='big')
+        if record is None:
+            record = HeaderRecord(False, headerType)
+        setattr(self, attribute, record)
 
-            # Offsets
-            self.imageNavigationHeader['col_offset'] = int.from_bytes(self.readbytes(43, 4), byteorder='big')
-            self.imageNavigationHeader['line_offset'] = int.from_bytes(self.readbytes(47, 4), byteorder='big')
+        if metrics is not None:
+            metrics.addStage(self.headerStages[headerType], perf_counter() - start, record.header_len or 0)
+            if headerType == 0 and record.valid:
+                metrics.addFile(record.file_type)
+
+        if record.valid:
+            self.byteOffset += record.header_len
+            if printInfo and printer is not None:
+                self.printHeader(printer)
 
-            self.byteOffset += self.imageNavigationHeader['header_len']
-            if printInfo:
-                self.printImageNavigationHeader()
+    def printHeader(self, printer):
+        """
+        Calls a header output method, timing it while instrumentation is enabled
+        :param printer: Name of output method
+        """
+
+        if self.metrics is None:
+            getattr(self, printer)()
         else:
-            self.imageNavigationHeader['valid'] = False
+            start = perf_counter()
+            getattr(self, printer)()
+            self.metrics.addStage("print", perf_counter() - start)
 
-    def parseImageDataFunctionHeader(self, printInfo=False):
+    def parsePrimaryHeader(self, printInfo=False):
         """
-        Parses LRIT Image Data Function header (type 3)
+        Parses LRIT Primary header (type 0, required)
         :param printInfo: Print info after parsing
         """
+        self.parseHeader(0, printInfo)
 
-        if self.readbytes(0) == b'\x03':
-            self.imageDataFunctionHeader['valid'] = True
-            self.imageDataFunctionHeader['header_type'] = 3
-            self.imageDataFunctionHeader['header_len'] = int.from_bytes(self.readbytes(1, 2), byteorder='big')
-            self.imageDataFunctionHeader['header_offset'] = self.byteOffset
-
-            self.imageDataFunctionHeader['data_definition_block'] = self.readbytes(3, self.imageDataFunctionHeader['header_len'] - 3).decode()
-            self.imageDataFunctionHeader['data_definition_block_filename'] = self.path[:str(self.path).index(".lrit")] + "_IDF-DDB.txt"
+    def parseImageStructureHeader(self, printInfo=False):
+        """
+        Parses LRIT Image Structure header (type 1)
+        :param printInfo: Print info after parsing
+        """
+        self.parseHeader(1, printInfo)
 
-            ddbFile = open(self.imageDataFunctionHeader['data_definition_block_filename'], 'w')
-            ddbFile.write(self.imageDataFunctionHeader['data_definition_block'])
-            ddbFile.close()
+    def parseImageNavigationHeader(self, printInfo=False):
+        """
+        Parses LRIT Image Navigation header (type 2)
+        :param printInfo: Print info after parsing
+        """
+        self.parseHeader(2, printInfo)
 
-            self.byteOffset += self.imageDataFunctionHeader['header_len']
-            if printInfo:
-                self.printImageDataFunctionHeader()
+    def parseImageDataFunctionHeader(self, printInfo=False):
+        """
+        Parses LRIT Image Data Function header (type 3)
+        :param printInfo: Print info after parsing
+        """
+        self.parseHeader(3, printInfo)
 
     def parseAnnotationTextHeader(self, printInfo=False):
         """
         Parses LRIT Annotation Text header (type 4)
         :param printInfo: Print info after parsing
         """
-
-        if self.readbytes(0) == b'\x04':
-            self.annotationTextHeader['valid'] = True
-            self.annotationTextHeader['header_type'] = 4
-            self.annotationTextHeader['header_len'] = int.from_bytes(self.readbytes(1, 2), byteorder='big')
-            self.annotationTextHeader['header_offset'] = self.byteOffset
-
-            self.annotationTextHeader['text_data'] = self.readbytes(3, self.annotationTextHeader['header_len'] - 3).decode()
-
-            self.byteOffset += self.annotationTextHeader['header_len']
-            if printInfo:
-                self.printAnnotationTextHeader()
-        else:
-            self.imageNavigationHeader['valid'] = False
+        self.parseHeader(4, printInfo)
 
     def parseTimestampHeader(self, printInfo=False):
         """
         Parses LRIT CCSDS Timestamp header (type 5)
         :param printInfo: Print info after parsing 
         """
+        self.parseHeader(5, printInfo)
 
-        if self.readbytes(0, 3) == b'\x05\x00\x0A':
-            self.timestampHeader['valid'] = True
-            self.timestampHeader['header_type'] = 5
-            self.timestampHeader['header_len'] = 10
-            self.timestampHeader['header_offset'] = self.byteOffset
+    def parseAncillaryTextHeader(self, printInfo=False):
+        """
+        Parses LRIT Ancillary Text header (type 6)
+        Header type unused. Allows for future LRIT expansion.
+        :param printInfo: Print info after parsing 
+        """
+        self.parseHeader(6, printInfo)
 
-            # CDS P Field
-            pFieldInt = int.from_bytes(self.readbytes(3), byteorder='big')
-            self.timestampHeader['p_field'] = bin(pFieldInt)[2:].zfill(8)
+    def parseKeyHeader(self, printInfo=False):
+        """
+        Parses LRIT Key header (type 7)
+        :param printInfo: Print info after parsing
+        """
+        self.parseHeader(7, printInfo)
 
-            # Bit 0 - Extension flag, Bits 1-3 - Time code ID, Bits 4-7 - Detail bits
-            pField = [self.timestampHeader['p_field'][0], self.timestampHeader['p_field'][1:4], self.timestampHeader['p_field'][4:8]]
+    def parseImageSegmentationInformationHeader(self, printInfo=False):
+        """
+        Parses LRIT Image Segmentation Information header (type 128)
+        :param printInfo: Print info after parsing
+        """
+        self.parseHeader(128, printInfo)
 
-            # Extension flag
-            if pField[0] == "0":
-                self.timestampHeader['p_field_ext_flag'] = "0 (No extension)"
-            else:
-                self.timestampHeader['p_field_ext_flag'] = pField[0] + " (Extended field)"
 
-            # Time code ID
-            if pField[1] == "100":
-                self.timestampHeader['p_field_time_code'] = "100 (1958 January 1 epoch - Level 1 Time Code)"
-            elif pField[1] == "010":
-                self.timestampHeader['p_field_time_code'] = "010 (Agency-defined epoch - Level 2 Time Code)"
+    # Header decoding methods
+    # Each takes the absolute offset and length of a header record and returns
+    # a header record, or None if the record does not match the expected layout.
+    # Records keep a copy of the header bytes and decode their fields when first read.
+    def getHeaderBytes(self, offset, length):
+        """
+        Copies header bytes following the type/length record, so records outlive the file
+        :param offset: Absolute offset of header record
+        :param length: Length of header record
+        :return: Bytes
+        """
+        return bytes(self.lritString[offset + 3:offset + length])
 
-            # Detail bits
-            self.timestampHeader['p_field_detail_bits'] = pField[2]
+    def decodePrimaryHeader(self, offset, length):
+        if length != 16:
+            return None
+        return PrimaryHeader(True, 0, length, offset, self.getHeaderBytes(offset, length))
 
+    def decodeImageStructureHeader(self, offset, length):
+        if length != 9:
+            return None
+        return ImageStructureHeader(True, 1, length, offset, self.getHeaderBytes(offset, length))
 
-            # CDS T Field
-            tFieldInt = int.from_bytes(self.readbytes(4, 6), byteorder='big')
-            self.timestampHeader['t_field'] = bin(tFieldInt)[2:].zfill(48)
-
-            # Bits 0-16 - Days since epoch, Bits 16-48 - Milliseconds of day
-            tField = [int(self.timestampHeader['t_field'][0:16], 2), int(self.timestampHeader['t_field'][16:48], 2)]
-
-            epoch = datetime.strptime("01/01/1958", '%d/%m/%Y')
-            currentDate = epoch + timedelta(days=tField[0])
-            self.timestampHeader['t_field_day_count'] = tField[0]
-            self.timestampHeader['t_field_current_date'] = currentDate.strftime('%d/%m/%Y')
-            self.timestampHeader['t_field_millis'] = tField[1]
-            currentDate += timedelta(milliseconds=self.timestampHeader['t_field_millis'])
-            self.timestampHeader['t_field_current_time'] = currentDate.strftime('%H:%M:%S')
-
-            self.byteOffset += self.timestampHeader['header_len']
-            if printInfo:
-                self.printTimestampHeader()
-        else:
-            self.timestampHeader['valid'] = False
+    def decodeImageNavigationHeader(self, offset, length):
+        if length != 51:
+            return None
+        return ImageNavigationHeader(True, 2, length, offset, self.getHeaderBytes(offset, length))
 
-    def parseAncillaryTextHeader(self, printInfo=False):
-        """
-        Parses LRIT Ancillary Text header (type 6)
-        Header type unused. Allows for future LRIT expansion.
-        :param printInfo: Print info after parsing 
-        """
+    def decodeImageDataFunctionHeader(self, offset, length):
+        return ImageDataFunctionHeader(True, 3, length, offset, self.getHeaderBytes(offset, length))
 
-        if self.readbytes == b'\x06':
-            self.ancillaryTextHeader['valid'] = True
-            self.ancillaryTextHeader['header_type'] = 6
-            self.ancillaryTextHeader['header_len'] = int.from_bytes(self.readbytes(1, 2), byteorder='big')
-            self.ancillaryTextHeader['header_offset'] = self.byteOffset
+    def decodeAnnotationTextHeader(self, offset, length):
+        return AnnotationTextHeader(True, 4, length, offset, self.getHeaderBytes(offset, length))
 
-            self.byteOffset += self.ancillaryTextHeader['header_len']
-            # if printInfo:  # Not implemented
-                # self.printAncillaryTextHeader()
-        else:
-            self.ancillaryTextHeader['valid'] = False
+    def decodeTimestampHeader(self, offset, length):
+        if length != 10:
+            return None
+        return TimestampHeader(True, 5, length, offset, self.getHeaderBytes(offset, length))
 
-    def parseKeyHeader(self, printInfo=False):
-        if self.readbytes(0, 3) == b'\x07\x00\x07':
-            self.keyHeader['valid'] = True
-            self.keyHeader['header_type'] = 7
-            self.keyHeader['header_len'] = 7
-            self.keyHeader['header_offset'] = self.byteOffset
+    def decodeAncillaryTextHeader(self, offset, length):
+        return AncillaryTextHeader(True, 6, length, offset, self.getHeaderBytes(offset, length))
 
-            self.keyHeader['key'] = int.from_bytes(self.readbytes(3, 4), byteorder='big')
+    def decodeKeyHeader(self, offset, length):
+        if length != 7:
+            return None
+        return KeyHeader(True, 7, length, offset, self.getHeaderBytes(offset, length))
 
-            self.byteOffset += self.keyHeader['header_len']
-            if printInfo:
-                self.printKeyHeader()
-        else:
-            self.keyHeader['valid'] = False
+    def decodeImageSegmentationInformationHeader(self, offset, length):
+        if length != 7:
+            return None
+        return ImageSegmentationInformationHeader(True, 128, length, offset, self.getHeaderBytes(offset, length))
 
-    def parseImageSegmentationInformationHeader(self, printInfo=False):
-        if self.readbytes(0, 3) == b'\x80\x00\x07':
-            self.imageSegmentationInformationHeader['valid'] = True
-            self.imageSegmentationInformationHeader['header_type'] = 128
-            self.imageSegmentationInformationHeader['header_len'] = 7
-            self.imageSegmentationInformationHeader['header_offset'] = self.byteOffset
-
-            self.imageSegmentationInformationHeader['segment_num'] = int.from_bytes(self.readbytes(3), byteorder='big')
-            self.imageSegmentationInformationHeader['segment_total'] = int.from_bytes(self.readbytes(4), byteorder='big')
-            self.imageSegmentationInformationHeader['line_num_of_segment'] = int.from_bytes(self.readbytes(5, 2), byteorder='big')
-
-            self.byteOffset += self.imageSegmentationInformationHeader['header_len']
-            if printInfo:
-                self.printImageSegmentationInformationHeader()
-        else:
-            self.imageSegmentationInformationHeader['valid'] = False
+    @staticmethod
+    def cdsToDate(dayCount):
+        """
+        Converts CDS day count to a calendar date with integer arithmetic
+        :param dayCount: Days since 1958 January 1
+        :return: Tuple of (year, month, day)
+        """
+
+        # Days since 0000 March 1 (proleptic Gregorian), so leap days fall at the end of each year
+        days = dayCount + 715085
+        era = days // 146097
+        dayOfEra = days - era * 146097
+        yearOfEra = (dayOfEra - dayOfEra // 1460 + dayOfEra // 36524 - dayOfEra // 146096) // 365
+        dayOfYear = dayOfEra - (365 * yearOfEra + yearOfEra // 4 - yearOfEra // 100)
+        monthIndex = (5 * dayOfYear + 2) // 153  # 0 is March
+
+        day = dayOfYear - (153 * monthIndex + 2) // 5 + 1
+        month = monthIndex + 3 if monthIndex < 10 else monthIndex - 9
+        year = yearOfEra + era * 400 + (month <= 2)
+        return year, month, day
 
 
     # Header output methods
@@ -379,12 +963,12 @@ class COMS:
             self.setConsoleColour()
             print("\tHeader length:         {0} ({1})".format(self.imageStructureHeader['header_len'], self.intToHexStr(self.imageStructureHeader['header_len'])))
 
-            if int.from_bytes(self.imageStructureHeader['bits_per_pixel'], byteorder='big') != 8:
-                print("\tBits per pixel:        {0} {1}".format(str(int.from_bytes(self.imageStructureHeader['bits_per_pixel'], byteorder='big')), self.colours['WARNING'] + " WARNING: Should always be 8 for LRIT" + self.colours['ENDC']))
+            if self.imageStructureHeader['bits_per_pixel'] != 8:
+                print("\tBits per pixel:        {0} {1}".format(self.imageStructureHeader['bits_per_pixel'], self.colours['WARNING'] + " WARNING: Should always be 8 for LRIT" + self.colours['ENDC']))
             else:
-                print("\tBits per pixel:        {0}".format(int.from_bytes(self.imageStructureHeader['bits_per_pixel'], byteorder='big')))
+                print("\tBits per pixel:        {0}".format(self.imageStructureHeader['bits_per_pixel']))
 
-            print("\tImage:                 {0}".format(self.imageTypes[self.imageStructureHeader['image_type']]))
+            print("\tImage:                 {0}".format(self.imageTypes.get(self.imageStructureHeader['image_type'], "Unknown")))
             print("\t  - Columns: {0}".format(self.imageStructureHeader['num_cols']))
             print("\t  - Lines:   {0}".format(self.imageStructureHeader['num_lines']))
 
@@ -437,7 +1021,8 @@ class COMS:
             print("\tHeader length:         {0} ({1})".format(self.imageDataFunctionHeader['header_len'], self.intToHexStr( self.imageDataFunctionHeader['header_len'])))
 
             print("\tData Definition Block:")
-            print("\t  - dumped to \"{0}\"".format(self.imageDataFunctionHeader['data_definition_block_filename']))
+            print("\t  - Channel:           {0}".format(self.imageDataFunctionHeader.getChannel()))
+            print("\t  - Length:            {0} bytes".format(len(self.imageDataFunctionHeader['data_definition_block'])))
             print()
         else:
             self.setConsoleColour("FAIL")
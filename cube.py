@@ -0,0 +1,272 @@
+import json
+import os
+from datetime import timedelta
+import numpy as np
+from assembler import getPassName, getPixelType
+from coms import COMS
+from roi import RegionReader
+
+
+def getTimestampKey(result):
+    """
+    Gets CDS timestamp of a parsed file as one integer
+    :param result: COMS instance or ParseResult
+    :return: Milliseconds since the CDS epoch (1958-01-01)
+    """
+
+    timestamp = result.timestampHeader
+    if not timestamp.valid:
+        raise ValueError("\"{0}\" has no Timestamp header".format(result.path))
+    return timestamp.t_field_day_count * 86400000 + timestamp.t_field_millis
+
+
+def keyToDatetime(key):
+    """
+    Converts timestamp key to a datetime
+    :param key: Milliseconds since the CDS epoch
+    :return: Datetime (UTC)
+    """
+    return COMS.cdsEpoch + timedelta(milliseconds=key)
+
+
+class FrameCube:
+    """
+    cube.py
+    https://github.com/sam210723/coms-1
+
+    Time series of frames of one image type and channel, stored as a memory-mapped [time, line, column] array.
+    The array is a ring of fixed capacity. Frames are keyed by CDS timestamp, and old frames roll off by capacity
+    and retention window. The index is rewritten atomically after each frame is flushed, and a slot the index on disk
+    still points to is only overwritten once an index without it has been written.
+    """
+
+    def __init__(self, directory, numCols=None, numLines=None, bitsPerPixel=8, capacity=96, retention=None):
+        """
+        Opens a cube, creating it if it does not exist. Layout arguments are only used when creating.
+        :param directory: Cube directory
+        :param numCols: Frame width
+        :param numLines: Frame height
+        :param bitsPerPixel: Bits per pixel of segments
+        :param capacity: Number of frames kept (default: one day of 15 minute passes)
+        :param retention: Drop frames this much older than the newest, as a timedelta (default: capacity only)
+        """
+
+        self.directory = directory
+        self.indexPath = os.path.join(directory, "index.json")
+        self.framesPath = os.path.join(directory, "frames.raw")
+
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath) as indexFile:
+                index = json.load(indexFile)
+            numCols, numLines, bitsPerPixel = index['num_cols'], index['num_lines'], index['bits_per_pixel']
+            capacity, retention = index['capacity'], index['retention_ms']
+            self.frames = {key: slot for key, slot in index['frames']}  # Timestamp key -> slot
+            mode = "r+"
+        else:
+            if numCols is None or numLines is None:
+                raise ValueError("\"{0}\" is not a cube".format(directory))
+            os.makedirs(directory, exist_ok=True)
+            retention = int(retention.total_seconds() * 1000) if retention is not None else None
+            self.frames = {}
+            mode = "w+"
+
+        self.numCols = numCols
+        self.numLines = numLines
+        self.bitsPerPixel = bitsPerPixel
+        self.capacity = capacity
+        self.retention = retention  # Milliseconds, or None
+        self.pixelType = getPixelType(bitsPerPixel)
+        self.array = np.memmap(self.framesPath, dtype=self.pixelType, mode=mode, shape=(capacity, numLines, numCols))
+        self.indexed = set(self.frames.values())  # Slots referenced by the index on disk
+        if mode == "w+":
+            self.writeIndex()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return "FrameCube({0!r}, {1} of {2} frames, {3}x{4} {5})".format(
+            self.directory, len(self.frames), self.capacity, self.numCols, self.numLines, self.pixelType)
+
+    def writeIndex(self):
+        """
+        Writes index of frames, replacing it atomically
+        """
+
+        index = {
+            'num_cols': self.numCols,
+            'num_lines': self.numLines,
+            'bits_per_pixel': self.bitsPerPixel,
+            'capacity': self.capacity,
+            'retention_ms': self.retention,
+            'frames': sorted(self.frames.items())
+        }
+        tempPath = "{0}.{1}.tmp".format(self.indexPath, os.getpid())
+        with open(tempPath, "w") as indexFile:
+            json.dump(index, indexFile)
+        os.replace(tempPath, self.indexPath)
+        self.indexed = set(self.frames.values())
+
+    def getTimestamps(self):
+        """
+        Gets timestamps of stored frames, oldest first
+        :return: List of datetimes
+        """
+        return [keyToDatetime(key) for key in sorted(self.frames)]
+
+    def getSlot(self, key):
+        """
+        Finds slot for a new frame, dropping frames outside the retention window and, if full, the oldest frame.
+        Slots the index on disk does not reference are used first. Otherwise the index is rewritten without the dropped
+        frames before their slot is returned, so a crash while the frame is written never leaves the index over it.
+        :param key: Timestamp key of new frame
+        :return: Slot number, or None if the frame is older than everything a full cube keeps
+        """
+
+        # Same pass again, e.g. after more segments arrived. It gets a new slot like any other frame.
+        self.frames.pop(key, None)
+
+        if self.retention is not None:
+            newest = max(key, max(self.frames, default=key))
+            if key < newest - self.retention:
+                return None
+            for old in [k for k in self.frames if k < newest - self.retention]:
+                del self.frames[old]
+
+        if len(self.frames) >= self.capacity:
+            oldest = min(self.frames)
+            if key < oldest:
+                return None
+            del self.frames[oldest]
+
+        used = set(self.frames.values())
+        free = [slot for slot in range(self.capacity) if slot not in used]
+        slot = next((slot for slot in free if slot not in self.indexed), free[0])
+        if slot in self.indexed:
+            self.writeIndex()
+        return slot
+
+    def append(self, paths):
+        """
+        Adds a pass, reading its segments straight into a free slot
+        :param paths: Segment file paths of one pass
+        :return: Timestamp of the frame, or None if it was outside the retention window
+        """
+
+        reader = RegionReader(paths)
+        if reader.numCols != self.numCols or reader.pixelType != self.pixelType:
+            raise ValueError("Pass does not match cube layout ({0} columns, {1})".format(self.numCols, self.pixelType))
+
+        key = getTimestampKey(COMS.parse(reader.segments[0][3]))
+        slot = self.getSlot(key)
+        if slot is None:
+            return None
+
+        # Frame is written and flushed before the index points to it
+        numLines = min(reader.numLines, self.numLines)
+        reader.readPixels(0, 0, self.numCols, numLines, out=self.array[slot, :numLines])
+        self.array[slot, numLines:] = 0
+        self.array.flush()
+
+        self.frames[key] = slot
+        self.writeIndex()
+        return keyToDatetime(key)
+
+    def getFrames(self, start=None, end=None):
+        """
+        Gets frames in a time range, reading only those frames
+        :param start: First timestamp (datetime, inclusive), or None
+        :param end: Last timestamp (datetime, inclusive), or None
+        :return: Tuple of (list of datetimes, array shaped (frames, lines, columns)), oldest first
+        """
+
+        startKey = (start - COMS.cdsEpoch) // timedelta(milliseconds=1) if start is not None else None
+        endKey = (end - COMS.cdsEpoch) // timedelta(milliseconds=1) if end is not None else None
+        keys = [key for key in sorted(self.frames) if (startKey is None or key >= startKey) and (endKey is None or key <= endKey)]
+        slots = [self.frames[key] for key in keys]
+
+        if slots and slots == list(range(slots[0], slots[0] + len(slots))):
+            frames = self.array[slots[0]:slots[0] + len(slots)]  # Consecutive slots, a view of the map
+        else:
+            frames = self.array.take(slots, axis=0)
+        return [keyToDatetime(key) for key in keys], frames
+
+
+class CubeStore:
+    """
+    Directory of frame cubes, one per image type and channel (e.g. "ENH_IR1")
+    """
+
+    def __init__(self, directory, capacity=96, retention=None):
+        """
+        :param directory: Store directory
+        :param capacity: Frames kept by new cubes
+        :param retention: Retention window of new cubes, as a timedelta
+        """
+
+        self.directory = directory
+        self.capacity = capacity
+        self.retention = retention
+
+    @staticmethod
+    def getCubeName(result):
+        """
+        Gets cube name of a parsed segment
+        :param result: ParseResult
+        :return: Name, e.g. "ENH_IR1" or "HRIT_FD_IR1"
+        """
+
+        structure = result.imageStructureHeader
+        imageType = COMS.imageTypes.get(structure.image_type, "({0})".format(structure.image_type)).rsplit("(", 1)[-1].rstrip(")")
+        channel = result.imageDataFunctionHeader.getChannel() if result.imageDataFunctionHeader.valid else "UNKNOWN"
+        name = "{0}_{1}".format(imageType, channel)
+        return "HRIT_" + name if structure.bits_per_pixel == 16 else name  # HRIT and LRIT frames differ in size
+
+    def getNames(self):
+        """
+        Gets names of cubes in the store
+        :return: Sorted list of names
+        """
+
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if os.path.exists(os.path.join(self.directory, name, "index.json")))
+
+    def getCube(self, name, results=None):
+        """
+        Opens a cube
+        :param name: Cube name
+        :param results: Parsed segments of a pass, used to size the cube if it does not exist
+        :return: FrameCube
+        """
+
+        directory = os.path.join(self.directory, name)
+        if results is None or os.path.exists(os.path.join(directory, "index.json")):
+            return FrameCube(directory)
+
+        structure = results[0].imageStructureHeader
+        segmentTotal = results[0].imageSegmentationInformationHeader.get('segment_total', 1)
+        if len(results) >= segmentTotal:
+            numLines = max(r.imageSegmentationInformationHeader.get('line_num_of_segment', 1) - 1 + r.imageStructureHeader.num_lines for r in results)
+        else:
+            numLines = max(r.imageStructureHeader.num_lines for r in results) * segmentTotal  # Upper bound until a complete pass is seen
+        return FrameCube(directory, structure.num_cols, numLines, structure.bits_per_pixel, self.capacity, self.retention)
+
+    def append(self, paths):
+        """
+        Adds all passes in a set of files to their cubes
+        :param paths: LRIT/HRIT file paths
+        :return: List of (cube name, timestamp or None) per pass
+        """
+
+        passes = {}
+        for result in COMS.parseMany(paths):
+            if result.primaryHeader.valid and result.primaryHeader.file_type == 0:
+                passes.setdefault(getPassName(result), []).append(result)
+
+        appended = []
+        for name, results in sorted(passes.items()):
+            cubeName = self.getCubeName(results[0])
+            cube = self.getCube(cubeName, results)
+            appended.append((cubeName, cube.append([result.path for result in results])))
+        return appended
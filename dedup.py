@@ -0,0 +1,199 @@
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from coms import COMS
+
+
+class DedupIndex:
+    """
+    dedup.py
+    https://github.com/sam210723/coms-1
+
+    Persistent set of LRIT/HRIT files already seen, keyed by annotation text (the original file name) and a content hash.
+    Identical repeats from retransmissions or several receivers are skipped. When content differs, the newest copy is kept.
+    The set is an SQLite database, least recently seen entries are evicted beyond a maximum number of entries.
+    """
+
+    # Results of check()
+    statusNew = "new"  # Name not seen before, process it
+    statusChanged = "changed"  # Content differs from the copy seen before and this copy is newer, process it
+    statusDuplicate = "duplicate"  # Same content as the copy seen before, skip it
+    statusStale = "stale"  # Content differs but this copy is older than the one seen before, skip it
+
+    # Hash read buffer size, each file is hashed in chunks through one buffer
+    chunkSize = 1024 * 1024
+
+    def __init__(self, path="lrit-dedup.db", maxEntries=1000000):
+        """
+        Opens seen-set database, creating it if needed
+        :param path: SQLite database path
+        :param maxEntries: Entries kept, least recently seen are evicted first
+        """
+
+        self.path = path
+        self.maxEntries = maxEntries
+        self.db = sqlite3.connect(self.path, check_same_thread=False)  # Callers may use it from one worker thread at a time
+
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS seen (name TEXT PRIMARY KEY, digest BLOB, size INTEGER, mtime INTEGER, path TEXT, last_seen REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS seen_last ON seen (last_seen)")
+        self.entries = self.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    @classmethod
+    def hashFile(cls, path):
+        """
+        Hashes file contents in chunks, without reading the whole file into memory
+        :param path: File path
+        :return: BLAKE2b digest (16 bytes)
+        """
+
+        digest = hashlib.blake2b(digest_size=16)
+        buffer = memoryview(bytearray(cls.chunkSize))
+        with open(path, "rb", buffering=0) as lritFile:
+            while True:
+                count = lritFile.readinto(buffer)
+                if not count:
+                    break
+                digest.update(buffer[:count])
+        return digest.digest()
+
+    @staticmethod
+    def getName(path, result=None):
+        """
+        Gets name identifying a file: its annotation text, or the file name if it has none
+        :param path: File path
+        :param result: ParseResult, parsed from path if not given
+        :return: Name
+        """
+
+        if result is None:
+            result = COMS.parse(path)
+        name = result.annotationTextHeader.get('text_data') or ""
+        return name.strip("\x00 ") or os.path.basename(path)
+
+    def fingerprint(self, path, result=None):
+        """
+        Gets name, digest, size and mtime of a file. Safe to call from worker threads.
+        :param path: File path
+        :param result: ParseResult, parsed from path if not given
+        :return: Tuple of (name, digest, size, mtime)
+        """
+
+        stat = os.stat(path)
+        return self.getName(path, result), self.hashFile(path), stat.st_size, stat.st_mtime_ns
+
+    def check(self, path, result=None, fingerprint=None):
+        """
+        Checks a file against the seen-set and records it
+        :param path: File path
+        :param result: ParseResult, parsed from path if not given
+        :param fingerprint: Result of fingerprint(), computed if not given
+        :return: One of statusNew, statusChanged, statusDuplicate or statusStale
+        """
+
+        fingerprint = fingerprint or self.fingerprint(path, result)
+        with self.db:
+            status = self.record(path, fingerprint, time.time())
+        self.evict()
+        return status
+
+    def filter(self, paths, workers=4):
+        """
+        Checks many files in one transaction, hashing them on a thread pool. Files are checked oldest first,
+        so of several copies with different content the newest is kept.
+        :param paths: File paths
+        :param workers: Number of hashing threads
+        :return: List of (path, status) tuples, oldest first
+        """
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fingerprints = list(executor.map(self.fingerprint, paths))
+
+        now = time.time()
+        order = sorted(range(len(paths)), key=lambda i: (fingerprints[i][3], paths[i]))
+        with self.db:
+            statuses = [(paths[i], self.record(paths[i], fingerprints[i], now)) for i in order]
+        self.evict()
+        return statuses
+
+    def compare(self, fingerprint):
+        """
+        Compares a file with the copy seen before, without recording it.
+        Used when a file should only be recorded once it has been processed, see check().
+        :param fingerprint: Result of fingerprint()
+        :return: Status, see check()
+        """
+
+        name, digest, size, mtime = fingerprint
+        row = self.db.execute("SELECT digest, mtime FROM seen WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return self.statusNew
+        elif row[0] == digest:
+            return self.statusDuplicate
+        elif mtime > row[1]:
+            return self.statusChanged
+        else:
+            return self.statusStale
+
+    def record(self, path, fingerprint, now):
+        """
+        Compares a file with the copy seen before and updates its entry, inside the caller's transaction
+        :param path: File path
+        :param fingerprint: Result of fingerprint()
+        :param now: Time seen
+        :return: Status, see check()
+        """
+
+        name, digest, size, mtime = fingerprint
+        status = self.compare(fingerprint)
+        if status == self.statusNew:
+            self.entries += 1
+
+        if status in (self.statusNew, self.statusChanged):
+            self.db.execute("INSERT OR REPLACE INTO seen (name, digest, size, mtime, path, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                            (name, digest, size, mtime, os.path.abspath(path), now))
+        else:
+            self.db.execute("UPDATE seen SET last_seen = ? WHERE name = ?", (now, name))
+        return status
+
+    def evict(self):
+        """
+        Removes least recently seen entries beyond maxEntries
+        :return: Number of entries removed
+        """
+
+        excess = self.entries - self.maxEntries
+        if excess <= 0:
+            return 0
+        with self.db:
+            self.db.execute("DELETE FROM seen WHERE name IN (SELECT name FROM seen ORDER BY last_seen LIMIT ?)", (excess,))
+        self.entries = self.count()
+        return excess
+
+    def getPath(self, name):
+        """
+        Gets path of the copy kept for a name
+        :param name: Annotation text
+        :return: Absolute path, or None if not seen
+        """
+
+        row = self.db.execute("SELECT path FROM seen WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def count(self):
+        """
+        Gets number of entries
+        :return: Entry count
+        """
+        return self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
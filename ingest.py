@@ -0,0 +1,513 @@
+import asyncio
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from assembler import PassTracker, getPassName
+from coms import COMS
+from dedup import DedupIndex
+
+
+# Worker process jobs. Only paths cross the process boundary, data is read from the files in the worker.
+def extractFile(path, outputDir):
+    """
+    Extracts payload of an Additional Data (ADD) file
+    :param path: ADD file path
+    :param outputDir: Output directory
+    :return: Output file path
+    """
+
+    with COMS(path, useMmap=True) as lrit:
+        lrit.walkHeaders()
+        return lrit.extractDataField(outputDir)
+
+
+# Thread jobs. Pass images stay in this process, so segments are only read once however often a pass is written.
+def writePassImage(tracker, segments, outputPath, numLines=None):
+    """
+    Adds newly received segments to the image of a pass and writes it to PNG. If segments are missing their lines are transparent.
+    The PNG is replaced atomically, so partial products can be rewritten while they are read.
+    :param tracker: PassTracker
+    :param segments: Segments to add, from PassTracker.takePending()
+    :param outputPath: Output PNG path
+    :param numLines: Image height if the last segment is missing (default: last line received)
+    :return: Output file path
+    """
+
+    assembler = tracker.assemble(segments)
+    tempPath = "{0}.{1}.tmp".format(outputPath, os.getpid())
+    if assembler.isComplete():
+        assembler.writePng(tempPath)
+    else:
+        assembler.writeMaskedPng(tempPath, numLines)
+    os.replace(tempPath, outputPath)
+    return outputPath
+
+
+class StageStats:
+    """
+    Latency of one processing stage. Percentiles cover the most recent samples only.
+    """
+
+    __slots__ = ('count', 'errors', 'total', 'maximum', 'recent')
+
+    def __init__(self, recentSize=256):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.recent = deque(maxlen=recentSize)
+
+    def add(self, seconds):
+        """
+        Records one completed job
+        :param seconds: Job latency
+        """
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.recent.append(seconds)
+
+    def toDict(self):
+        """
+        Gets summary in milliseconds
+        :return: Dictionary of count, errors, mean_ms, p95_ms and max_ms
+        """
+
+        recent = sorted(self.recent)
+        p95 = recent[min(int(len(recent) * 0.95), len(recent) - 1)] if recent else 0.0
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p95_ms': round(p95 * 1000, 3),
+            'max_ms': round(self.maximum * 1000, 3)
+        }
+
+
+class IngestDaemon:
+    """
+    ingest.py
+    https://github.com/sam210723/coms-1
+
+    Watches an incoming directory for LRIT/HRIT files and processes them as they arrive.
+    IMG segments are grouped by pass and added to its image as each segment arrives. Partial products, lines of missing
+    segments transparent, are written at most once per interval. A pass is final once all its segments are in, or after a timeout.
+    ADD payloads are extracted on a bounded process pool, pass images are written on threads,
+    and a bounded queue pushes back on the directory poller when workers fall behind.
+    """
+
+    stages = ("classify", "dedup", "extract", "assemble", "latency")
+
+    # Finalized passes remembered, so segments arriving after the timeout still update their product
+    finishedSize = 256
+
+    def __init__(self, incomingDir, outputDir, workers=None, queueSize=64, pollInterval=1.0, dedupPath=None, passTimeout=600.0, partial=True,
+                 partialInterval=5.0):
+        """
+        :param incomingDir: Directory to watch
+        :param outputDir: Directory for extracted payloads and assembled images
+        :param workers: Number of worker processes (default: CPU count)
+        :param queueSize: Files waiting to be processed before polling pauses
+        :param pollInterval: Seconds between directory scans
+        :param dedupPath: Skip files already processed, recorded in this seen-set database (see dedup.py)
+        :param passTimeout: Seconds after the first segment of a pass before it is finalized with segments missing
+        :param partial: Write partial products as segments arrive, instead of only the final one
+        :param partialInterval: Seconds between partial products of a pass, segments arriving meanwhile are written together
+        """
+
+        self.incomingDir = incomingDir
+        self.outputDir = outputDir
+        self.workers = workers or os.cpu_count() or 1
+        self.queueSize = queueSize
+        self.pollInterval = pollInterval
+
+        self.seen = {}  # Path -> (size, mtime) of files already queued
+        self.passTimeout = passTimeout
+        self.partial = partial
+        self.partialInterval = partialInterval
+
+        self.passes = {}  # Pass name -> PassTracker of passes still waiting for segments
+        self.finished = OrderedDict()  # Pass name -> PassTracker of finalized passes, oldest first
+        self.writing = {}  # Pass name -> asyncio.Event, set when segments arrive while its product is waiting or being written
+        self.writeTasks = set()
+        self.unrecorded = {}  # Pass name -> (path, fingerprint) of segments not yet in a written product
+        self.inFlight = set()  # (name, digest) of files being processed but not yet recorded in the seen-set
+        self.passesIncomplete = 0
+        self.queue = None
+        self.executor = None
+        self.threads = None
+        self.maxQueueDepth = 0
+        self.filesIgnored = 0
+        self.filesDuplicate = 0
+        self.dedup = DedupIndex(dedupPath) if dedupPath is not None else None
+        self.dedupExecutor = None  # One thread for seen-set queries and commits, off the event loop
+        self.stats = {stage: StageStats() for stage in self.stages}
+
+    def getStats(self):
+        """
+        Gets queue depth, pending passes and per-stage latency
+        :return: Dictionary of statistics
+        """
+
+        stats = {
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'queue_depth_max': self.maxQueueDepth,
+            'files_seen': len(self.seen),
+            'files_ignored': self.filesIgnored,
+            'files_duplicate': self.filesDuplicate,
+            'passes_pending': len(self.passes),
+            'passes_incomplete': self.passesIncomplete
+        }
+        for stage in self.stages:
+            stats[stage] = self.stats[stage].toDict()
+        return stats
+
+
+    # Directory polling
+    def scan(self):
+        """
+        Scans incoming directory for files that are new or changed, and completely written
+        :return: List of (path, size, mtime) tuples, oldest first
+        """
+
+        found = []
+        present = set()
+        with os.scandir(self.incomingDir) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(COMS.fileExtensions) or not entry.is_file():
+                    continue
+
+                present.add(entry.path)
+                stat = entry.stat()
+                if self.seen.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                if not self.isComplete(entry.path, stat.st_size):
+                    continue
+                found.append((entry.path, stat.st_size, stat.st_mtime_ns))
+
+        # Forget files that were removed, so a file written again with the same name is picked up
+        for path in self.seen.keys() - present:
+            del self.seen[path]
+
+        found.sort(key=lambda f: (f[2], f[0]))
+        return found
+
+    def isComplete(self, path, size):
+        """
+        Checks if a file has been completely written, using lengths from its primary header
+        :param path: File path
+        :param size: Current file size
+        :return: True if complete, or if the file is not LRIT/HRIT (it is then ignored later)
+        """
+
+        if size < 16:
+            return False
+
+        try:
+            with open(path, "rb") as lritFile:
+                header = lritFile.read(16)
+        except OSError:
+            return False
+
+        if header[:3] != b'\x00\x00\x10':
+            return True
+
+        fileType, totalHeaderLen, dataFieldLen = COMS.primaryLayout.unpack_from(header, 3)
+        return size >= totalHeaderLen + (dataFieldLen + 7) // 8  # Data length is in bits
+
+    async def poll(self, once=False):
+        """
+        Queues new files until cancelled. Blocks while the queue is full.
+        :param once: Stop after one scan
+        """
+
+        while True:
+            for path, size, mtime in self.scan():
+                self.seen[path] = (size, mtime)
+                await self.queue.put((path, time.monotonic()))
+                self.maxQueueDepth = max(self.maxQueueDepth, self.queue.qsize())
+
+            if once:
+                return
+            await asyncio.sleep(self.pollInterval)
+
+
+    # Processing
+    async def runStage(self, stage, func, *args, executor=None):
+        """
+        Runs a job on the process pool, timing it
+        :param stage: Stage name
+        :param func: Module level function
+        :param executor: Executor to run it on instead of the process pool
+        :return: Job result, or None if it failed
+        """
+
+        start = time.monotonic()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor or self.executor, func, *args)
+        except Exception as e:
+            self.stats[stage].errors += 1
+            print("{0} failed: {1}".format(stage, e), file=sys.stderr)
+            return None
+        self.stats[stage].add(time.monotonic() - start)
+        return result
+
+    async def dispatch(self, onProduct):
+        """
+        Takes files from the queue and routes them by file type, until cancelled
+        :param onProduct: Callback for each output, called with (kind, name, output path, latency seconds)
+        """
+
+        while True:
+            path, arrival = await self.queue.get()
+            try:
+                await self.process(path, arrival, onProduct)
+            except Exception as e:
+                print("{0}: {1}".format(path, e), file=sys.stderr)
+            finally:
+                self.queue.task_done()
+
+    async def process(self, path, arrival, onProduct):
+        """
+        Classifies one file and runs the stage it needs
+        :param path: File path
+        :param arrival: Monotonic time the file was found
+        :param onProduct: Output callback
+        """
+
+        # Headers are small, parse them in the event loop
+        start = time.monotonic()
+        try:
+            result = COMS.parse(path)
+        except (OSError, ValueError):
+            result = None
+        if result is None or not result.primaryHeader.valid:
+            self.filesIgnored += 1
+            self.stats['classify'].errors += 1
+            return
+        self.stats['classify'].add(time.monotonic() - start)
+
+        # Retransmitted copies are skipped before any work is queued. Hashing and seen-set queries run on threads.
+        # Files are only recorded as seen once their product is written, so failed files are retried after a restart.
+        # Until then they are in flight, so copies arriving meanwhile (e.g. from another antenna) are skipped too.
+        fingerprint = None
+        if self.dedup is not None:
+            start = time.monotonic()
+            loop = asyncio.get_running_loop()
+            fingerprint = await loop.run_in_executor(None, self.dedup.fingerprint, path, result)
+            status = await loop.run_in_executor(self.dedupExecutor, self.dedup.compare, fingerprint)
+            self.stats['dedup'].add(time.monotonic() - start)
+            if status in (DedupIndex.statusDuplicate, DedupIndex.statusStale) or fingerprint[:2] in self.inFlight:
+                self.filesDuplicate += 1
+                return
+            self.inFlight.add(fingerprint[:2])
+
+        fileType = result.primaryHeader.file_type
+        try:
+            if fileType == 0:
+                name = getPassName(result)
+                tracker = self.passes.get(name) or self.finished.get(name)
+                if tracker is None:
+                    tracker = self.passes[name] = PassTracker(name, result.imageSegmentationInformationHeader.get('segment_total', 1), arrival)
+                if fingerprint is not None:
+                    self.unrecorded.setdefault(name, []).append((path, fingerprint))
+                if tracker.add(result, arrival) and (self.partial or tracker.isComplete() or tracker.finalized):
+                    self.schedulePass(tracker, onProduct)
+                return
+            elif fileType in COMS.dataExtensions:
+                name = os.path.splitext(os.path.basename(path))[0]
+                outputPath = await self.runStage("extract", extractFile, path, self.outputDir)
+                kind = "data"
+            else:
+                self.filesIgnored += 1
+                outputPath = None
+        except Exception:
+            if fingerprint is not None:
+                self.inFlight.discard(fingerprint[:2])
+            raise
+
+        if outputPath is not None:
+            self.addProduct(onProduct, kind, name, outputPath, arrival)
+            if fingerprint is not None:
+                await self.recordSeen([(path, fingerprint)])
+        elif fingerprint is not None:
+            self.inFlight.discard(fingerprint[:2])  # Not processed, a later copy may be
+
+    async def recordSeen(self, files):
+        """
+        Records files in the seen-set once their product has been written, and takes them out of flight
+        :param files: List of (path, fingerprint) tuples
+        """
+
+        loop = asyncio.get_running_loop()
+        for path, fingerprint in files:
+            await loop.run_in_executor(self.dedupExecutor, self.dedup.check, path, None, fingerprint)
+            self.inFlight.discard(fingerprint[:2])
+
+    def addProduct(self, onProduct, kind, name, outputPath, arrival):
+        """
+        Records latency of an output and passes it to the callback
+        """
+
+        latency = time.monotonic() - arrival
+        self.stats['latency'].add(latency)
+        if onProduct is not None:
+            onProduct(kind, name, outputPath, latency)
+
+    def schedulePass(self, tracker, onProduct):
+        """
+        Starts writing the product of a pass, or wakes the write already waiting or running for it
+        :param tracker: PassTracker
+        :param onProduct: Output callback
+        """
+
+        if tracker.name in self.writing:
+            self.writing[tracker.name].set()
+            return
+
+        self.writing[tracker.name] = asyncio.Event()
+        task = asyncio.create_task(self.writePass(tracker, onProduct))
+        self.writeTasks.add(task)
+        task.add_done_callback(self.writeTasks.discard)
+
+    async def writePass(self, tracker, onProduct):
+        """
+        Writes the product of a pass from the segments received so far. Products are "partial" while segments
+        are missing, then "image" once complete, or "incomplete" if finalized by the timeout.
+        Only one write per pass runs at a time. Partial products are written at most every partialInterval seconds,
+        segments arriving meanwhile are added in one more write. Start with schedulePass().
+        :param tracker: PassTracker
+        :param onProduct: Output callback
+        """
+
+        name = tracker.name
+        wake = self.writing[name]
+        try:
+            while True:
+                wake.clear()
+                while not (tracker.isComplete() or tracker.finalized) and tracker.lastWrite is not None:
+                    wait = tracker.lastWrite + self.partialInterval - time.monotonic()
+                    if wait <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(wake.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    wake.clear()
+
+                if tracker.isComplete() or tracker.finalized:
+                    self.finishPass(tracker)
+                    kind = "image" if tracker.isComplete() else "incomplete"
+                else:
+                    kind = "partial"
+
+                segments = tracker.takePending()
+                arrival = tracker.lastArrival if segments else time.monotonic()
+                included = self.unrecorded.pop(name, [])
+                outputPath = await self.runStage("assemble", writePassImage, tracker, segments,
+                                                 os.path.join(self.outputDir, name + ".png"), tracker.getNumLines(), executor=self.threads)
+                tracker.lastWrite = time.monotonic()
+                if outputPath is not None:
+                    self.addProduct(onProduct, kind, name, outputPath, arrival)
+                    if included:
+                        await self.recordSeen(included)
+                    if kind != "partial" and not tracker.pending:
+                        tracker.release()  # Final product written, late segments rebuild the image
+                else:
+                    tracker.pending.update(segmentNum for segmentNum, path in segments)
+                    if included:
+                        self.unrecorded[name] = included + self.unrecorded.get(name, [])
+
+                if not wake.is_set():
+                    break
+        finally:
+            del self.writing[name]
+
+    def finishPass(self, tracker):
+        """
+        Moves a pass from pending to finalized
+        :param tracker: PassTracker
+        """
+
+        if self.passes.pop(tracker.name, None) is None:
+            return
+        tracker.finalized = True
+        if not tracker.isComplete():
+            self.passesIncomplete += 1
+
+        self.finished[tracker.name] = tracker
+        while len(self.finished) > self.finishedSize:
+            self.finished.popitem(last=False)
+
+    async def expire(self, onProduct, once=False):
+        """
+        Finalizes passes whose segments have not all arrived within the timeout, until cancelled
+        :param onProduct: Output callback
+        :param once: Finalize all pending passes now and return
+        """
+
+        while True:
+            now = time.monotonic()
+            for tracker in list(self.passes.values()):
+                if once or now - tracker.firstArrival >= self.passTimeout:
+                    tracker.finalized = True
+                    self.schedulePass(tracker, onProduct)
+
+            if once:
+                while self.writeTasks:
+                    await asyncio.gather(*self.writeTasks)
+                return
+            await asyncio.sleep(min(self.pollInterval, self.passTimeout))
+
+    async def run(self, onProduct=None, onStats=None, statsInterval=10.0, once=False):
+        """
+        Runs daemon until cancelled
+        :param onProduct: Callback for each output, called with (kind, name, output path, latency seconds)
+        :param onStats: Callback called with getStats() every statsInterval seconds
+        :param statsInterval: Seconds between onStats calls
+        :param once: Process files already in the incoming directory, then return
+        """
+
+        os.makedirs(self.outputDir, exist_ok=True)
+        self.queue = asyncio.Queue(maxsize=self.queueSize)
+
+        if self.dedup is not None:
+            self.dedupExecutor = ThreadPoolExecutor(max_workers=1)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as self.executor, ThreadPoolExecutor(max_workers=self.workers) as self.threads:
+            # One dispatcher per worker keeps at most one job per worker in flight
+            tasks = [asyncio.create_task(self.dispatch(onProduct)) for i in range(self.workers)]
+            if not once:
+                tasks.append(asyncio.create_task(self.expire(onProduct)))
+            if onStats is not None:
+                tasks.append(asyncio.create_task(self.report(onStats, statsInterval)))
+
+            try:
+                await self.poll(once)
+                await self.queue.join()
+                if once:
+                    # Nothing more will arrive, so passes still missing segments are final
+                    await self.expire(onProduct, once=True)
+            finally:
+                tasks += self.writeTasks
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if self.dedupExecutor is not None:
+                    self.dedupExecutor.shutdown()
+
+        if onStats is not None:
+            onStats(self.getStats())
+
+    async def report(self, onStats, interval):
+        """
+        Calls onStats periodically
+        :param onStats: Callback called with getStats()
+        :param interval: Seconds between calls
+        """
+
+        while True:
+            await asyncio.sleep(interval)
+            onStats(self.getStats())
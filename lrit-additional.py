@@ -7,37 +7,70 @@ Data includes Alpha-numeric text (ANT), CMDPS (CT/CTT/CTH), and GOCI.
 """
 
 import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from coms import COMS as comsClass
 
-argparser = argparse.ArgumentParser(description="Extracts data from LRIT Additional Data (ADD) files. Data includes Alpha-numeric text (ANT), CMDPS (CT/CTT/CTH), and GOCI.")
-argparser.add_argument("PATH", action="store", help="Input LRIT file")
-args = argparser.parse_args()
 
-# Create COMS class instance and load LRIT file
-COMS = comsClass(args.PATH)
+def extractFile(path, directory=None, printInfo=False):
+    """
+    Extracts data field of an ADD file
+    :param path: LRIT file path
+    :param directory: Output directory, defaults to directory of the LRIT file
+    :param printInfo: Print header information
+    :return: Tuple of (False if the file could not be read or extracted, message describing result)
+    """
 
-# Primary Header (type 0, required)
-COMS.parsePrimaryHeader(True)
+    try:
+        # Create COMS class instance and map LRIT file, only headers are read into memory
+        with comsClass(path, useMmap=True) as COMS:
+            # Walk all headers from Primary header (type 0, required) to end of headers, then print them in file order
+            headers = COMS.walkHeaders()
+            if not COMS.primaryHeader.valid:
+                raise ValueError("{0} invalid".format(comsClass.headerTypes[0]))
 
-# START OPTIONAL HEADERS
-COMS.parseAnnotationTextHeader(True)
+            if printInfo:
+                for record in headers:
+                    printer = comsClass.headerRegistry[record.header_type][2]
+                    if printer is not None:
+                        COMS.printHeader(printer)
 
-COMS.parseTimestampHeader(True)
+            if COMS.primaryHeader.get('file_type') not in comsClass.dataExtensions:
+                return True, "\"{0}\" is not an Additional Data file".format(path)
 
-COMS.parseKeyHeader(True)
+            # BEGIN DATA DUMPING
+            dumpFileName = COMS.extractDataField(directory)
+    except (OSError, ValueError) as e:
+        return False, "\"{0}\" could not be extracted: {1}".format(path, e)
 
-# BEGIN DATA DUMPING
-data = COMS.readbytes(0, COMS.primaryHeader['data_field_len'])
+    return True, "Additional Data dumped to \"{0}\"".format(dumpFileName)
 
-if COMS.primaryHeader['file_type'] == 2:  # Alphanumeric Text (ANT)
-    dumpExtension = "txt"
-elif COMS.primaryHeader['file_type'] == 128:  # CMDPS Data (CT, CTT, CTH)
-    dumpExtension = "png"
-elif COMS.primaryHeader['file_type'] == 132 or COMS.primaryHeader['file_type'] == 130:  # GOCI (seems to have 2 file type codes)
-    dumpExtension = "jpg"
 
-dumpFileName = COMS.path[:-5] + "_DATA.{0}".format(dumpExtension)
-dumpFile = open(dumpFileName, 'wb')
-dumpFile.write(data)
-dumpFile.close()
-print("\nAdditional Data dumped to \"{0}\"".format(dumpFileName))
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Extracts data from LRIT Additional Data (ADD) files. Data includes Alpha-numeric text (ANT), CMDPS (CT/CTT/CTH), and GOCI.")
+    argparser.add_argument("PATH", action="store", nargs="+", help="Input LRIT files, directories or glob patterns")
+    argparser.add_argument("-o", "--output", action="store", help="Output directory (default: next to input files)")
+    argparser.add_argument("-w", "--workers", action="store", type=int, default=4, help="Files extracted in parallel (default: 4)")
+    args = argparser.parse_args()
+
+    files = comsClass.findFiles(args.PATH)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    if len(files) == 1:
+        # Single file, show its headers
+        success, message = extractFile(files[0], args.output, True)
+        print("\n" + message, file=sys.stdout if success else sys.stderr)
+        failed += not success
+    else:
+        # Copies run in the kernel, so threads extract files in parallel
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for success, message in executor.map(extractFile, files, [args.output] * len(files)):
+                print(message, file=sys.stdout if success else sys.stderr)
+                failed += not success
+
+    # Every file is attempted before exiting, failures only set the exit status
+    if failed:
+        exit(1)
@@ -0,0 +1,70 @@
+"""
+lrit-bench.py
+https://github.com/sam210723/coms-1
+
+Generates synthetic LRIT/HRIT corpora and benchmarks parsing, extraction, assembly and calibration.
+"""
+
+import argparse
+import sys
+import time
+from benchmark import Benchmark
+from synthetic import CorpusGenerator
+
+
+def generate():
+    start = time.perf_counter()
+    paths = CorpusGenerator(args.DIRECTORY, args.hrit, args.sparse, args.seed, compression=args.compression).generate(args.count)
+    print("Generated {0} files in \"{1}\" ({2:.1f} s)".format(len(paths), args.DIRECTORY, time.perf_counter() - start))
+
+
+def run():
+    benchmark = Benchmark(args.PATH)
+    results = benchmark.run(args.case, args.repeat)
+
+    changes = {}
+    if args.compare:
+        changes = Benchmark.compare(results, args.compare, args.threshold)
+
+    print("{0} files, best of {1} runs".format(results['files'], args.repeat))
+    print("{0:<10} {1:>8} {2:>12} {3:>10} {4:>12} {5:>12}".format("Case", "Ops", "ops/s", "MB/s", "Peak RSS", "vs baseline"))
+    for name, result in results['cases'].items():
+        rss = "{0:.1f} MB".format(result['peak_rss_kb'] / 1024) if result['peak_rss_kb'] is not None else "-"
+        change = ""
+        if name in changes:
+            change = "{0:+.1f}%{1}".format(changes[name][0], " REGRESSED" if changes[name][1] else "")
+        print("{0:<10} {1:>8} {2:>12.1f} {3:>10.1f} {4:>12} {5:>12}".format(name, result['ops'], result['ops_per_s'], result['mb_per_s'], rss, change))
+
+    if args.save:
+        Benchmark.save(results, args.save)
+        print("Results saved to \"{0}\"".format(args.save))
+
+    # Non-zero exit status lets CI catch regressions
+    if any(regressed for change, regressed in changes.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Generates synthetic LRIT/HRIT corpora and benchmarks parsing, extraction, assembly and calibration.")
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+
+    generateParser = subparsers.add_parser("generate", help="Write a synthetic corpus")
+    generateParser.add_argument("DIRECTORY", action="store", help="Output directory")
+    generateParser.add_argument("-n", "--count", action="store", type=int, default=1000, help="Minimum number of files (default: 1000)")
+    generateParser.add_argument("--hrit", action="store_true", help="Generate HRIT (16 bit FD) instead of LRIT images")
+    generateParser.add_argument("--sparse", action="store_true", help="Leave data fields as sparse holes, for large header-only corpora")
+    generateParser.add_argument("--compression", action="store", type=int, choices=[0, 1, 2], default=0, help="Image compression: 0 none, 1 lossless JPEG, 2 lossy JPEG (default: 0)")
+    generateParser.add_argument("--seed", action="store", type=int, default=0, help="Random seed for Additional Data payloads")
+    generateParser.set_defaults(function=generate)
+
+    runParser = subparsers.add_parser("run", help="Run benchmarks over a corpus")
+    runParser.add_argument("PATH", action="store", nargs="+", help="Corpus files, directories or glob patterns")
+    runParser.add_argument("-c", "--case", action="append", choices=list(Benchmark.cases), help="Case to run, may be repeated (default: all)")
+    runParser.add_argument("-r", "--repeat", action="store", type=int, default=3, help="Runs per case, the fastest is kept (default: 3)")
+    runParser.add_argument("--save", action="store", help="Save results as JSON")
+    runParser.add_argument("--compare", action="store", help="Compare with results saved by --save, exit with status 1 on regression")
+    runParser.add_argument("--threshold", action="store", type=float, default=10.0, help="Slowdown in percent counted as a regression (default: 10)")
+    runParser.set_defaults(function=run)
+
+    args = argparser.parse_args()
+    args.function()
@@ -0,0 +1,38 @@
+"""
+lrit-composite.py
+https://github.com/sam210723/coms-1
+
+Combines LRIT/HRIT channels of the same time slot into false colour RGB and band math products, written as PNG.
+"""
+
+import argparse
+import os
+import time
+from composite import CompositeEngine
+from coms import COMS as comsClass
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Combines LRIT/HRIT channels of the same time slot into false colour RGB and band math products, written as PNG.")
+    argparser.add_argument("PATH", action="store", nargs="+", help="Input segment files, directories or glob patterns")
+    argparser.add_argument("-o", "--output", action="store", help="Output directory (default: next to input files)")
+    argparser.add_argument("-p", "--product", action="append", choices=list(CompositeEngine.products), help="Product to make, may be repeated (default: all the channels allow)")
+    argparser.add_argument("-w", "--workers", action="store", type=int, help="Channels decoded in parallel (default: CPU count)")
+    args = argparser.parse_args()
+
+    groups = CompositeEngine.groupFiles(comsClass.findFiles(args.PATH))
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    with CompositeEngine(args.workers) as engine:
+        for name, channelPaths in sorted(groups.items()):
+            start = time.perf_counter()
+            outputDir = args.output or os.path.dirname(next(iter(channelPaths.values()))[0])
+            outputPaths = engine.compose(name, channelPaths, outputDir, args.product)
+
+            if not outputPaths:
+                print("{0}: no products from channels {1}".format(name, ", ".join(sorted(channelPaths))))
+                continue
+            print("{0}: channels {1} ({2:.2f} s)".format(name, ", ".join(sorted(channelPaths)), time.perf_counter() - start))
+            for outputPath in outputPaths:
+                print("  -> \"{0}\"".format(outputPath))
@@ -0,0 +1,74 @@
+"""
+lrit-cube.py
+https://github.com/sam210723/coms-1
+
+Stores successive LRIT/HRIT image passes in memory-mapped time series cubes and renders animation frames from them.
+"""
+
+import argparse
+import os
+from datetime import datetime, timedelta
+from assembler import writePng
+from coms import COMS as comsClass
+from cube import CubeStore
+
+
+def parseTime(text):
+    return datetime.strptime(text, "%Y%m%d_%H%M%S")
+
+
+def append():
+    store = CubeStore(args.STORE, args.capacity, timedelta(hours=args.retention) if args.retention else None)
+    for name, timestamp in store.append(comsClass.findFiles(args.PATH)):
+        if timestamp is None:
+            print("{0}: pass outside retention window, skipped".format(name))
+        else:
+            print("{0}: {1:%Y-%m-%d %H:%M:%S} appended".format(name, timestamp))
+
+
+def listCubes():
+    store = CubeStore(args.STORE)
+    for name in store.getNames():
+        cube = store.getCube(name)
+        timestamps = cube.getTimestamps()
+        span = "{0:%Y-%m-%d %H:%M} to {1:%Y-%m-%d %H:%M}".format(timestamps[0], timestamps[-1]) if timestamps else "empty"
+        print("{0:<16} {1:>9} {2:<6} {3:>4}/{4} frames, {5}".format(
+            name, "{0}x{1}".format(cube.numCols, cube.numLines), str(cube.pixelType), len(cube), cube.capacity, span))
+
+
+def render():
+    cube = CubeStore(args.STORE).getCube(args.NAME)
+    timestamps, frames = cube.getFrames(args.start, args.end)
+    os.makedirs(args.output, exist_ok=True)
+
+    for timestamp, frame in zip(timestamps, frames):
+        outputPath = os.path.join(args.output, "{0}_{1:%Y%m%d_%H%M%S}.png".format(args.NAME, timestamp))
+        writePng(outputPath, frame)
+    print("{0} frames of {1} written to \"{2}\"".format(len(timestamps), args.NAME, args.output))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Stores successive LRIT/HRIT image passes in memory-mapped time series cubes and renders animation frames from them.")
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+
+    appendParser = subparsers.add_parser("append", help="Add image passes to their cubes")
+    appendParser.add_argument("STORE", action="store", help="Cube store directory")
+    appendParser.add_argument("PATH", action="store", nargs="+", help="Input segment files, directories or glob patterns")
+    appendParser.add_argument("-c", "--capacity", action="store", type=int, default=96, help="Frames kept by new cubes (default: 96)")
+    appendParser.add_argument("-r", "--retention", action="store", type=float, help="Hours of frames kept by new cubes, before the newest (default: capacity only)")
+    appendParser.set_defaults(function=append)
+
+    listParser = subparsers.add_parser("list", help="List cubes and their frames")
+    listParser.add_argument("STORE", action="store", help="Cube store directory")
+    listParser.set_defaults(function=listCubes)
+
+    renderParser = subparsers.add_parser("render", help="Write frames of one cube as PNG")
+    renderParser.add_argument("STORE", action="store", help="Cube store directory")
+    renderParser.add_argument("NAME", action="store", help="Cube name, e.g. ENH_IR1")
+    renderParser.add_argument("-o", "--output", action="store", required=True, help="Output directory")
+    renderParser.add_argument("-s", "--start", action="store", type=parseTime, help="First frame time, YYYYmmdd_HHMMSS")
+    renderParser.add_argument("-e", "--end", action="store", type=parseTime, help="Last frame time, YYYYmmdd_HHMMSS")
+    renderParser.set_defaults(function=render)
+
+    args = argparser.parse_args()
+    args.function()
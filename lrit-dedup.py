@@ -0,0 +1,32 @@
+"""
+lrit-dedup.py
+https://github.com/sam210723/coms-1
+
+Filters out LRIT/HRIT files already seen, by annotation text and content hash, printing paths of files still to process.
+"""
+
+import argparse
+import sys
+from coms import COMS as comsClass
+from dedup import DedupIndex
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Filters out LRIT/HRIT files already seen, by annotation text and content hash, printing paths of files still to process.")
+    argparser.add_argument("PATH", action="store", nargs="+", help="Input LRIT files, directories or glob patterns")
+    argparser.add_argument("-d", "--database", action="store", default="lrit-dedup.db", help="Seen-set database path (default: lrit-dedup.db)")
+    argparser.add_argument("-m", "--max-entries", action="store", type=int, default=1000000, help="Files remembered, least recently seen are forgotten first (default: 1000000)")
+    argparser.add_argument("-w", "--workers", action="store", type=int, default=4, help="Hashing threads (default: 4)")
+    argparser.add_argument("-v", "--verbose", action="store_true", help="Print status of every file instead of only files to process")
+    args = argparser.parse_args()
+
+    counts = {}
+    with DedupIndex(args.database, args.max_entries) as index:
+        for path, status in index.filter(comsClass.findFiles(args.PATH), args.workers):
+            counts[status] = counts.get(status, 0) + 1
+            if args.verbose:
+                print("{0:<9} {1}".format(status, path))
+            elif status in (DedupIndex.statusNew, DedupIndex.statusChanged):
+                print(path)
+
+    print(", ".join("{0} {1}".format(count, status) for status, count in sorted(counts.items())), file=sys.stderr)
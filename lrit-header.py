@@ -3,32 +3,238 @@ lrit-header.py
 https://github.com/sam210723/coms-1
 
 Parses LRIT file and displays header information in a human-readable format.
+Batch mode parses many files across a process pool and outputs one JSON or CSV record per file.
+Modules only needed for batch mode, metrics and profiling are imported when used, so single-file queries start quickly.
 """
 
 import argparse
+import os
+import sys
 from coms import COMS as comsClass
 
-argparser = argparse.ArgumentParser(description="Parses LRIT file and displays header information in a human-readable format.")
-argparser.add_argument("PATH", action="store", help="Input LRIT file")
-args = argparser.parse_args()
+# Columns in CSV output
+csvFields = ["path", "size", "error",
+             "file_type", "total_header_len", "data_field_len",
+             "bits_per_pixel", "num_cols", "num_lines", "image_type", "image_compression",
+             "projection", "longitude", "col_scaling", "line_scaling", "col_offset", "line_offset",
+             "data_definition_block_file", "text_data",
+             "t_field_day_count", "t_field_current_date", "t_field_millis", "t_field_current_time",
+             "key", "segment_num", "segment_total", "line_num_of_segment"]
 
-# Create COMS class instance and load LRIT file
-COMS = comsClass(args.PATH)
 
-# Primary Header (type 0, required)
-COMS.parsePrimaryHeader(True)
+def parseFields(text):
+    fields = text.split(",")
+    for name in fields:
+        if name not in csvFields:
+            raise argparse.ArgumentTypeError("unknown field \"{0}\" (choose from {1})".format(name, ", ".join(csvFields)))
+    return fields
 
-# START OPTIONAL HEADERS
-COMS.parseImageStructureHeader(True)
 
-COMS.parseImageNavigationHeader(True)
+def parseFile(path, ddbDirectory=None, fields=None):
+    """
+    Parses headers of a single file into a flat record. Failures are reported in the record.
+    :param path: LRIT file path
+    :param ddbDirectory: Export Data Definition Block into this directory ("" for next to the file, None to skip)
+    :param fields: Header fields to decode (default: all), path and size are always included
+    :return: Record dict
+    """
 
-COMS.parseImageDataFunctionHeader(True)
+    try:
+        result = comsClass.parse(path)
+        if not result.primaryHeader.valid:
+            raise ValueError("{0} invalid".format(comsClass.headerTypes[0]))
 
-COMS.parseAnnotationTextHeader(True)
+        if fields is None:
+            record = result.toRecord()
+            record.pop('data_definition_block', None)  # Too large for a record, see --ddb
+        else:
+            # Only headers holding the selected fields are decoded
+            record = {'path': path}
+            for name in fields:
+                value = result.getField(name)
+                if value is not None:
+                    record[name] = value
+        record['size'] = os.path.getsize(path)
+        if ddbDirectory is not None and result.imageDataFunctionHeader.valid:
+            record['data_definition_block_file'] = comsClass.exportDataDefinitionBlock(result, ddbDirectory or None)
+    except (OSError, ValueError) as e:
+        record = {'path': path, 'error': str(e)}
 
-COMS.parseTimestampHeader(True)
+    return record
 
-COMS.parseKeyHeader(True)
 
-COMS.parseImageSegmentationInformationHeader(True)
\ No newline at end of file
+def parseFiles(paths, ddbDirectory=None, collectMetrics=False, fields=None):
+    """
+    Parses a chunk of files in a worker process
+    :param paths: LRIT file paths
+    :param ddbDirectory: See parseFile()
+    :param collectMetrics: Instrument parsing and return the counters
+    :param fields: See parseFile()
+    :return: Tuple of (list of records, metrics snapshot or None)
+    """
+
+    import metrics
+
+    if collectMetrics:
+        metrics.enable()
+    records = [parseFile(path, ddbDirectory, fields) for path in paths]
+    snapshot = metrics.disable().toDict() if collectMetrics else None
+    return records, snapshot
+
+
+def printHeaders(path, ddbDirectory=None):
+    """
+    Parses file and prints header information to the console. Failures are reported on stderr.
+    :param path: LRIT file path
+    :param ddbDirectory: Export Data Definition Block into this directory ("" for next to the file, None to skip)
+    :return: True if the file was parsed
+    """
+
+    try:
+        # Create COMS class instance and map LRIT file
+        with comsClass(path, useMmap=True) as COMS:
+            # Walk all headers from Primary header (type 0, required) to end of headers, then print them in file order
+            headers = COMS.walkHeaders()
+            if not COMS.primaryHeader.valid:
+                raise ValueError("{0} invalid".format(comsClass.headerTypes[0]))
+
+            for record in headers:
+                printer = comsClass.headerRegistry[record.header_type][2]
+                if printer is not None:
+                    COMS.printHeader(printer)
+
+            if ddbDirectory is not None and COMS.imageDataFunctionHeader.valid:
+                print("Data Definition Block dumped to \"{0}\"\n".format(COMS.exportDataDefinitionBlock(COMS, ddbDirectory or None)))
+    except (OSError, ValueError) as e:
+        print("{0}: {1}".format(path, e), file=sys.stderr)
+        return False
+
+    return True
+
+
+def printFields(path, fields, ddbDirectory=None):
+    """
+    Parses file and prints selected field values on one line, tab separated ("-" for fields the file does not have)
+    :param path: LRIT file path
+    :param fields: Field names
+    :param ddbDirectory: See printHeaders()
+    :return: True if the file was parsed
+    """
+
+    record = parseFile(path, ddbDirectory, fields)
+    if 'error' in record:
+        print("{0}: {1}".format(path, record['error']), file=sys.stderr)
+        return False
+    print("\t".join(str(record.get(name, "-")) for name in fields))
+    return True
+
+
+def runBatch(files, outputFormat, workers, ddbDirectory=None, chunkSize=32, fields=None):
+    """
+    Parses files across a process pool, streaming one record per file to stdout
+    :param files: LRIT file paths
+    :param outputFormat: "json" for JSON lines or "csv"
+    :param workers: Number of worker processes, 0 to parse in this process
+    :param ddbDirectory: Export Data Definition Blocks into this directory ("" for next to each file, None to skip)
+    :param chunkSize: Files sent to a worker at a time
+    :param fields: Fields in each record (default: all)
+    :return: Number of files that failed to parse
+    """
+
+    import csv
+    import json
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    if outputFormat == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields or csvFields, extrasaction='ignore')
+        writer.writeheader()
+
+    # Workers have their own counters, merged into ours after each chunk
+    parentMetrics = comsClass.metrics
+    collectMetrics = parentMetrics is not None and workers > 0
+
+    startTime = time.perf_counter()
+    failed = 0
+    totalBytes = 0
+    chunks = [files[i:i + chunkSize] for i in range(0, len(files), chunkSize)]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    mapper = executor.map if executor is not None else map
+    try:
+        for records, snapshot in mapper(parseFiles, chunks, [ddbDirectory] * len(chunks), [collectMetrics] * len(chunks), [fields] * len(chunks)):
+            if snapshot is not None:
+                parentMetrics.merge(snapshot)
+
+            if parentMetrics is not None:
+                outputStart = time.perf_counter()
+            for record in records:
+                if 'error' in record:
+                    failed += 1
+                else:
+                    totalBytes += record['size']
+
+                if outputFormat == "csv":
+                    writer.writerow(record)
+                else:
+                    if fields is not None:
+                        record = {name: record[name] for name in fields + ['error'] if name in record}
+                    sys.stdout.write(json.dumps(record) + "\n")
+            if parentMetrics is not None:
+                parentMetrics.addStage("output", time.perf_counter() - outputStart)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = max(time.perf_counter() - startTime, 1e-9)
+
+    print("Parsed {0} files ({1} failed) in {2:.2f} s: {3:.1f} files/s, {4:.1f} MB/s".format(
+        len(files), failed, elapsed, len(files) / elapsed, totalBytes / elapsed / 1e6), file=sys.stderr)
+    return failed
+
+
+def main():
+    """
+    :return: Number of files that failed to parse
+    """
+
+    files = comsClass.findFiles(args.PATH)
+    if args.format == "text" and args.fields:
+        return sum(not printFields(path, args.fields, args.ddb) for path in files)
+    elif args.format == "text":
+        failed = 0
+        for path in files:
+            if len(files) > 1:
+                print("{0}:".format(path))
+            failed += not printHeaders(path, args.ddb)
+        return failed
+    else:
+        return runBatch(files, args.format, args.workers, args.ddb, fields=args.fields)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Parses LRIT file and displays header information in a human-readable format.")
+    argparser.add_argument("PATH", action="store", nargs="+", help="Input LRIT files, directories or glob patterns")
+    argparser.add_argument("-f", "--format", action="store", choices=["text", "json", "csv"], default="text", help="Output format, json and csv enable batch mode (default: text)")
+    argparser.add_argument("--ddb", action="store", nargs="?", const="", metavar="DIR", help="Dump Image Data Function Data Definition Blocks next to input files, or into DIR with one file per unique block")
+    argparser.add_argument("--fields", action="store", type=parseFields, metavar="FIELDS", help="Comma separated fields to output instead of all headers, e.g. segment_num,t_field_current_time (any CSV column)")
+    argparser.add_argument("-w", "--workers", action="store", type=int, default=os.cpu_count(), help="Worker processes in batch mode, 0 to parse in this process (default: CPU count)")
+    argparser.add_argument("--metrics", action="store", metavar="FILE", help="Write per-stage timers, byte counters and file type counts to FILE (.json for JSON, Prometheus text otherwise)")
+    argparser.add_argument("--profile", action="store", nargs="?", const="", metavar="FILE", help="Run under cProfile, printing top functions to stderr or saving to FILE. Use -w 0 to profile batch parsing.")
+    args = argparser.parse_args()
+
+    if args.metrics or args.profile is not None:
+        import metrics
+
+    if args.metrics:
+        metrics.enable()
+
+    if args.profile is not None:
+        failed = metrics.profile(main, path=args.profile or None)
+    else:
+        failed = main()
+
+    if args.metrics:
+        metrics.disable().write(args.metrics)
+
+    # Every file is reported before exiting, failures only set the exit status
+    if failed:
+        exit(1)
@@ -0,0 +1,72 @@
+"""
+lrit-image.py
+https://github.com/sam210723/coms-1
+
+Assembles LRIT/HRIT image segments into full images and writes them as PNG or raw pixels.
+A pixel or latitude/longitude box can be cropped, reading only the segment lines inside it.
+"""
+
+import argparse
+import os
+import sys
+from assembler import SegmentAssembler, getPassName, writePng
+from coms import COMS as comsClass
+from roi import RegionReader
+
+argparser = argparse.ArgumentParser(description="Assembles LRIT/HRIT image segments into full images and writes them as PNG or raw pixels.")
+argparser.add_argument("PATH", action="store", nargs="+", help="Input segment files, directories or glob patterns")
+argparser.add_argument("-o", "--output", action="store", help="Output directory (default: next to input files)")
+argparser.add_argument("-r", "--raw", action="store_true", help="Write raw pixels through a memory-mapped file instead of PNG")
+argparser.add_argument("-w", "--workers", action="store", type=int, help="Processes decoding compressed segments, 0 to decode in this process (default: CPU count)")
+region = argparser.add_mutually_exclusive_group()
+region.add_argument("-b", "--box", action="store", type=int, nargs=4, metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"), help="Crop to pixel box (0-based, right and bottom exclusive)")
+region.add_argument("-g", "--latlon", action="store", type=float, nargs=4, metavar=("NORTH", "SOUTH", "WEST", "EAST"), help="Crop to latitude/longitude box (degrees)")
+args = argparser.parse_args()
+
+# Group segments by image, using headers only
+images = {}
+failed = 0
+for result in comsClass.parseMany(comsClass.findFiles(args.PATH)):
+    if result.primaryHeader.valid and result.primaryHeader.file_type == 0:
+        images.setdefault(getPassName(result), []).append(result.path)
+
+for name, paths in sorted(images.items()):
+    outputDir = args.output or os.path.dirname(paths[0])
+    os.makedirs(outputDir or ".", exist_ok=True)
+    outputPath = os.path.join(outputDir, name + (".raw" if args.raw else ".png"))
+
+    if args.box or args.latlon:
+        # Read only the segment lines inside the box
+        outputPath = os.path.join(outputDir, name + ("_ROI.raw" if args.raw else "_ROI.png"))
+        reader = RegionReader(paths)
+        try:
+            box = args.box or reader.getPixelBox(*args.latlon)
+            image = reader.readPixels(*box)
+        except ValueError as e:
+            print("{0}: {1}".format(name, e), file=sys.stderr)
+            failed += 1
+            continue
+        if args.raw:
+            image.tofile(outputPath)
+        else:
+            writePng(outputPath, image)
+
+        print("{0}: {1}x{2} {3} at ({4}, {5}), {6:.1f} kB of {7:.1f} kB read -> \"{8}\"".format(
+            name, image.shape[1], image.shape[0], image.dtype, max(box[0], 0), max(box[1], 0),
+            reader.bytesRead / 1024, reader.numLines * reader.rowSize / 1024, outputPath))
+        continue
+
+    if args.raw:
+        assembler = SegmentAssembler.fromFiles(paths, rawPath=outputPath, workers=args.workers)
+        assembler.writeRaw()
+    else:
+        assembler = SegmentAssembler.fromFiles(paths, workers=args.workers)
+        assembler.writePng(outputPath)
+
+    image = assembler.getImage()
+    print("{0}: {1} of {2} segments, {3}x{4} {5} -> \"{6}\"".format(
+        name, len(assembler.received), assembler.segmentTotal, image.shape[1], image.shape[0], image.dtype, outputPath))
+
+# Every image is attempted before exiting, failures only set the exit status
+if failed:
+    exit(1)
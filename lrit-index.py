@@ -0,0 +1,44 @@
+"""
+lrit-index.py
+https://github.com/sam210723/coms-1
+
+Builds a persistent SQLite index of LRIT/HRIT header fields and queries it for file paths.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from archive import ArchiveIndex
+
+argparser = argparse.ArgumentParser(description="Builds a persistent SQLite index of LRIT/HRIT header fields and queries it for file paths.")
+argparser.add_argument("-d", "--database", action="store", default="lrit-index.db", help="Index database path (default: lrit-index.db)")
+subparsers = argparser.add_subparsers(dest="command", required=True)
+
+scanparser = subparsers.add_parser("scan", help="Index new and changed files")
+scanparser.add_argument("PATH", action="store", nargs="+", help="Input LRIT files, directories or glob patterns")
+scanparser.add_argument("-w", "--workers", action="store", type=int, default=4, help="Parser threads (default: 4)")
+scanparser.add_argument("--no-prune", action="store_true", help="Keep entries for files that no longer exist")
+
+queryparser = subparsers.add_parser("query", help="Print paths of indexed files matching all criteria")
+queryparser.add_argument("--file-type", action="store", type=int, help="File type, e.g. 0 for IMG")
+queryparser.add_argument("--image-type", action="store", type=int, help="Image type, e.g. 1 for ENH")
+queryparser.add_argument("--channel", action="store", help="Channel, e.g. IR1")
+queryparser.add_argument("--date", action="store", help="Day (YYYY-MM-DD)")
+queryparser.add_argument("--start", action="store", help="Earliest timestamp (YYYY-MM-DD HH:MM:SS)")
+queryparser.add_argument("--end", action="store", help="Latest timestamp, exclusive (YYYY-MM-DD HH:MM:SS)")
+queryparser.add_argument("--segment", action="store", type=int, help="Segment number")
+args = argparser.parse_args()
+
+with ArchiveIndex(args.database) as index:
+    if args.command == "scan":
+        indexed, removed = index.scan(args.PATH, workers=args.workers, prune=not args.no_prune)
+        print("Indexed {0} files, removed {1}, {2} files in index".format(indexed, removed, index.count()))
+    else:
+        start = args.start
+        end = args.end
+        if args.date:
+            day = datetime.strptime(args.date, "%Y-%m-%d")
+            start = day
+            end = day + timedelta(days=1)
+
+        for path in index.query(args.file_type, args.image_type, args.channel, start, end, args.segment):
+            print(path)
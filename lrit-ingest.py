@@ -0,0 +1,49 @@
+"""
+lrit-ingest.py
+https://github.com/sam210723/coms-1
+
+Watches a directory for incoming LRIT/HRIT files, assembling image passes and extracting Additional Data as files arrive.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from ingest import IngestDaemon
+
+
+def onProduct(kind, name, outputPath, latency):
+    """
+    Prints one JSON record per output
+    """
+    sys.stdout.write(json.dumps({'kind': kind, 'name': name, 'output': outputPath, 'latency_ms': round(latency * 1000, 3)}) + "\n")
+    sys.stdout.flush()
+
+
+def onStats(stats):
+    """
+    Prints queue depth and stage latency
+    """
+    print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Watches a directory for incoming LRIT/HRIT files, assembling image passes and extracting Additional Data as files arrive.")
+    argparser.add_argument("INCOMING", action="store", help="Directory to watch")
+    argparser.add_argument("-o", "--output", action="store", required=True, help="Output directory")
+    argparser.add_argument("-w", "--workers", action="store", type=int, help="Worker processes (default: CPU count)")
+    argparser.add_argument("-q", "--queue-size", action="store", type=int, default=64, help="Files queued before polling pauses (default: 64)")
+    argparser.add_argument("-i", "--interval", action="store", type=float, default=1.0, help="Seconds between directory scans (default: 1)")
+    argparser.add_argument("-s", "--stats", action="store", type=float, default=10.0, help="Seconds between statistics reports on stderr (default: 10)")
+    argparser.add_argument("-d", "--dedup", action="store", metavar="DATABASE", help="Skip retransmitted copies of files already processed, using this seen-set database")
+    argparser.add_argument("-t", "--timeout", action="store", type=float, default=600.0, help="Seconds after the first segment of a pass before it is written with segments missing (default: 600)")
+    argparser.add_argument("-p", "--partial-interval", action="store", type=float, default=5.0, help="Seconds between partial images of a pass, segments arriving meanwhile are written together (default: 5)")
+    argparser.add_argument("--no-partial", action="store_true", help="Only write images once complete or timed out, not as segments arrive")
+    argparser.add_argument("--once", action="store_true", help="Process files already in the directory, then exit")
+    args = argparser.parse_args()
+
+    daemon = IngestDaemon(args.INCOMING, args.output, args.workers, args.queue_size, args.interval, args.dedup, args.timeout, not args.no_partial, args.partial_interval)
+    try:
+        asyncio.run(daemon.run(onProduct, onStats, args.stats, args.once))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,115 @@
+"""
+lrit-pack.py
+https://github.com/sam210723/coms-1
+
+Packs directories of LRIT/HRIT files and their side files into single indexed containers, and unpacks them.
+"""
+
+import argparse
+import os
+from coms import COMS as comsClass
+from pack import Pack
+
+
+def findMembers(paths):
+    """
+    Expands files and directories into (path, member name) pairs. Directories are packed with all their files,
+    named relative to the directory.
+    """
+
+    members = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    filePath = os.path.join(root, name)
+                    members.append((filePath, os.path.relpath(filePath, path).replace(os.sep, "/")))
+        else:
+            members += [(filePath, os.path.basename(filePath)) for filePath in comsClass.findFiles([path])]
+    return members
+
+
+def pack():
+    members = [(path, name) for path, name in findMembers(args.PATH) if os.path.abspath(path) != os.path.abspath(args.PACK)]
+    members = list({(os.path.abspath(path), name): (path, name) for path, name in members}.values())  # Same file given twice
+
+    # A later file would hide an earlier one of the same name in the index, so duplicate names are rejected up front
+    paths = {}
+    for path, name in members:
+        paths.setdefault(name, []).append(path)
+    duplicates = sorted(name for name in paths if len(paths[name]) > 1)
+    if duplicates:
+        for name in duplicates:
+            print("Member name \"{0}\" is used by {1}".format(name, ", ".join("\"{0}\"".format(path) for path in paths[name])))
+        print("Nothing packed, pack files with the same name separately")
+        exit(1)
+
+    with Pack(args.PACK, "a") as container:
+        for path, name in members:
+            container.add(path, name)
+        count = len(container)
+
+    # Originals are only removed once the index is written and their contents can be read back from it
+    if args.remove:
+        with Pack(args.PACK) as container:
+            for path, name in members:
+                if name not in container:
+                    print("\"{0}\" is not in the pack, not removed".format(path))
+                    continue
+                with open(path, "rb") as originalFile, container.read(name) as packed:
+                    if packed != originalFile.read():
+                        print("\"{0}\" differs from its copy in the pack, not removed".format(path))
+                        continue
+                os.remove(path)
+    print("Packed {0} files into \"{1}\" ({2} files in pack)".format(len(members), args.PACK, count))
+
+
+def unpack():
+    count = 0
+    with Pack(args.PACK) as container:
+        for name in args.NAME or list(container.members):
+            if name not in container:
+                print("\"{0}\" is not in the pack".format(name))
+                continue
+            try:
+                container.extract(name, args.output)
+            except ValueError as e:
+                print(e)
+                continue
+            count += 1
+    print("Unpacked {0} files into \"{1}\"".format(count, args.output))
+
+
+def listMembers():
+    with Pack(args.PACK) as container:
+        for member in container.find(args.file_type):
+            timestamp = member.getDatetime()
+            print("{0:>10} {1:>4} {2:<19} {3}".format(
+                member.length, member.file_type if member.file_type is not None else "-",
+                timestamp.strftime("%Y-%m-%d %H:%M:%S") if timestamp else "-", member.name))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Packs directories of LRIT/HRIT files and their side files into single indexed containers, and unpacks them.")
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+
+    packParser = subparsers.add_parser("pack", help="Add files to a pack, creating it if needed")
+    packParser.add_argument("PACK", action="store", help="Pack file path")
+    packParser.add_argument("PATH", action="store", nargs="+", help="Directories (all files) or LRIT/HRIT files and glob patterns")
+    packParser.add_argument("--remove", action="store_true", help="Remove original files after packing")
+    packParser.set_defaults(function=pack)
+
+    unpackParser = subparsers.add_parser("unpack", help="Extract files from a pack")
+    unpackParser.add_argument("PACK", action="store", help="Pack file path")
+    unpackParser.add_argument("NAME", action="store", nargs="*", help="Member names (default: all)")
+    unpackParser.add_argument("-o", "--output", action="store", default=".", help="Output directory (default: current directory)")
+    unpackParser.set_defaults(function=unpack)
+
+    listParser = subparsers.add_parser("list", help="List files in a pack")
+    listParser.add_argument("PACK", action="store", help="Pack file path")
+    listParser.add_argument("--file-type", action="store", type=int, help="File type, e.g. 0 for IMG")
+    listParser.set_defaults(function=listMembers)
+
+    args = argparser.parse_args()
+    args.function()
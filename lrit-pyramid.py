@@ -0,0 +1,23 @@
+"""
+lrit-pyramid.py
+https://github.com/sam210723/coms-1
+
+Builds cached tile pyramids (zoom levels) of LRIT/HRIT images for web viewers, updating only tiles whose segments changed.
+"""
+
+import argparse
+from coms import COMS as comsClass
+from pyramid import PyramidCache
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Builds cached tile pyramids (zoom levels) of LRIT/HRIT images for web viewers, updating only tiles whose segments changed.")
+    argparser.add_argument("PATH", action="store", nargs="+", help="Input segment files, directories or glob patterns")
+    argparser.add_argument("-c", "--cache", action="store", required=True, help="Tile cache directory")
+    argparser.add_argument("-t", "--tile-size", action="store", type=int, default=256, help="Tile width and height in pixels (default: 256)")
+    argparser.add_argument("-m", "--max-size", action="store", type=float, default=1024, help="Cache size in MB, least recently used pyramids are removed beyond it (default: 1024)")
+    args = argparser.parse_args()
+
+    cache = PyramidCache(args.cache, int(args.max_size * 1024 * 1024), args.tile_size)
+    for name, written, total in cache.build(comsClass.findFiles(args.PATH)):
+        print("{0}: {1} of {2} tiles written".format(name, written, total))
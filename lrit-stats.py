@@ -0,0 +1,52 @@
+"""
+lrit-stats.py
+https://github.com/sam210723/coms-1
+
+Summarizes LRIT/HRIT image passes per channel: count range and mean, calibrated percentiles and histograms, without assembling images.
+"""
+
+import argparse
+import json
+import sys
+from coms import COMS as comsClass
+from segstats import StatsEngine
+
+
+def parsePercentiles(text):
+    return [float(p) for p in text.split(",")]
+
+
+def printStats(name, stats):
+    if args.json:
+        record = stats.toDict(args.percentiles, args.bins)
+        record['name'] = name
+        sys.stdout.write(json.dumps(record) + "\n")
+        return
+
+    unit = stats.calibration.unit if stats.calibration is not None else "COUNT"
+    percentiles = ", ".join("P{0:g} {1}".format(p, "-" if value is None else "{0:.2f}".format(value))
+                            for p, value in zip(args.percentiles, stats.getPercentiles(args.percentiles)))
+    mean = stats.getMean()
+    print("{0}: {1} segments, {2} pixels, counts {3}-{4}, mean {5}".format(
+        name, stats.segments, stats.getPixels(), stats.getMin(), stats.getMax(), "-" if mean is None else "{0:.2f}".format(mean)))
+    print("  {0} ({1}): {2}".format(stats.channel, unit, percentiles))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Summarizes LRIT/HRIT image passes per channel: count range and mean, calibrated percentiles and histograms, without assembling images.")
+    argparser.add_argument("PATH", action="store", nargs="+", help="Input segment files, directories or glob patterns")
+    argparser.add_argument("-p", "--percentiles", action="store", type=parsePercentiles, default=[1, 5, 50, 95, 99], help="Comma separated percentiles of calibrated values (default: 1,5,50,95,99)")
+    argparser.add_argument("-b", "--bins", action="store", type=int, default=256, help="Histogram bins in JSON output (default: 256)")
+    argparser.add_argument("-j", "--json", action="store_true", help="Print one JSON line per pass and channel, including histograms")
+    argparser.add_argument("-w", "--workers", action="store", type=int, help="Worker processes, 0 to read in this process (default: CPU count)")
+    args = argparser.parse_args()
+
+    with StatsEngine(args.workers) as engine:
+        for name, stats in engine.summarize(comsClass.findFiles(args.PATH)):
+            printStats(name, stats)
+
+        # Totals of all passes, per channel
+        if not args.json:
+            print()
+        for (channel, bitsPerPixel), stats in sorted(engine.channels.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            printStats("ALL_{0}{1}".format("HRIT_" if bitsPerPixel == 16 else "", channel), stats)
@@ -0,0 +1,73 @@
+"""
+lrit-stream.py
+https://github.com/sam210723/coms-1
+
+Parses a stream of concatenated LRIT/HRIT files from stdin or TCP, without writing them to disk first.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import stream
+
+
+def parseAddress(address):
+    """
+    Splits "host:port" string
+    :param address: Address string
+    :return: Tuple of (host, port)
+    """
+    host, sep, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def onEvent(event):
+    """
+    Prints one JSON record per completed file, optionally saving it
+    :param event: StreamEvent
+    """
+
+    if event.kind == "headers":
+        return
+
+    record = event.headers.toRecord()
+    record.pop('data_definition_block', None)
+    record['event'] = event.kind
+
+    if event.kind == "file" and args.output:
+        outputPath = os.path.join(args.output, os.path.basename(event.headers.path))
+        with open(outputPath, "wb") as outputFile:
+            outputFile.write(event.data)
+        record['output'] = outputPath
+
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+async def main():
+    if args.listen:
+        host, port = parseAddress(args.listen)
+        server = await stream.serveTcp(host, port, onEvent, args.max_size)
+        print("Listening on {0}:{1}".format(*server.sockets[0].getsockname()[:2]), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+    elif args.connect:
+        host, port = parseAddress(args.connect)
+        await stream.connectTcp(host, port, onEvent, args.max_size)
+    else:
+        await stream.readStdin(onEvent, args.max_size)
+
+
+argparser = argparse.ArgumentParser(description="Parses a stream of concatenated LRIT/HRIT files from stdin or TCP, without writing them to disk first.")
+argparser.add_argument("-l", "--listen", action="store", metavar="HOST:PORT", help="Accept TCP connections carrying xRIT streams")
+argparser.add_argument("-c", "--connect", action="store", metavar="HOST:PORT", help="Connect to a TCP server sending an xRIT stream")
+argparser.add_argument("-o", "--output", action="store", help="Save completed files into this directory")
+argparser.add_argument("--max-size", action="store", type=int, default=64 * 1024 * 1024, help="Largest file to buffer in bytes, larger files are skipped (default: 64 MiB)")
+args = argparser.parse_args()
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    pass
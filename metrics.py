@@ -0,0 +1,154 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+from coms import COMS
+
+
+class Metrics:
+    """
+    metrics.py
+    https://github.com/sam210723/coms-1
+
+    Per-stage timers and byte counters, and per-file-type counts, filled in by COMS and the assembler while enabled.
+    Instrumentation is skipped entirely while COMS.metrics is None, so it costs one attribute check when disabled.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # parseMany() parses on threads
+        self.stages = {}  # Stage name -> [calls, seconds, bytes]
+        self.fileTypes = {}  # File type -> files parsed
+
+    def addStage(self, stage, seconds, size=0):
+        """
+        Records one call of a stage
+        :param stage: Stage name, e.g. "load" or "parsePrimaryHeader"
+        :param seconds: Time spent
+        :param size: Bytes processed
+        """
+
+        with self.lock:
+            counters = self.stages.get(stage)
+            if counters is None:
+                counters = self.stages[stage] = [0, 0.0, 0]
+            counters[0] += 1
+            counters[1] += seconds
+            counters[2] += size
+
+    def addFile(self, fileType):
+        """
+        Counts a file with a valid primary header
+        :param fileType: File type, see COMS.fileTypes
+        """
+
+        with self.lock:
+            self.fileTypes[fileType] = self.fileTypes.get(fileType, 0) + 1
+
+    def merge(self, snapshot):
+        """
+        Adds counters from another process
+        :param snapshot: Dictionary from toDict()
+        """
+
+        with self.lock:
+            for stage, values in snapshot['stages'].items():
+                counters = self.stages.setdefault(stage, [0, 0.0, 0])
+                counters[0] += values['calls']
+                counters[1] += values['seconds']
+                counters[2] += values['bytes']
+            for fileType, count in snapshot['file_types'].items():
+                self.fileTypes[int(fileType)] = self.fileTypes.get(int(fileType), 0) + count
+
+    def toDict(self):
+        """
+        Gets snapshot of all counters
+        :return: Dictionary of stages and file types, JSON serialisable
+        """
+
+        with self.lock:
+            return {
+                'stages': {stage: {'calls': calls, 'seconds': round(seconds, 9), 'bytes': size}
+                           for stage, (calls, seconds, size) in sorted(self.stages.items())},
+                'file_types': {str(fileType): count for fileType, count in sorted(self.fileTypes.items())}
+            }
+
+    def toPrometheus(self):
+        """
+        Formats counters in the Prometheus text exposition format
+        :return: Metrics text
+        """
+
+        snapshot = self.toDict()
+        lines = []
+        for name, key, description in (("coms_stage_calls_total", 'calls', "Calls of each processing stage"),
+                                       ("coms_stage_seconds_total", 'seconds', "Time spent in each processing stage"),
+                                       ("coms_stage_bytes_total", 'bytes', "Bytes processed by each processing stage")):
+            lines.append("# HELP {0} {1}".format(name, description))
+            lines.append("# TYPE {0} counter".format(name))
+            for stage, values in snapshot['stages'].items():
+                lines.append("{0}{{stage=\"{1}\"}} {2}".format(name, stage, values[key]))
+
+        lines.append("# HELP coms_files_total Files parsed by file type")
+        lines.append("# TYPE coms_files_total counter")
+        for fileType, count in snapshot['file_types'].items():
+            lines.append("coms_files_total{{file_type=\"{0}\"}} {1}".format(fileType, count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes counters to a file, replacing it atomically (as the Prometheus textfile collector requires)
+        :param path: Output path, ".json" for JSON, anything else for Prometheus text
+        """
+
+        if path.endswith(".json"):
+            text = json.dumps(self.toDict(), indent=2)
+        else:
+            text = self.toPrometheus()
+
+        tempPath = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tempPath, "w") as metricsFile:
+            metricsFile.write(text)
+        os.replace(tempPath, path)
+
+
+def enable(metrics=None):
+    """
+    Turns on instrumentation in this process
+    :param metrics: Metrics instance to fill in (default: a new one)
+    :return: Metrics instance
+    """
+
+    COMS.metrics = metrics if metrics is not None else Metrics()
+    return COMS.metrics
+
+
+def disable():
+    """
+    Turns off instrumentation in this process
+    :return: Metrics instance that was in use, or None
+    """
+
+    metrics = COMS.metrics
+    COMS.metrics = None
+    return metrics
+
+
+def profile(function, *args, path=None, limit=30):
+    """
+    Runs a function under cProfile
+    :param function: Function to run
+    :param path: Save profile to this path (for pstats/snakeviz), or print top functions to stderr if None
+    :param limit: Number of functions printed
+    :return: Function result
+    """
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        if path is not None:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(limit)
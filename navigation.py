@@ -0,0 +1,190 @@
+import os
+from collections import OrderedDict
+import numpy as np
+
+
+class Navigation:
+    """
+    navigation.py
+    https://github.com/sam210723/coms-1
+
+    Normalized Geostationary Projection (GEOS) pixel <-> latitude/longitude conversion,
+    following the CGMS LRIT/HRIT Global Specification (section 4.4).
+    """
+
+    # Earth and orbit constants (km)
+    satelliteDistance = 42164.0  # From centre of earth
+    equatorRadius = 6378.169
+    polarRadius = 6356.5838
+
+    # Cached grids, in memory (least recently used evicted first) and optionally on disk
+    gridCache = OrderedDict()
+    gridCacheSize = 8
+    gridCacheDir = None
+
+    def __init__(self, longitude, colScaling, lineScaling, colOffset, lineOffset):
+        """
+        :param longitude: Sub-satellite longitude (degrees east)
+        :param colScaling: Column scaling factor (CFAC)
+        :param lineScaling: Line scaling factor (LFAC)
+        :param colOffset: Column offset (COFF)
+        :param lineOffset: Line offset (LOFF)
+        """
+
+        self.longitude = float(longitude)
+        self.colScaling = self.toSigned(colScaling)
+        self.lineScaling = self.toSigned(lineScaling)
+        self.colOffset = colOffset
+        self.lineOffset = lineOffset
+
+    def __repr__(self):
+        return "Navigation({0})".format(", ".join(str(p) for p in self.getParameters()))
+
+    @classmethod
+    def fromHeader(cls, lrit):
+        """
+        Creates navigation from Image Navigation header of a parsed file
+        :param lrit: COMS instance or ParseResult
+        :return: Navigation
+        """
+
+        header = lrit.imageNavigationHeader
+        if not header.valid:
+            raise ValueError("No Image Navigation header")
+        return cls(header.longitude, header.col_scaling, header.line_scaling, header.col_offset, header.line_offset)
+
+    @staticmethod
+    def toSigned(value):
+        """
+        Interprets unsigned 32 bit header value as signed (COMS stores LFAC as a negative number)
+        :param value: Unsigned integer
+        :return: Signed integer
+        """
+        return value - (1 << 32) if value >= (1 << 31) else value
+
+    def getParameters(self):
+        """
+        Gets tuple of navigation parameters, used as cache key
+        :return: Tuple of (longitude, CFAC, LFAC, COFF, LOFF)
+        """
+        return (self.longitude, self.colScaling, self.lineScaling, self.colOffset, self.lineOffset)
+
+
+    # Conversion methods
+    def pixelToLatLon(self, cols, lines):
+        """
+        Converts image pixel coordinates to latitude/longitude
+        :param cols: Column numbers (1-based, may be fractional), scalar or NumPy array
+        :param lines: Line numbers of the full image (1-based), scalar or NumPy array
+        :return: Tuple of (latitude, longitude) in degrees, NaN where pixel is off the earth
+        """
+
+        h = self.satelliteDistance
+        k = (self.equatorRadius / self.polarRadius) ** 2
+
+        # Intermediate coordinates (scan angles). Lines count from north to south regardless of LFAC sign.
+        x = np.deg2rad((np.asarray(cols, dtype=np.float64) - self.colOffset) * 65536.0 / self.colScaling)
+        y = np.deg2rad((np.asarray(lines, dtype=np.float64) - self.lineOffset) * 65536.0 / abs(self.lineScaling))
+
+        cosX = np.cos(x)
+        cosY = np.cos(y)
+        sinY = np.sin(y)
+        a = cosY * cosY + k * sinY * sinY
+
+        sd2 = (h * cosX * cosY) ** 2 - a * (h * h - self.equatorRadius ** 2)
+        with np.errstate(invalid="ignore"):
+            sd = np.sqrt(np.where(sd2 < 0, np.nan, sd2))
+        sn = (h * cosX * cosY - sd) / a
+
+        s1 = h - sn * cosX * cosY
+        s2 = sn * np.sin(x) * cosY
+        s3 = -sn * sinY
+        sxy = np.hypot(s1, s2)
+
+        lat = np.rad2deg(np.arctan(k * s3 / sxy))
+        lon = np.rad2deg(np.arctan(s2 / s1)) + self.longitude
+        return lat, lon
+
+    def latLonToPixel(self, lat, lon):
+        """
+        Converts latitude/longitude to image pixel coordinates
+        :param lat: Latitude (degrees), scalar or NumPy array
+        :param lon: Longitude (degrees east), scalar or NumPy array
+        :return: Tuple of (columns, lines), 1-based and fractional, NaN where not visible from the satellite
+        """
+
+        h = self.satelliteDistance
+        e2 = 1 - (self.polarRadius / self.equatorRadius) ** 2
+
+        latRad = np.deg2rad(np.asarray(lat, dtype=np.float64))
+        lonRad = np.deg2rad(np.asarray(lon, dtype=np.float64) - self.longitude)
+
+        cLat = np.arctan((1 - e2) * np.tan(latRad))  # Geocentric latitude
+        cosCLat = np.cos(cLat)
+        rl = self.polarRadius / np.sqrt(1 - e2 * cosCLat * cosCLat)
+
+        r1 = h - rl * cosCLat * np.cos(lonRad)
+        r2 = -rl * cosCLat * np.sin(lonRad)
+        r3 = rl * np.sin(cLat)
+        rn = np.sqrt(r1 * r1 + r2 * r2 + r3 * r3)
+
+        x = np.rad2deg(np.arctan(-r2 / r1))
+        y = np.rad2deg(np.arcsin(-r3 / rn))
+
+        visible = (h - r1) * h > rl * rl
+        cols = np.where(visible, self.colOffset + x * self.colScaling / 65536.0, np.nan)
+        lines = np.where(visible, self.lineOffset + y * abs(self.lineScaling) / 65536.0, np.nan)
+        return cols, lines
+
+
+    # Grid methods
+    def getGrid(self, numCols, numLines, firstLine=1):
+        """
+        Gets latitude/longitude of every pixel of an image or segment. Grids are cached in memory and,
+        if gridCacheDir is set, on disk as .npy files keyed by navigation parameters.
+        :param numCols: Number of columns
+        :param numLines: Number of lines
+        :param firstLine: Line number of first line in the full image (line_num_of_segment for segments)
+        :return: Tuple of (latitude, longitude) float32 arrays shaped (numLines, numCols), read-only
+        """
+
+        key = self.getParameters() + (numCols, numLines, firstLine)
+        grid = self.gridCache.get(key)
+        if grid is not None:
+            self.gridCache.move_to_end(key)
+            return grid[0], grid[1]
+
+        cachePath = None
+        if self.gridCacheDir is not None:
+            cachePath = os.path.join(self.gridCacheDir, "geos_{0}.npy".format("_".join(str(k) for k in key)))
+
+        if cachePath is not None and os.path.exists(cachePath):
+            grid = np.load(cachePath, mmap_mode="r")
+        else:
+            cols = np.arange(1, numCols + 1, dtype=np.float64)
+            lines = np.arange(firstLine, firstLine + numLines, dtype=np.float64)
+            lat, lon = self.pixelToLatLon(cols[np.newaxis, :], lines[:, np.newaxis])
+            grid = np.stack((lat, lon)).astype(np.float32)
+            grid.flags.writeable = False
+
+            if cachePath is not None:
+                os.makedirs(self.gridCacheDir, exist_ok=True)
+                tempPath = "{0}.{1}.tmp.npy".format(cachePath[:-4], os.getpid())
+                np.save(tempPath, grid)
+                os.replace(tempPath, cachePath)
+
+        self.gridCache[key] = grid
+        if len(self.gridCache) > self.gridCacheSize:
+            self.gridCache.popitem(last=False)
+        return grid[0], grid[1]
+
+    def getSegmentGrid(self, lrit):
+        """
+        Gets latitude/longitude grid for a segment of a parsed file
+        :param lrit: COMS instance or ParseResult
+        :return: Tuple of (latitude, longitude) float32 arrays
+        """
+
+        structure = lrit.imageStructureHeader
+        firstLine = lrit.imageSegmentationInformationHeader.get('line_num_of_segment', 1)
+        return self.getGrid(structure.num_cols, structure.num_lines, firstLine)
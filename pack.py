@@ -0,0 +1,297 @@
+import mmap
+import os
+import struct
+from datetime import timedelta
+from coms import COMS
+
+
+class PackMember:
+    """
+    Index entry of one file in a pack. Header fields are None for files that are not LRIT/HRIT (e.g. _DATA side files).
+    """
+
+    __slots__ = ('name', 'offset', 'length', 'file_type', 'total_header_len', 'data_field_len', 'timestamp')
+
+    def __init__(self, name, offset, length, file_type=None, total_header_len=None, data_field_len=None, timestamp=None):
+        self.name = name
+        self.offset = offset
+        self.length = length
+        self.file_type = file_type
+        self.total_header_len = total_header_len
+        self.data_field_len = data_field_len
+        self.timestamp = timestamp  # Milliseconds since the CDS epoch
+
+    def __repr__(self):
+        return "PackMember({0!r}, {1} bytes at {2})".format(self.name, self.length, self.offset)
+
+    def getDatetime(self):
+        """
+        Gets timestamp as a datetime
+        :return: Datetime (UTC), or None
+        """
+        return COMS.cdsEpoch + timedelta(milliseconds=self.timestamp) if self.timestamp is not None else None
+
+
+class Pack:
+    """
+    pack.py
+    https://github.com/sam210723/coms-1
+
+    Single-file container for many LRIT/HRIT files and their side files.
+    Files are stored back to back, followed by an index of name, offset, length and key header fields, and a footer.
+    Appending writes new files after the old footer, so the pack stays readable if appending is interrupted.
+    Members are opened from one memory map of the pack, without extracting them.
+    """
+
+    magic = b"COMSPACK"
+    footerLayout = struct.Struct(">8sQI")  # Magic, index offset, member count
+    entryLayout = struct.Struct(">QQBIQqH")  # Offset, length, file type, total header length, data field length, timestamp, name length
+    noFileType = 0xFF  # File type stored for files that are not LRIT/HRIT
+
+    def __init__(self, path, mode="r"):
+        """
+        Opens a pack
+        :param path: Pack file path
+        :param mode: "r" to read, "a" to append (creating the pack if needed)
+        """
+
+        self.path = path
+        self.mode = mode
+        self.members = {}  # Name -> PackMember, later files replace earlier ones of the same name
+        self.packMap = None
+        self.packView = None
+        self.changed = False
+
+        if mode == "a" and not os.path.exists(path):
+            self.packFile = open(path, "w+b", buffering=0)
+            self.packFile.write(self.magic)
+            self.changed = True
+            return
+
+        self.packFile = open(path, "r+b" if mode == "a" else "rb", buffering=0)
+        self.readIndex()
+        if mode == "a":
+            self.packFile.seek(0, os.SEEK_END)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def close(self):
+        """
+        Writes the index if files were added, then releases the file and memory map.
+        Members opened with open() or read() are invalid after closing.
+        """
+
+        if self.changed:
+            self.writeIndex()
+        self.releaseMap()
+        self.packFile.close()
+
+    def releaseMap(self):
+        if self.packView is not None:
+            self.packView.release()
+            self.packView = None
+        if self.packMap is not None:
+            try:
+                self.packMap.close()
+            except BufferError:
+                pass  # Caller still holds a member view, map is freed with the last one
+            self.packMap = None
+
+
+    # Index methods
+    def readIndex(self):
+        """
+        Reads index from the last complete footer. Data after it, left by an interrupted append, is ignored
+        (and truncated when appending).
+        """
+
+        size = os.fstat(self.packFile.fileno()).st_size
+        if size < len(self.magic) + self.footerLayout.size:
+            raise ValueError("\"{0}\" is not a pack".format(self.path))
+
+        with mmap.mmap(self.packFile.fileno(), 0, access=mmap.ACCESS_READ) as packMap:
+            if packMap[:len(self.magic)] != self.magic:
+                raise ValueError("\"{0}\" is not a pack".format(self.path))
+
+            # Normally the footer is at the very end, otherwise search back for one whose index ends at it
+            end = size
+            while True:
+                position = packMap.rfind(self.magic, len(self.magic), end)
+                if position < 0:
+                    raise ValueError("\"{0}\" has no complete index".format(self.path))
+                members = self.parseIndex(packMap, position)
+                if members is not None:
+                    break
+                end = position + len(self.magic) - 1
+
+        self.members = members
+        if position + self.footerLayout.size < size and self.mode == "a":
+            self.packFile.truncate(position + self.footerLayout.size)
+
+    def parseIndex(self, data, position):
+        """
+        Parses index of a footer
+        :param data: Pack contents
+        :param position: Footer offset
+        :return: Dictionary of name -> PackMember, or None if this is not a valid footer
+        """
+
+        if position + self.footerLayout.size > len(data):
+            return None
+        magic, indexOffset, count = self.footerLayout.unpack_from(data, position)
+        if not len(self.magic) <= indexOffset <= position:
+            return None
+
+        members = {}
+        offset = indexOffset
+        try:
+            for i in range(count):
+                memberOffset, length, fileType, totalHeaderLen, dataFieldLen, timestamp, nameLength = self.entryLayout.unpack_from(data, offset)
+                offset += self.entryLayout.size
+                name = data[offset:offset + nameLength].decode('utf-8')
+                offset += nameLength
+
+                if fileType == self.noFileType:
+                    members[name] = PackMember(name, memberOffset, length)
+                else:
+                    members[name] = PackMember(name, memberOffset, length, fileType, totalHeaderLen, dataFieldLen, timestamp if timestamp >= 0 else None)
+        except (struct.error, UnicodeDecodeError):
+            return None
+
+        return members if offset == position else None
+
+    def writeIndex(self):
+        """
+        Writes index and footer after the last file
+        """
+
+        entries = []
+        for member in self.members.values():
+            name = member.name.encode('utf-8')
+            if member.file_type is None:
+                fields = (self.noFileType, 0, 0, -1)
+            else:
+                fields = (member.file_type, member.total_header_len, member.data_field_len, member.timestamp if member.timestamp is not None else -1)
+            entries.append(self.entryLayout.pack(member.offset, member.length, *fields, len(name)) + name)
+
+        self.packFile.seek(0, os.SEEK_END)
+        indexOffset = self.packFile.tell()
+        self.packFile.write(b"".join(entries) + self.footerLayout.pack(self.magic, indexOffset, len(entries)))
+        self.changed = False
+
+
+    # Writing methods
+    def add(self, path, name=None):
+        """
+        Appends a file. Header fields are indexed if it is an LRIT/HRIT file.
+        :param path: File path
+        :param name: Member name (default: file name)
+        :return: PackMember
+        """
+
+        if self.mode != "a":
+            raise ValueError("Pack is not open for appending")
+        name = name or os.path.basename(path)
+
+        member = PackMember(name, 0, 0)
+        try:
+            result = COMS.parse(path)
+            if result.primaryHeader.valid:
+                primary = result.primaryHeader
+                member.file_type = primary.file_type
+                member.total_header_len = primary.total_header_len
+                member.data_field_len = primary.data_field_len
+                if result.timestampHeader.valid:
+                    member.timestamp = result.timestampHeader.t_field_day_count * 86400000 + result.timestampHeader.t_field_millis
+        except (ValueError, IndexError, struct.error):
+            pass  # Not an LRIT/HRIT file, stored without header fields
+
+        # Kernel copy straight from the file to the end of the pack
+        self.releaseMap()
+        self.packFile.seek(0, os.SEEK_END)
+        member.offset = self.packFile.tell()
+        with open(path, "rb") as sourceFile:
+            member.length = COMS.copyRange(sourceFile, self.packFile, 0, os.fstat(sourceFile.fileno()).st_size)
+
+        self.members[name] = member
+        self.changed = True
+        return member
+
+
+    # Reading methods
+    def find(self, fileType=None, start=None, end=None):
+        """
+        Finds members by index fields, without reading them
+        :param fileType: File type (see COMS.fileTypes)
+        :param start: Earliest timestamp, datetime (inclusive)
+        :param end: Latest timestamp, datetime (exclusive)
+        :return: List of PackMember in pack order
+        """
+
+        members = []
+        for member in sorted(self.members.values(), key=lambda m: m.offset):
+            if fileType is not None and member.file_type != fileType:
+                continue
+            if (start is not None or end is not None) and member.timestamp is None:
+                continue
+            if start is not None and member.getDatetime() < start:
+                continue
+            if end is not None and member.getDatetime() >= end:
+                continue
+            members.append(member)
+        return members
+
+    def read(self, name):
+        """
+        Gets contents of a member
+        :param name: Member name
+        :return: Zero-copy memoryview of the pack memory map
+        """
+
+        member = self.members[name]
+        if self.packView is None:
+            self.packMap = mmap.mmap(self.packFile.fileno(), 0, access=mmap.ACCESS_READ)
+            self.packView = memoryview(self.packMap)
+        return self.packView[member.offset:member.offset + member.length]
+
+    def open(self, name):
+        """
+        Opens an LRIT/HRIT member for parsing, without extracting it
+        :param name: Member name
+        :return: COMS instance (use walkHeaders() to parse)
+        """
+        return COMS(name, data=self.read(name))
+
+    def extract(self, name, directory):
+        """
+        Writes a member to a file
+        :param name: Member name, may contain subdirectories
+        :param directory: Output directory
+        :return: Output file path
+        """
+
+        member = self.members[name]
+
+        # Members are only ever written inside the output directory, whatever names the pack holds
+        parts = name.split("/")
+        if not name or name.startswith("/") or os.path.isabs(name) or any(part in ("", ".", "..") for part in parts):
+            raise ValueError("Unsafe member name \"{0}\"".format(name))
+        outputPath = os.path.join(directory, *parts)
+        root = os.path.realpath(directory)
+        if os.path.commonpath([root, os.path.realpath(outputPath)]) != root:
+            raise ValueError("Member \"{0}\" would be written outside \"{1}\"".format(name, directory))
+
+        os.makedirs(os.path.dirname(outputPath) or ".", exist_ok=True)
+        with open(outputPath, "wb", buffering=0) as outputFile:
+            COMS.copyRange(self.packFile, outputFile, member.offset, member.length)
+        return outputPath
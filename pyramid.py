@@ -0,0 +1,264 @@
+import json
+import math
+import os
+import shutil
+import numpy as np
+from assembler import getPassName, getPixelType, writePng
+from codec import SegmentCodec
+from coms import COMS
+
+
+def downsample(image):
+    """
+    Halves image size by averaging 2x2 blocks. Odd sizes repeat the last line or column.
+    :param image: 2D NumPy array
+    :return: Array of the same type, rounded to nearest
+    """
+
+    lines, cols = image.shape
+    if lines % 2 or cols % 2:
+        image = np.pad(image, ((0, lines % 2), (0, cols % 2)), mode="edge")
+    blocks = image.reshape(image.shape[0] // 2, 2, image.shape[1] // 2, 2)
+    return ((blocks.sum(axis=(1, 3), dtype=np.uint32) + 2) // 4).astype(image.dtype)
+
+
+class PyramidCache:
+    """
+    pyramid.py
+    https://github.com/sam210723/coms-1
+
+    On-disk cache of image pyramids: fixed-size PNG tiles at power-of-two zoom levels, one pyramid per pass.
+    Each pyramid records the size and mtime of its segments and keeps the pixels of every level in a raw file,
+    so rebuilding reads only changed segments, averages only the lines under them into coarser levels
+    and re-encodes only tiles over changed lines.
+    Least recently used pyramids are evicted when the cache grows beyond its size limit.
+    """
+
+    def __init__(self, directory, maxSize=1 << 30, tileSize=256):
+        """
+        :param directory: Cache directory
+        :param maxSize: Total size of tiles and level files kept, in bytes
+        :param tileSize: Tile width and height in pixels
+        """
+
+        self.directory = directory
+        self.maxSize = maxSize
+        self.tileSize = tileSize
+
+    def getPath(self, name, *parts):
+        """
+        Gets path of a pyramid or one of its files
+        :param name: Pass name, e.g. "IMG_ENH_01_IR1_20120101_000920"
+        """
+        return os.path.join(self.directory, name, *parts)
+
+    def getTilePath(self, name, zoom, row, col):
+        return self.getPath(name, str(zoom), "{0}_{1}.png".format(row, col))
+
+    def getLevelPath(self, name, zoom):
+        return self.getPath(name, str(zoom), "level.raw")
+
+    def readManifest(self, name):
+        """
+        Reads manifest of a pyramid
+        :param name: Pass name
+        :return: Manifest dictionary, or None if the pyramid does not exist
+        """
+
+        try:
+            with open(self.getPath(name, "pyramid.json")) as manifestFile:
+                return json.load(manifestFile)
+        except (OSError, ValueError):
+            return None
+
+    def writeManifest(self, name, manifest):
+        """
+        Writes manifest of a pyramid, replacing it atomically. Its mtime is the last access time of the pyramid.
+        """
+
+        path = self.getPath(name, "pyramid.json")
+        tempPath = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tempPath, "w") as manifestFile:
+            json.dump(manifest, manifestFile)
+        os.replace(tempPath, path)
+
+    def getLevels(self, numCols, numLines):
+        """
+        Gets number of zoom levels, so that level 0 is one tile and the last level is full resolution
+        :return: Number of levels
+        """
+        return max(0, math.ceil(math.log2(max(numCols, numLines) / self.tileSize))) + 1
+
+    def build(self, paths):
+        """
+        Builds or updates pyramids of all passes in a set of files, then evicts old pyramids
+        :param paths: LRIT/HRIT file paths
+        :return: List of (pass name, tiles written, total tiles)
+        """
+
+        passes = {}
+        for result in COMS.parseMany(paths):
+            if result.primaryHeader.valid and result.primaryHeader.file_type == 0:
+                passes.setdefault(getPassName(result), []).append(result)
+
+        built = [(name,) + self.buildPass(name, results) for name, results in sorted(passes.items())]
+        self.evict(keep=set(passes))
+        return built
+
+    def buildPass(self, name, results):
+        """
+        Builds or updates the pyramid of one pass
+        :param name: Pass name
+        :param results: Parsed segments of the pass
+        :return: Tuple of (tiles written, total tiles)
+        """
+
+        segments = {}
+        for result in results:
+            stat = os.stat(result.path)
+            firstLine = result.imageSegmentationInformationHeader.get('line_num_of_segment', 1) - 1
+            segments[os.path.basename(result.path)] = [stat.st_size, stat.st_mtime_ns, firstLine, result.imageStructureHeader.num_lines]
+        numCols = results[0].imageStructureHeader.num_cols
+        numLines = max(first + lines for size, mtime, first, lines in segments.values())
+        levels = self.getLevels(numCols, numLines)
+
+        # Full resolution line ranges of segments added, changed or removed since the last build
+        bitsPerPixel = results[0].imageStructureHeader.bits_per_pixel
+        manifest = self.readManifest(name)
+        if manifest is not None and (manifest['num_cols'], manifest['num_lines'], manifest['tile_size'], manifest.get('bits_per_pixel')) == (numCols, numLines, self.tileSize, bitsPerPixel) \
+                and all(os.path.exists(self.getLevelPath(name, zoom)) for zoom in range(levels)):
+            previous = manifest['segments']
+            changed = [segment for segment, (size, mtime, first, lines) in segments.items() if previous.get(segment, [None, None])[:2] != [size, mtime]]
+            removed = [(first, first + lines) for segment, (size, mtime, first, lines) in previous.items() if segment not in segments]
+            tileBytes = manifest['bytes']
+            mode = "r+"
+        else:
+            if manifest is not None or os.path.exists(self.getPath(name)):
+                shutil.rmtree(self.getPath(name), ignore_errors=True)  # Layout changed, start again
+            changed = list(segments)
+            removed = []
+            tileBytes = {}
+            mode = "w+"
+
+        total = sum(math.ceil(math.ceil(numLines / (1 << level)) / self.tileSize) * math.ceil(math.ceil(numCols / (1 << level)) / self.tileSize) for level in range(levels))
+        if not changed and not removed:
+            os.utime(self.getPath(name, "pyramid.json"))
+            return 0, total
+
+        # Pixels of each level, full resolution last
+        pixelType = getPixelType(bitsPerPixel)
+        images = []
+        for zoom in range(levels):
+            scale = 1 << (levels - 1 - zoom)
+            os.makedirs(self.getPath(name, str(zoom)), exist_ok=True)
+            images.append(np.memmap(self.getLevelPath(name, zoom), dtype=pixelType, mode=mode, shape=(-(-numLines // scale), -(-numCols // scale))))
+
+        # Only changed segments are read into the full resolution level, lines of removed segments are cleared
+        image = images[-1]
+        dirty = []
+        for first, last in removed:
+            image[first:last] = 0
+            dirty.append((first, last))
+        paths = {os.path.basename(result.path): result.path for result in results}
+        for segment in changed:
+            size, mtime, first, lines = segments[segment]
+            with COMS(paths[segment], useMmap=True) as lrit:
+                lrit.walkHeaders()
+                pixels = SegmentCodec.decodeSegment(lrit)
+            image[first:first + lines] = pixels[:numLines - first]
+            dirty.append((first, first + lines))
+
+        # Finest level first, each coarser level is averaged from the lines of the one before under changed lines
+        written = 0
+        for zoom in range(levels - 1, -1, -1):
+            image = images[zoom]
+            for row in range(math.ceil(image.shape[0] / self.tileSize)):
+                top = row * self.tileSize
+                if not any(first < top + self.tileSize and last > top for first, last in dirty):
+                    continue
+
+                for col in range(math.ceil(image.shape[1] / self.tileSize)):
+                    # Edge tiles are padded to full size
+                    left = col * self.tileSize
+                    tile = image[top:top + self.tileSize, left:left + self.tileSize]
+                    if tile.shape != (self.tileSize, self.tileSize):
+                        tile = np.pad(tile, ((0, self.tileSize - tile.shape[0]), (0, self.tileSize - tile.shape[1])))
+
+                    tilePath = self.getTilePath(name, zoom, row, col)
+                    writePng(tilePath, tile)
+                    tileBytes[os.path.relpath(tilePath, self.getPath(name))] = os.path.getsize(tilePath)
+                    written += 1
+
+            if zoom > 0:
+                # Lines first to last of this level average into lines first // 2 to last / 2 (rounded up) of the next
+                coarser = images[zoom - 1]
+                dirty = [(first // 2, -(-last // 2)) for first, last in dirty]
+                for first, last in dirty:
+                    coarser[first:last] = downsample(image[first * 2:min(last * 2, image.shape[0])])
+
+            image.flush()
+            tileBytes[os.path.relpath(self.getLevelPath(name, zoom), self.getPath(name))] = os.path.getsize(self.getLevelPath(name, zoom))
+
+        self.writeManifest(name, {
+            'num_cols': numCols,
+            'num_lines': numLines,
+            'tile_size': self.tileSize,
+            'bits_per_pixel': bitsPerPixel,
+            'levels': levels,
+            'segments': segments,
+            'bytes': tileBytes
+        })
+        return written, total
+
+    def getTile(self, name, zoom, row, col):
+        """
+        Gets path of a cached tile, marking its pyramid as recently used
+        :param name: Pass name
+        :param zoom: Zoom level, 0 is one tile
+        :param row: Tile row
+        :param col: Tile column
+        :return: Tile path, or None if not cached
+        """
+
+        path = self.getTilePath(name, zoom, row, col)
+        if not os.path.exists(path):
+            return None
+        os.utime(self.getPath(name, "pyramid.json"))
+        return path
+
+    def getPyramids(self):
+        """
+        Gets cached pyramids, least recently used first
+        :return: List of (last access time, size in bytes, pass name)
+        """
+
+        pyramids = []
+        if not os.path.isdir(self.directory):
+            return pyramids
+
+        for name in os.listdir(self.directory):
+            manifestPath = self.getPath(name, "pyramid.json")
+            manifest = self.readManifest(name)
+            if manifest is not None:
+                pyramids.append((os.stat(manifestPath).st_mtime_ns, sum(manifest['bytes'].values()), name))
+        return sorted(pyramids)
+
+    def evict(self, keep=()):
+        """
+        Removes least recently used pyramids until the cache fits its size limit
+        :param keep: Pass names never removed, e.g. the ones just built
+        :return: List of removed pass names
+        """
+
+        pyramids = self.getPyramids()
+        size = sum(pyramidSize for accessed, pyramidSize, name in pyramids)
+        removed = []
+        for accessed, pyramidSize, name in pyramids:
+            if size <= self.maxSize:
+                break
+            if name in keep:
+                continue
+            shutil.rmtree(self.getPath(name), ignore_errors=True)
+            size -= pyramidSize
+            removed.append(name)
+        return removed
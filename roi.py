@@ -0,0 +1,185 @@
+from time import perf_counter
+import numpy as np
+from assembler import getPixelType
+from codec import SegmentCodec
+from coms import COMS
+from navigation import Navigation
+
+
+class RegionReader:
+    """
+    roi.py
+    https://github.com/sam210723/coms-1
+
+    Reads a rectangular region of an image straight from its segment files.
+    Segment line ranges come from the headers, so only rows inside the region are read, and only from segments that intersect it.
+    Compressed segments that intersect it are decoded whole.
+    """
+
+    def __init__(self, paths):
+        """
+        Parses headers of all segments of one image
+        :param paths: Segment file paths, in any order
+        """
+
+        results = COMS.parseMany(paths)
+        structure = results[0].imageStructureHeader
+        if not structure.valid:
+            raise ValueError("\"{0}\" is not an image segment".format(results[0].path))
+
+        self.numCols = structure.num_cols
+        self.pixelType = getPixelType(structure.bits_per_pixel)
+        self.rowSize = self.numCols * self.pixelType.itemsize
+        self.navigation = Navigation.fromHeader(results[0]) if results[0].imageNavigationHeader.valid else None
+        self.bytesRead = 0  # Data field bytes read by all calls so far
+
+        self.segments = []  # (first line, lines, data field offset, path), 0-based, sorted by first line
+        self.compressed = {}  # Path -> ParseResult of compressed segments, which are decoded whole
+        for result in results:
+            structure = result.imageStructureHeader
+            if not structure.valid:
+                raise ValueError("\"{0}\" is not an image segment".format(result.path))
+            if structure.num_cols != self.numCols or getPixelType(structure.bits_per_pixel) != self.pixelType:
+                raise ValueError("\"{0}\" does not match image layout of other segments".format(result.path))
+
+            # Lines present in the data field, in case it is shorter than the Image Structure header says
+            numLines = min(structure.num_lines, result.primaryHeader.data_field_len // 8 // self.rowSize)
+            if structure.image_compression != 0:
+                self.compressed[result.path] = result
+                numLines = structure.num_lines
+            firstLine = result.imageSegmentationInformationHeader.get('line_num_of_segment', 1) - 1
+            self.segments.append((firstLine, numLines, result.primaryHeader.total_header_len, result.path))
+
+        self.segments.sort()
+        self.numLines = max(firstLine + numLines for firstLine, numLines, offset, path in self.segments)
+
+    def getPixelBox(self, north, south, west, east, samples=64):
+        """
+        Finds pixel box enclosing a latitude/longitude box, by projecting points along its edges
+        :param north: Northern latitude (degrees)
+        :param south: Southern latitude (degrees)
+        :param west: Western longitude (degrees east)
+        :param east: Eastern longitude (degrees east), may be less than west to cross 180 degrees
+        :param samples: Points projected along each edge
+        :return: Tuple of (left, top, right, bottom), 0-based and exclusive like readPixels()
+        """
+
+        if self.navigation is None:
+            raise ValueError("Segments have no Image Navigation header")
+        if not (-90 <= south <= 90 and -90 <= north <= 90):
+            raise ValueError("Latitudes must be within -90 to 90 degrees")
+        if north <= south:
+            raise ValueError("Region is empty: north ({0}) must be greater than south ({1})".format(north, south))
+        if east == west:
+            raise ValueError("Region is empty: west and east are both {0} degrees".format(west))
+        if east < west:
+            east += 360
+
+        lats = np.linspace(south, north, samples)
+        lons = np.linspace(west, east, samples)
+        edgeLats = np.concatenate((lats, lats, np.full(samples, north), np.full(samples, south)))
+        edgeLons = np.concatenate((np.full(samples, west), np.full(samples, east), lons, lons))
+
+        cols, lines = self.navigation.latLonToPixel(edgeLats, edgeLons)
+        if np.isnan(cols).all():
+            raise ValueError("Region is not visible from the satellite")
+
+        # 1-based fractional coordinates to 0-based pixels
+        left = int(np.floor(np.nanmin(cols))) - 1
+        top = int(np.floor(np.nanmin(lines))) - 1
+        right = int(np.ceil(np.nanmax(cols)))
+        bottom = int(np.ceil(np.nanmax(lines)))
+        if right <= 0 or bottom <= 0 or left >= self.numCols or top >= self.numLines:
+            raise ValueError("Region is visible from the satellite but outside the image")
+        return left, top, right, bottom
+
+    def readPixels(self, left, top, right, bottom, out=None):
+        """
+        Reads a pixel box, clipped to the image. Lines of missing segments are zero.
+        :param left: First column (0-based)
+        :param top: First line of full image (0-based)
+        :param right: Column after last column
+        :param bottom: Line after last line
+        :param out: Optional array shaped like the clipped box to read into, e.g. a memmap
+        :return: NumPy array shaped (lines, columns)
+        """
+
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, self.numCols), min(bottom, self.numLines)
+        if left >= right or top >= bottom:
+            raise ValueError("Region is outside the image")
+
+        if COMS.metrics is not None:
+            start = perf_counter()
+
+        if out is None:
+            region = np.zeros((bottom - top, right - left), dtype=self.pixelType)
+        else:
+            if out.shape != (bottom - top, right - left) or out.dtype != self.pixelType:
+                raise ValueError("Output array must be {0} {1}".format((bottom - top, right - left), self.pixelType))
+            region = out
+            region.fill(0)
+        fullWidth = left == 0 and right == self.numCols
+        readBytes = 0
+
+        for firstLine, numLines, offset, path in self.segments:
+            first = max(top, firstLine)
+            last = min(bottom, firstLine + numLines)
+            if first >= last:
+                continue
+
+            if path in self.compressed:
+                rows = self.readCompressed(self.compressed[path])
+                region[first - top:last - top] = rows[first - firstLine:last - firstLine, left:right]
+                readBytes += self.compressed[path].primaryHeader.data_field_len // 8
+                continue
+
+            # Full rows are contiguous in the data field, so the lines are read with one seek and one read
+            rows = region[first - top:last - top] if fullWidth else np.empty((last - first, self.numCols), dtype=self.pixelType)
+            self.readRows(path, offset + (first - firstLine) * self.rowSize, rows)
+            if not fullWidth:
+                region[first - top:last - top] = rows[:, left:right]
+            readBytes += rows.nbytes
+
+        self.bytesRead += readBytes
+        if COMS.metrics is not None:
+            COMS.metrics.addStage("readRegion", perf_counter() - start, readBytes)
+        return region
+
+    def readLatLon(self, north, south, west, east):
+        """
+        Reads the smallest pixel box enclosing a latitude/longitude box
+        :return: NumPy array shaped (lines, columns), see getPixelBox() and readPixels()
+        """
+        return self.readPixels(*self.getPixelBox(north, south, west, east))
+
+    @staticmethod
+    def readCompressed(result):
+        """
+        Reads and decodes a whole compressed segment
+        :param result: ParseResult of the segment
+        :return: NumPy array shaped (lines, columns)
+        """
+
+        with COMS(result.path, useMmap=True) as lrit:
+            lrit.walkHeaders()
+            return SegmentCodec.decodeSegment(lrit)
+
+    @staticmethod
+    def readRows(path, offset, rows):
+        """
+        Reads consecutive image rows from a segment file into an array
+        :param path: Segment file path
+        :param offset: Byte offset of first row
+        :param rows: Contiguous NumPy array to fill
+        """
+
+        buffer = memoryview(rows).cast("B")
+        with open(path, "rb", buffering=0) as segmentFile:
+            segmentFile.seek(offset)
+            filled = 0
+            while filled < len(buffer):
+                count = segmentFile.readinto(buffer[filled:])
+                if not count:
+                    raise ValueError("\"{0}\" is truncated".format(path))
+                filled += count
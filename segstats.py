@@ -0,0 +1,336 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import numpy as np
+from assembler import getPassName, getPixelType
+from calibration import Calibration
+from codec import SegmentCodec
+from coms import COMS
+
+
+def summarizeSegment(path, chunkSize=1 << 20):
+    """
+    Summarizes one segment. Runs in a worker process, only the histogram crosses the process boundary.
+    :param path: Segment file path
+    :param chunkSize: Data field bytes read at a time
+    :return: Tuple of (pass name, SegmentStats)
+    """
+
+    result = COMS.parse(path)
+    stats = SegmentStats.fromHeader(result)
+    stats.addSegment(result, chunkSize)
+    return getPassName(result), stats
+
+
+class SegmentStats:
+    """
+    segstats.py
+    https://github.com/sam210723/coms-1
+
+    Streaming statistics of image counts: a histogram of every count value, updated chunk by chunk from segment data fields.
+    Minimum, maximum, mean and percentiles are derived from the histogram, so memory does not depend on the number of pixels,
+    and statistics of segments, passes and worker processes are combined by adding histograms.
+    """
+
+    def __init__(self, channel=None, bitsPerPixel=8, calibration=None):
+        """
+        :param channel: Channel ID, e.g. "IR1"
+        :param bitsPerPixel: Bits per pixel from Image Structure header
+        :param calibration: Calibration for percentiles in physical units, None for counts only
+        """
+
+        self.channel = channel
+        self.bitsPerPixel = bitsPerPixel
+        self.pixelType = getPixelType(bitsPerPixel)
+        self.calibration = calibration
+        self.counts = np.zeros(256 if bitsPerPixel == 8 else 1024, dtype=np.int64)  # Pixels per count value, grows for counts beyond 10 bits
+        self.segments = 0
+
+    def __repr__(self):
+        return "SegmentStats({0}, {1} segments, {2} pixels)".format(self.channel, self.segments, self.getPixels())
+
+    @classmethod
+    def fromHeader(cls, result):
+        """
+        Creates empty statistics matching the channel of a segment
+        :param result: ParseResult or COMS instance with parsed headers
+        :return: SegmentStats
+        """
+
+        structure = result.imageStructureHeader
+        if not structure.valid:
+            raise ValueError("\"{0}\" is not an image segment".format(result.path))
+
+        channel = None
+        calibration = None
+        if result.imageDataFunctionHeader.valid:
+            channel = result.imageDataFunctionHeader.getChannel()
+            try:
+                calibration = Calibration.fromHeader(result)
+            except ValueError:
+                pass  # DDB without calibration entries, percentiles stay in counts
+        return cls(channel, structure.bits_per_pixel, calibration)
+
+    def addSegment(self, result, chunkSize=1 << 20):
+        """
+        Adds data field of a segment, read in fixed-size chunks through one buffer (compressed segments are decoded whole)
+        :param result: ParseResult or COMS instance with parsed headers
+        :param chunkSize: Data field bytes read at a time
+        """
+
+        structure = result.imageStructureHeader
+        if COMS.metrics is not None:
+            start = perf_counter()
+
+        if structure.image_compression != 0:
+            # Compressed data fields cannot be split into chunks, the segment is decoded whole
+            with COMS(result.path, useMmap=True) as lrit:
+                lrit.walkHeaders()
+                self.addCounts(SegmentCodec.decodeSegment(lrit))
+            self.segments += 1
+            if COMS.metrics is not None:
+                COMS.metrics.addStage("segmentStats", perf_counter() - start, result.primaryHeader.data_field_len // 8)
+            return
+
+        # Whole pixels only, both for the data field and each chunk
+        itemSize = self.pixelType.itemsize
+        remaining = min(structure.num_cols * structure.num_lines, result.primaryHeader.data_field_len // 8 // itemSize) * itemSize
+        buffer = memoryview(bytearray(max(itemSize, chunkSize - chunkSize % itemSize)))
+        length = remaining
+
+        with open(result.path, "rb", buffering=0) as segmentFile:
+            segmentFile.seek(result.primaryHeader.total_header_len)
+            pending = 0  # Bytes of a pixel split across reads
+            while remaining > 0:
+                count = segmentFile.readinto(buffer[pending:min(len(buffer), pending + remaining)])
+                if not count:
+                    raise ValueError("\"{0}\" is truncated".format(result.path))
+                remaining -= count
+                filled = pending + count
+                usable = filled - filled % itemSize
+                self.addCounts(np.frombuffer(buffer[:usable], dtype=self.pixelType))
+                pending = filled - usable
+                buffer[:pending] = buffer[usable:filled]
+
+        self.segments += 1
+        if COMS.metrics is not None:
+            COMS.metrics.addStage("segmentStats", perf_counter() - start, length)
+
+    def addCounts(self, counts):
+        """
+        Adds an array of counts to the histogram
+        :param counts: NumPy array of counts, any shape
+        """
+
+        histogram = np.bincount(counts.ravel(), minlength=len(self.counts))
+        if len(histogram) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(histogram) - len(self.counts)))
+        self.counts += histogram
+
+    def merge(self, other):
+        """
+        Adds statistics of another segment, pass or worker of the same channel
+        :param other: SegmentStats
+        :return: self
+        """
+
+        if other.channel != self.channel or other.bitsPerPixel != self.bitsPerPixel:
+            raise ValueError("Cannot merge statistics of {0} ({1} bpp) into {2} ({3} bpp)".format(
+                other.channel, other.bitsPerPixel, self.channel, self.bitsPerPixel))
+        if self.calibration is None:
+            self.calibration = other.calibration
+
+        if len(other.counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(other.counts) - len(self.counts)))
+        self.counts[:len(other.counts)] += other.counts
+        self.segments += other.segments
+        return self
+
+
+    # Statistics methods
+    def getPixels(self):
+        return int(self.counts.sum())
+
+    def getMin(self):
+        """
+        :return: Lowest count, or None if empty
+        """
+        nonzero = np.flatnonzero(self.counts)
+        return int(nonzero[0]) if len(nonzero) else None
+
+    def getMax(self):
+        """
+        :return: Highest count, or None if empty
+        """
+        nonzero = np.flatnonzero(self.counts)
+        return int(nonzero[-1]) if len(nonzero) else None
+
+    def getMean(self):
+        """
+        :return: Mean count, or None if empty
+        """
+        pixels = self.getPixels()
+        return float(np.dot(np.arange(len(self.counts)), self.counts)) / pixels if pixels else None
+
+    def getHistogram(self, bins=256):
+        """
+        Gets histogram with fewer bins, each covering an equal range of counts
+        :param bins: Number of bins, dividing the full count range of the pixel type
+        :return: NumPy int64 array of pixels per bin
+        """
+
+        fullRange = 1 << (8 if self.bitsPerPixel == 8 else 10)
+        counts = self.counts if len(self.counts) >= fullRange else np.pad(self.counts, (0, fullRange - len(self.counts)))
+        binIndex = np.minimum(np.arange(len(counts)) * bins // fullRange, bins - 1)
+        return np.bincount(binIndex, weights=counts, minlength=bins).astype(np.int64)
+
+    def getValues(self):
+        """
+        Gets value of each count: calibrated if there is a calibration, otherwise the count itself
+        :return: NumPy float array indexed by count
+        """
+
+        if self.calibration is None:
+            return np.arange(len(self.counts), dtype=np.float64)
+        return self.calibration.calibrate(np.arange(len(self.counts))).astype(np.float64)
+
+    def getPercentiles(self, percentiles=(1, 5, 50, 95, 99)):
+        """
+        Gets percentiles of calibrated values (counts if there is no calibration), by the nearest-rank method.
+        Values are sorted rather than counts, as calibration tables may decrease with count (e.g. infrared).
+        Counts with no calibration entry are ignored.
+        :param percentiles: Percentiles, 0 to 100
+        :return: List of values, None if there are no calibrated pixels
+        """
+
+        values = self.getValues()
+        defined = np.flatnonzero(~np.isnan(values) & (self.counts > 0))
+        if not len(defined):
+            return [None] * len(percentiles)
+
+        order = defined[np.argsort(values[defined], kind="stable")]
+        cumulative = np.cumsum(self.counts[order])
+        ranks = np.maximum(np.ceil(np.asarray(percentiles, dtype=np.float64) / 100 * cumulative[-1]), 1)
+        return [float(value) for value in values[order[np.searchsorted(cumulative, ranks)]]]
+
+    def toDict(self, percentiles=(1, 5, 50, 95, 99), bins=256):
+        """
+        Gets statistics as a dictionary for JSON output
+        :param percentiles: Percentiles, 0 to 100
+        :param bins: Histogram bins
+        :return: Dictionary
+        """
+
+        return {
+            'channel': self.channel,
+            'bits_per_pixel': self.bitsPerPixel,
+            'segments': self.segments,
+            'pixels': self.getPixels(),
+            'min': self.getMin(),
+            'max': self.getMax(),
+            'mean': self.getMean(),
+            'unit': self.calibration.unit if self.calibration is not None else "COUNT",
+            'percentiles': dict(zip((str(p) for p in percentiles), self.getPercentiles(percentiles))),
+            'histogram': self.getHistogram(bins).tolist()
+        }
+
+
+class StatsEngine:
+    """
+    Summarizes segments on a process pool, merging them into one SegmentStats per pass and per channel.
+    Headers are parsed a chunk of files at a time and only a few segments per worker are summarized at once,
+    so memory does not grow with the number of files beyond their names.
+    """
+
+    # Files whose headers are parsed at a time
+    headerChunkSize = 256
+
+    def __init__(self, workers=None, chunkSize=1 << 20):
+        """
+        :param workers: Number of worker processes (default: number of CPUs), 0 to summarize in this process
+        :param chunkSize: Data field bytes read at a time
+        """
+
+        self.chunkSize = chunkSize
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers != 0 else None
+        self.channels = {}  # (channel, bits per pixel) -> SegmentStats of all passes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down worker processes
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def summarize(self, paths):
+        """
+        Summarizes image segments pass by pass. Each pass is yielded once all its segments are merged,
+        and only the running totals per channel are kept afterwards.
+        :param paths: Segment file paths
+        :return: Generator of (pass name, SegmentStats)
+        """
+
+        # Only the pass name and path of each segment are kept from its headers
+        passes = {}
+        for start in range(0, len(paths), self.headerChunkSize):
+            for result in COMS.parseMany(paths[start:start + self.headerChunkSize]):
+                if result.primaryHeader.valid and result.primaryHeader.file_type == 0:
+                    passes.setdefault(getPassName(result), []).append(result.path)
+
+        # Segments of one pass are next to each other, so each pass is complete when the next one starts
+        ordered = (path for name in sorted(passes) for path in passes.pop(name))
+        current = None
+        stats = None
+        for name, segmentStats in self.summarizeSegments(ordered):
+            if name != current:
+                if stats is not None:
+                    yield current, self.addPass(stats)
+                current = name
+                stats = segmentStats
+            else:
+                stats.merge(segmentStats)
+
+        if stats is not None:
+            yield current, self.addPass(stats)
+
+    def summarizeSegments(self, paths):
+        """
+        Summarizes segments in order, with at most two jobs per worker in flight
+        :param paths: Iterable of segment file paths
+        :return: Generator of summarizeSegment() results
+        """
+
+        if self.executor is None:
+            for path in paths:
+                yield summarizeSegment(path, self.chunkSize)
+            return
+
+        futures = deque()
+        for path in paths:
+            futures.append(self.executor.submit(summarizeSegment, path, self.chunkSize))
+            if len(futures) >= self.workers * 2:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+    def addPass(self, stats):
+        """
+        Adds a complete pass to the totals of its channel
+        :param stats: SegmentStats of the pass
+        :return: stats
+        """
+
+        key = (stats.channel, stats.bitsPerPixel)
+        total = self.channels.get(key)
+        if total is None:
+            total = self.channels[key] = SegmentStats(stats.channel, stats.bitsPerPixel, stats.calibration)
+        total.merge(stats)
+        return stats
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import stat
+import sys
+from coms import COMS, ParseResult
+
+
+class StreamEvent:
+    """
+    Event emitted by StreamParser.
+    kind is "headers" once a file's headers have been parsed, "file" once all of its data has arrived,
+    or "dropped" when a file was skipped (data is None).
+    """
+
+    __slots__ = ('kind', 'headers', 'data')
+
+    def __init__(self, kind, headers, data=None):
+        self.kind = kind
+        self.headers = headers  # ParseResult, path is the annotation text
+        self.data = data  # Complete file bytes, for "file" events
+
+    def __repr__(self):
+        return "StreamEvent({0}, {1!r})".format(self.kind, self.headers.path)
+
+    def getDataField(self):
+        """
+        Gets data field of a completed file
+        :return: Zero-copy memoryview of data field
+        """
+        return memoryview(self.data)[self.headers.primaryHeader.total_header_len:]
+
+    def open(self):
+        """
+        Opens completed file for use with tools expecting a COMS instance (e.g. SegmentAssembler)
+        :return: COMS instance with headers parsed, backed by the event data
+        """
+        lrit = COMS(self.headers.path, data=self.data)
+        lrit.walkHeaders()
+        return lrit
+
+
+class StreamParser:
+    """
+    stream.py
+    https://github.com/sam210723/coms-1
+
+    Push-style parser for xRIT files concatenated in a byte stream.
+    Feed it chunks of any size, headers are parsed as soon as all of them are available.
+    """
+
+    def __init__(self, maxFileSize=64 * 1024 * 1024):
+        """
+        :param maxFileSize: Largest file to buffer, larger files are skipped
+        """
+        self.maxFileSize = maxFileSize
+        self.buffer = bytearray()
+        self.headers = None  # ParseResult of file being received
+        self.fileLength = 0  # Total length of file being received
+        self.skipBytes = 0  # Bytes left of a file being skipped
+        self.resyncBytes = 0  # Bytes discarded looking for a primary header
+
+    def feed(self, chunk):
+        """
+        Adds bytes to the stream
+        :param chunk: Bytes-like chunk
+        :return: List of StreamEvent, in stream order
+        """
+
+        events = []
+
+        # Skipped file bytes are never buffered
+        if self.skipBytes:
+            skipped = min(self.skipBytes, len(chunk))
+            self.skipBytes -= skipped
+            chunk = memoryview(chunk)[skipped:]
+
+        self.buffer += chunk
+        while True:
+            if self.headers is None:
+                if not self.parseHeaders(events):
+                    break
+
+            if self.skipBytes:
+                skipped = min(self.skipBytes, len(self.buffer))
+                del self.buffer[:skipped]
+                self.skipBytes -= skipped
+                if self.skipBytes:
+                    break
+                continue
+
+            if len(self.buffer) < self.fileLength:
+                break
+
+            data = bytes(self.buffer[:self.fileLength])
+            del self.buffer[:self.fileLength]
+            events.append(StreamEvent("file", self.headers, data))
+            self.headers = None
+
+        return events
+
+    def parseHeaders(self, events):
+        """
+        Parses headers at start of buffer once they are complete
+        :param events: Event list to append to
+        :return: True if headers were parsed
+        """
+
+        while True:
+            # Resynchronise on the primary header record
+            start = self.buffer.find(b'\x00\x00\x10')
+            if start < 0:
+                start = max(len(self.buffer) - 2, 0)
+            if start:
+                self.resyncBytes += start
+                del self.buffer[:start]
+
+            if len(self.buffer) < 16:
+                return False
+
+            totalHeaderLen = int.from_bytes(self.buffer[4:8], byteorder='big')
+            dataFieldLen = int.from_bytes(self.buffer[8:16], byteorder='big')
+            if 16 <= totalHeaderLen <= self.maxFileSize:
+                break
+
+            # Not a real primary header
+            self.resyncBytes += 1
+            del self.buffer[:1]
+
+        if len(self.buffer) < totalHeaderLen:
+            return False
+
+        lrit = COMS("<stream>", data=bytes(self.buffer[:totalHeaderLen]))
+        headers = lrit.walkHeaders()
+        name = lrit.annotationTextHeader.get('text_data', "<stream>").strip("\x00 ")
+        lrit.close()
+
+        self.headers = ParseResult(name, headers)
+        self.fileLength = totalHeaderLen + (dataFieldLen + 7) // 8  # Data length is in bits
+        events.append(StreamEvent("headers", self.headers))
+
+        if self.fileLength > self.maxFileSize:
+            self.skipBytes = self.fileLength
+            events.append(StreamEvent("dropped", self.headers))
+            self.headers = None
+        return True
+
+
+# Asyncio front-ends
+async def readStream(reader, onEvent, maxFileSize=64 * 1024 * 1024, chunkSize=65536):
+    """
+    Parses xRIT files from an asyncio stream until it ends
+    :param reader: asyncio.StreamReader
+    :param onEvent: Callback for each StreamEvent, may be a coroutine function
+    :param maxFileSize: Largest file to buffer
+    :param chunkSize: Bytes to read at a time
+    :return: StreamParser used
+    """
+
+    parser = StreamParser(maxFileSize)
+    while True:
+        chunk = await reader.read(chunkSize)
+        if not chunk:
+            break
+        await feedEvents(parser, chunk, onEvent)
+    return parser
+
+
+async def readFile(fileObject, onEvent, maxFileSize=64 * 1024 * 1024, chunkSize=65536):
+    """
+    Parses xRIT files from a regular file until it ends, reading on a thread
+    :param fileObject: Binary file object
+    :param onEvent: Callback for each StreamEvent, may be a coroutine function
+    :param maxFileSize: Largest file to buffer
+    :param chunkSize: Bytes to read at a time
+    :return: StreamParser used
+    """
+
+    loop = asyncio.get_running_loop()
+    parser = StreamParser(maxFileSize)
+    while True:
+        chunk = await loop.run_in_executor(None, fileObject.read, chunkSize)
+        if not chunk:
+            break
+        await feedEvents(parser, chunk, onEvent)
+    return parser
+
+
+async def feedEvents(parser, chunk, onEvent):
+    """
+    Feeds a chunk to a parser and passes its events to a callback
+    :param parser: StreamParser
+    :param chunk: Bytes received
+    :param onEvent: Callback for each StreamEvent, may be a coroutine function
+    """
+
+    for event in parser.feed(chunk):
+        result = onEvent(event)
+        if asyncio.iscoroutine(result):
+            await result
+
+
+async def serveTcp(host, port, onEvent, maxFileSize=64 * 1024 * 1024):
+    """
+    Listens for TCP connections, each one carrying a stream of xRIT files
+    :param host: Address to listen on
+    :param port: Port to listen on (0 for any free port)
+    :param onEvent: Callback for each StreamEvent, may be a coroutine function
+    :param maxFileSize: Largest file to buffer
+    :return: asyncio.Server
+    """
+
+    async def handleConnection(reader, writer):
+        try:
+            await readStream(reader, onEvent, maxFileSize)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handleConnection, host, port)
+
+
+async def connectTcp(host, port, onEvent, maxFileSize=64 * 1024 * 1024):
+    """
+    Connects to a TCP server sending a stream of xRIT files, and parses it until it closes
+    :param host: Server address
+    :param port: Server port
+    :param onEvent: Callback for each StreamEvent, may be a coroutine function
+    :param maxFileSize: Largest file to buffer
+    :return: StreamParser used
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await readStream(reader, onEvent, maxFileSize)
+    finally:
+        writer.close()
+
+
+async def readStdin(onEvent, maxFileSize=64 * 1024 * 1024):
+    """
+    Parses a stream of xRIT files from stdin (e.g. a pipe, or a file redirected with "<") until it ends
+    :param onEvent: Callback for each StreamEvent, may be a coroutine function
+    :param maxFileSize: Largest file to buffer
+    :return: StreamParser used
+    """
+
+    # Pipe transports only accept pipes and sockets, so regular files are read on a thread instead
+    if stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+        return await readFile(sys.stdin.buffer, onEvent, maxFileSize)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    return await readStream(reader, onEvent, maxFileSize)
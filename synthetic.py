@@ -0,0 +1,305 @@
+import os
+import random
+import sys
+from array import array
+from datetime import datetime, timedelta
+from coms import COMS
+
+
+# Header record serializers, each returns a complete record (type, length and fields)
+def packRecord(headerType, fields):
+    """
+    Prefixes header fields with header type and record length
+    :param headerType: Header type
+    :param fields: Bytes following the record length
+    :return: Header record bytes
+    """
+    return COMS.recordLayout.pack(headerType, 3 + len(fields)) + fields
+
+
+def packPrimaryHeader(fileType, totalHeaderLen, dataFieldLen):
+    """
+    :param fileType: File type, see COMS.fileTypes
+    :param totalHeaderLen: Length of all header records in bytes
+    :param dataFieldLen: Length of data field in bits
+    """
+    return packRecord(0, COMS.primaryLayout.pack(fileType, totalHeaderLen, dataFieldLen))
+
+
+def packImageStructureHeader(bitsPerPixel, numCols, numLines, compression=0):
+    return packRecord(1, COMS.imageStructureLayout.pack(bitsPerPixel, numCols, numLines, compression))
+
+
+def packImageNavigationHeader(longitude, colScaling, lineScaling, colOffset, lineOffset):
+    """
+    :param longitude: Sub-satellite longitude string, e.g. "128.2"
+    :param lineScaling: LFAC, negative values are stored as unsigned 32 bit like COMS does
+    """
+    projection = "GEOS({0})".format(longitude).encode('ascii').ljust(32, b'\x00')
+    return packRecord(2, COMS.imageNavigationLayout.pack(projection, colScaling, lineScaling & 0xFFFFFFFF, colOffset, lineOffset))
+
+
+def packImageDataFunctionHeader(ddb):
+    return packRecord(3, ddb.encode('utf-8'))
+
+
+def packAnnotationTextHeader(text):
+    return packRecord(4, text.encode('utf-8'))
+
+
+def packTimestampHeader(timestamp):
+    """
+    :param timestamp: datetime, encoded as CCSDS Day Segmented time code (Level 1, 1958 epoch)
+    """
+    delta = timestamp - COMS.cdsEpoch
+    millis = delta.seconds * 1000 + delta.microseconds // 1000
+    return packRecord(5, COMS.timestampLayout.pack(0x40, delta.days, millis))
+
+
+def packAncillaryTextHeader(text):
+    return packRecord(6, text.encode('utf-8'))
+
+
+def packKeyHeader(key=0):
+    return packRecord(7, COMS.keyLayout.pack(key))
+
+
+def packImageSegmentationInformationHeader(segmentNum, segmentTotal, lineNum):
+    return packRecord(128, COMS.imageSegmentationLayout.pack(segmentNum, segmentTotal, lineNum))
+
+
+def packFile(fileType, records, dataLength):
+    """
+    Builds primary header and joins header records
+    :param fileType: File type
+    :param records: Secondary header records
+    :param dataLength: Data field length in bytes
+    :return: Header bytes, data field follows
+    """
+
+    totalHeaderLen = 16 + sum(len(record) for record in records)
+    return b"".join([packPrimaryHeader(fileType, totalHeaderLen, dataLength * 8)] + records)
+
+
+def buildDataDefinitionBlock(channel, entries):
+    """
+    Builds Image Data Function DDB with a linear calibration table
+    :param channel: Channel ID, e.g. "IR1"
+    :param entries: Number of counts (256 for LRIT, 1024 for HRIT)
+    :return: DDB text
+    """
+
+    if channel == "VIS":
+        name, unit = "VISIBLE", "ALBEDO(%)"
+        values = [min(100.0, count * 100.0 / (entries * 0.9)) for count in range(entries)]
+    else:
+        name, unit = channel, "KELVIN"
+        values = [330.0 - count * 150.0 / entries for count in range(entries)]
+
+    lines = ["CHANNEL:={0}".format(channel), "$HALFTONE:={0}".format(8 if entries <= 256 else 10),
+             "_NAME:={0}".format(name), "_UNIT:={0}".format(unit)]
+    lines += ["{0}:={1:.10g}".format(count, value) for count, value in enumerate(values)]
+    return "\n".join(lines) + "\n"
+
+
+class CorpusGenerator:
+    """
+    synthetic.py
+    https://github.com/sam210723/coms-1
+
+    Generates valid LRIT/HRIT files of every file type and image type, for benchmarks and tests.
+    Files follow the header layout of the COMS-1 samples. Image data is a deterministic pattern,
+    or a sparse hole of zeros when sparse is set (files then take almost no disk space).
+    """
+
+    # Image layouts: (image type, HRIT) -> (name, bits per pixel, columns, segment lines, CFAC, LFAC, COFF, LOFF)
+    imageSpecs = {}
+    imageSpecs[(0, False)] = ("FD", 8, 2200, [2200], 8170135, -8170135, 1100, 1100)
+    imageSpecs[(0, True)] = ("FD", 16, 2750, [275] * 10, 10212669, -10212669, 1374, 1374)
+    imageSpecs[(1, False)] = ("ENH", 8, 1547, [309, 309, 308, 308], 8170135, -8170135, 773, 1010)
+    imageSpecs[(2, False)] = ("LSH", 8, 1547, [318] * 3, 8170135, -8170135, 773, 90)
+    imageSpecs[(3, False)] = ("APNH", 8, 810, [611], 8170135, -8170135, 370, 560)
+
+    # Additional Data products: (file type, name, number, data field length in bytes)
+    dataSpecs = [
+        (1, "GTS", 1, 2048),
+        (2, "ANT", 1, 7217),
+        (3, "KEY", 1, 64),
+        (128, "CT", 2, 529102),
+        (128, "CTH", 2, 586226),
+        (128, "CTT", 2, 570410),
+        (129, "NWP", 1, 65536),
+        (130, "GOCI", 1, 17335),
+        (131, "TYP", 1, 4096),
+        (132, "GOCI", 2, 17335)
+    ]
+
+    channels = ("VIS", "IR1", "IR2", "WV", "SWIR")
+    longitude = "128.2"
+
+    def __init__(self, directory, hrit=False, sparse=False, seed=0, start=datetime(2012, 1, 1), compression=0):
+        """
+        :param directory: Output directory
+        :param hrit: Generate HRIT (16 bit FD) instead of LRIT images
+        :param sparse: Leave data fields as sparse holes instead of writing a pattern
+        :param seed: Random seed for Additional Data payloads
+        :param start: Timestamp of first pass
+        :param compression: Image compression, see COMS.compressionTypes (1 and 2 need NumPy, 2 also Pillow)
+        """
+
+        if compression and sparse:
+            raise ValueError("Compressed images cannot be sparse")
+        if compression == 2 and hrit:
+            raise ValueError("Lossy compression is only supported for 8 bit (LRIT) images")
+
+        self.directory = directory
+        self.hrit = hrit
+        self.sparse = sparse
+        self.compression = compression
+        self.random = random.Random(seed)
+        self.start = start
+        self.extension = ".hrit" if hrit else ".lrit"
+        self.patterns = {}  # Cached segment data, keyed by (bits per pixel, columns, lines, first line)
+
+    def getImageSpecs(self):
+        """
+        Gets image layouts for LRIT or HRIT
+        :return: List of (image type, spec) tuples
+        """
+        return [(imageType, spec) for (imageType, hrit), spec in sorted(self.imageSpecs.items()) if hrit == self.hrit]
+
+    def getPattern(self, bitsPerPixel, numCols, numLines, firstLine):
+        """
+        Gets image data of one segment: a diagonal gradient, with 10 bit samples in little-endian words for 16 bpp
+        :return: Bytes
+        """
+
+        key = (bitsPerPixel, numCols, numLines, firstLine)
+        pattern = self.patterns.get(key)
+        if pattern is None:
+            period = 1024 if bitsPerPixel == 16 else 256
+            ramp = array('H' if bitsPerPixel == 16 else 'B', range(period)) * (numCols // period + 2)
+            pixels = array(ramp.typecode)
+            for line in range(firstLine, firstLine + numLines):
+                pixels.extend(ramp[line % period:line % period + numCols])
+            if bitsPerPixel == 16 and sys.byteorder != "little":
+                pixels.byteswap()
+            pattern = self.patterns[key] = pixels.tobytes()
+        return pattern
+
+    def getCompressedPattern(self, bitsPerPixel, numCols, numLines, firstLine):
+        """
+        Gets image data of one segment encoded with the generator's compression type
+        :return: Bytes
+        """
+
+        key = (bitsPerPixel, numCols, numLines, firstLine, self.compression)
+        pattern = self.patterns.get(key)
+        if pattern is None:
+            # Imported here so uncompressed corpora do not need NumPy
+            import numpy as np
+            from codec import SegmentCodec
+
+            pixels = np.frombuffer(self.getPattern(bitsPerPixel, numCols, numLines, firstLine), dtype=np.uint8 if bitsPerPixel == 8 else "<u2").reshape(numLines, numCols)
+            if self.compression == 1:
+                pattern = SegmentCodec.encodeLossless(pixels, 8 if bitsPerPixel == 8 else 10)
+            elif self.compression == 2:
+                pattern = SegmentCodec.encodeLossy(pixels)
+            else:
+                raise ValueError("Unknown compression type {0}".format(self.compression))
+            self.patterns[key] = pattern
+        return pattern
+
+    def writeFile(self, name, header, dataLength, data=None):
+        """
+        Writes one file
+        :param name: File name
+        :param header: Header bytes
+        :param dataLength: Data field length in bytes
+        :param data: Data field, or None to leave a sparse hole
+        :return: File path
+        """
+
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as lritFile:
+            lritFile.write(header)
+            if data is None:
+                lritFile.truncate(len(header) + dataLength)
+            else:
+                lritFile.write(data)
+        return path
+
+    def writeImage(self, imageType, channel, timestamp):
+        """
+        Writes all segments of one image
+        :param imageType: Image type, see COMS.imageTypes
+        :param channel: Channel ID
+        :param timestamp: Image timestamp
+        :return: List of file paths
+        """
+
+        name, bitsPerPixel, numCols, segmentLines, cfac, lfac, coff, loff = self.imageSpecs[(imageType, self.hrit)]
+        ddb = buildDataDefinitionBlock(channel, 1024 if bitsPerPixel == 16 else 256)
+        passName = "IMG_{0}_01_{1}_{2}".format(name, channel, timestamp.strftime("%Y%m%d_%H%M%S"))
+
+        paths = []
+        firstLine = 1
+        for segmentNum, numLines in enumerate(segmentLines, 1):
+            fileName = "{0}_{1:02d}{2}".format(passName, segmentNum, self.extension)
+            data = None
+            dataLength = numCols * numLines * bitsPerPixel // 8
+            if self.compression:
+                data = self.getCompressedPattern(bitsPerPixel, numCols, numLines, firstLine)
+                dataLength = len(data)
+            elif not self.sparse:
+                data = self.getPattern(bitsPerPixel, numCols, numLines, firstLine)
+
+            header = packFile(0, [
+                packImageStructureHeader(bitsPerPixel, numCols, numLines, self.compression),
+                packImageNavigationHeader(self.longitude, cfac, lfac, coff, loff),
+                packImageDataFunctionHeader(ddb),
+                packAnnotationTextHeader(fileName),
+                packTimestampHeader(timestamp),
+                packKeyHeader(),
+                packImageSegmentationInformationHeader(segmentNum, len(segmentLines), firstLine)
+            ], dataLength)
+
+            paths.append(self.writeFile(fileName, header, dataLength, data))
+            firstLine += numLines
+        return paths
+
+    def writeAdditionalData(self, fileType, name, number, dataLength, timestamp):
+        """
+        Writes one Additional Data file with a random payload
+        :return: File path
+        """
+
+        fileName = "ADD_{0}_{1:02d}_{2}_00{3}".format(name, number, timestamp.strftime("%Y%m%d_%H%M%S"), self.extension)
+        header = packFile(fileType, [
+            packAnnotationTextHeader(fileName),
+            packTimestampHeader(timestamp),
+            packKeyHeader()
+        ], dataLength)
+
+        data = None if self.sparse else self.random.getrandbits(dataLength * 8).to_bytes(dataLength, 'little')
+        return self.writeFile(fileName, header, dataLength, data)
+
+    def generate(self, count, interval=timedelta(minutes=15)):
+        """
+        Writes at least count files. Each pass writes every image type in every channel, then every Additional Data product.
+        :param count: Number of files to write (the last pass is completed)
+        :param interval: Time between passes
+        :return: List of file paths
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        timestamp = self.start
+        while len(paths) < count:
+            for imageType, spec in self.getImageSpecs():
+                for channel in self.channels:
+                    paths += self.writeImage(imageType, channel, timestamp)
+            for fileType, name, number, dataLength in self.dataSpecs:
+                paths.append(self.writeAdditionalData(fileType, name, number, dataLength, timestamp))
+            timestamp += interval
+        return paths
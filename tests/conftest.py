@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Modules live at the top of the repository, next to the CLIs
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoDir)
+
+samplesDir = os.path.join(repoDir, "samples")
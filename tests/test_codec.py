@@ -0,0 +1,96 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from datetime import datetime
+from codec import SegmentCodec, SegmentDecoder
+from coms import COMS
+from synthetic import CorpusGenerator
+
+
+def makeImage(precision, numLines=23, numCols=37, seed=0):
+    """
+    Smooth gradient with noise, clipped to the sample range so both extremes appear
+    """
+    rng = np.random.default_rng(seed)
+    maximum = (1 << precision) - 1
+    lines, cols = np.mgrid[0:numLines, 0:numCols]
+    image = (lines * cols * maximum // ((numLines - 1) * (numCols - 1))) + rng.integers(-maximum // 8, maximum // 8, (numLines, numCols))
+    return np.clip(image, 0, maximum).astype(np.uint8 if precision == 8 else np.uint16)
+
+
+@pytest.mark.parametrize("precision", [8, 10, 16])
+@pytest.mark.parametrize("predictor", range(1, 8))
+@pytest.mark.parametrize("restartLines", [0, 1, 4])
+def test_lossless_round_trip(precision, predictor, restartLines):
+    image = makeImage(precision)
+    data = SegmentCodec.encodeLossless(image, precision, predictor, restartLines)
+    decoded = SegmentCodec.decodeLossless(data)
+    assert decoded.dtype == image.dtype
+    np.testing.assert_array_equal(decoded, image)
+
+
+@pytest.mark.parametrize("precision", [8, 16])
+def test_lossless_flat_and_extremes(precision):
+    maximum = (1 << precision) - 1
+    for image in (np.zeros((5, 9)), np.full((5, 9), maximum), np.tile([0, maximum], (5, 9))[:, :9]):
+        image = image.astype(np.uint8 if precision == 8 else np.uint16)
+        np.testing.assert_array_equal(SegmentCodec.decodeLossless(SegmentCodec.encodeLossless(image, precision)), image)
+
+
+def test_lossless_invalid_stream():
+    with pytest.raises(ValueError):
+        SegmentCodec.decodeLossless(b"\x00" * 32)
+
+    data = SegmentCodec.encodeLossless(makeImage(8))
+    with pytest.raises(ValueError):
+        SegmentCodec.decodeLossless(data[:len(data) // 2])
+
+
+@pytest.mark.parametrize("hrit", [False, True])
+def test_lossless_segment_files(tmp_path, hrit):
+    raw = tmp_path / "raw"
+    compressed = tmp_path / "compressed"
+    raw.mkdir()
+    compressed.mkdir()
+    rawPaths = CorpusGenerator(str(raw), hrit).writeImage(0 if hrit else 1, "IR1", datetime(2012, 1, 1))[:3]
+    compressedPaths = CorpusGenerator(str(compressed), hrit, compression=1).writeImage(0 if hrit else 1, "IR1", datetime(2012, 1, 1))[:3]
+
+    expected = []
+    for path in rawPaths:
+        with COMS(path) as lrit:
+            lrit.walkHeaders()
+            expected.append(SegmentCodec.decodeSegment(lrit))
+
+    for workers in (0, 2):
+        with SegmentDecoder(workers) as decoder:
+            decoded = list(decoder.decodeFiles(compressedPaths))
+        assert [path for path, pixels in decoded] == compressedPaths
+        for (path, pixels), pixelsRaw in zip(decoded, expected):
+            np.testing.assert_array_equal(pixels, pixelsRaw)
+
+
+def test_lossy_round_trip():
+    pytest.importorskip("PIL")
+    image = makeImage(8, 64, 96)
+    data = SegmentCodec.encodeLossy(image, quality=95)
+    assert data[:2] == b"\xff\xd8"
+
+    decoded = SegmentCodec.decodeLossy(data)
+    assert decoded.shape == image.shape
+    assert decoded.dtype == np.uint8
+    assert np.abs(decoded.astype(np.int64) - image).mean() < 8
+
+    with pytest.raises(ValueError):
+        SegmentCodec.encodeLossy(image.astype(np.uint16))
+
+
+def test_lossy_segment_files(tmp_path):
+    pytest.importorskip("PIL")
+    paths = CorpusGenerator(str(tmp_path), compression=2).writeImage(1, "VIS", datetime(2012, 1, 1))
+    with COMS(paths[0]) as lrit:
+        lrit.walkHeaders()
+        assert lrit.imageStructureHeader.image_compression == 2
+        pixels = SegmentCodec.decodeSegment(lrit)
+    assert pixels.shape == (lrit.imageStructureHeader.num_lines, lrit.imageStructureHeader.num_cols)
+    assert pixels.dtype == np.uint8
@@ -0,0 +1,29 @@
+import shutil
+from test_ingest import antPath, fillIncoming, passName, runOnce, segmentPaths
+
+
+def test_restart(tmp_path):
+    incoming = fillIncoming(tmp_path / "incoming", segmentPaths + [antPath])
+    dedupPath = str(tmp_path / "seen.db")
+    products, stats = runOnce(incoming, tmp_path / "output", dedupPath=dedupPath)
+    assert stats['files_duplicate'] == 0
+    assert stats['dedup']['count'] == 5
+
+    # A restart sees the same files again, all already processed
+    products, stats = runOnce(incoming, tmp_path / "output", dedupPath=dedupPath)
+    assert products == []
+    assert stats['files_duplicate'] == 5
+
+
+def test_copies_in_one_poll(tmp_path):
+    # Several antennas writing the same files into one spool
+    incoming = fillIncoming(tmp_path / "incoming", segmentPaths)
+    shutil.copy(antPath, incoming / "a.lrit")
+    shutil.copy(antPath, incoming / "b.lrit")
+    shutil.copy(segmentPaths[0], incoming / "c.lrit")
+    products, stats = runOnce(incoming, tmp_path / "output", dedupPath=str(tmp_path / "seen.db"), partial=False, workers=2)
+
+    assert sorted((kind, name) for kind, name, outputPath in products) == [("data", "a"), ("image", passName)]
+    assert not (tmp_path / "output" / "b_DATA.txt").exists()
+    assert stats['files_duplicate'] == 2
+    assert stats['dedup']['count'] == 7
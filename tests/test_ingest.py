@@ -0,0 +1,75 @@
+import asyncio
+import glob
+import os
+import shutil
+import struct
+from conftest import samplesDir
+from ingest import IngestDaemon
+
+passName = "IMG_ENH_01_IR1_20120101_000920"
+segmentPaths = sorted(glob.glob(os.path.join(samplesDir, "lrit", passName + "_0?.lrit")))
+antPath = os.path.join(samplesDir, "lrit", "ADD_ANT_01_20120101_113500_00.lrit")
+
+
+def runOnce(incoming, output, **kwargs):
+    """
+    Runs the daemon over files already in the incoming directory
+    :return: Tuple of (list of (kind, name, output path), final statistics)
+    """
+
+    products = []
+    stats = []
+    kwargs.setdefault('workers', 1)
+    daemon = IngestDaemon(str(incoming), str(output), **kwargs)
+    asyncio.run(daemon.run(lambda kind, name, outputPath, latency: products.append((kind, name, outputPath)),
+                           stats.append, statsInterval=3600, once=True))
+    return products, stats[-1]
+
+
+def readPngHeader(path):
+    """
+    :return: Tuple of (width, height, colour type)
+    """
+    with open(path, "rb") as pngFile:
+        header = pngFile.read(26)
+    width, height, bitDepth, colourType = struct.unpack(">IIBB", header[16:26])
+    return width, height, colourType
+
+
+def fillIncoming(directory, paths):
+    directory.mkdir()
+    for path in paths:
+        shutil.copy(path, directory)
+    return directory
+
+
+def test_complete_pass(tmp_path):
+    incoming = fillIncoming(tmp_path / "incoming", segmentPaths + [antPath])
+    products, stats = runOnce(incoming, tmp_path / "output", partial=False)
+
+    assert [(kind, name) for kind, name, outputPath in products if kind == "image"] == [("image", passName)]
+    imagePath = [outputPath for kind, name, outputPath in products if kind == "image"][0]
+    assert readPngHeader(imagePath) == (1547, 1234, 0)
+    assert ("data", "ADD_ANT_01_20120101_113500_00", str(tmp_path / "output" / "ADD_ANT_01_20120101_113500_00_DATA.txt")) in products
+    assert os.path.getsize(tmp_path / "output" / "ADD_ANT_01_20120101_113500_00_DATA.txt") > 0
+
+    assert stats['files_seen'] == 5
+    assert stats['classify']['count'] == 5
+    assert stats['extract']['count'] == 1
+    assert stats['assemble']['count'] == 1
+    assert stats['latency']['count'] == len(products)
+    assert stats['passes_pending'] == 0
+    assert stats['queue_depth'] == 0
+    for stage in IngestDaemon.stages:
+        assert stats[stage]['errors'] == 0
+
+
+def test_ignored_files(tmp_path):
+    incoming = fillIncoming(tmp_path / "incoming", [antPath])
+    (incoming / "junk.lrit").write_bytes(b"\xff" * 64)
+    (incoming / "notes.txt").write_text("not xRIT")
+    products, stats = runOnce(incoming, tmp_path / "output")
+
+    assert [kind for kind, name, outputPath in products] == ["data"]
+    assert stats['files_seen'] == 2
+    assert stats['files_ignored'] == 1
@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from assembler import PassTracker, SegmentAssembler
+from coms import COMS
+from test_ingest import fillIncoming, passName, readPngHeader, runOnce, segmentPaths
+
+
+def test_tracker_gaps_and_incremental_assembly():
+    results = COMS.parseMany(segmentPaths)
+    tracker = PassTracker(passName, 4, 0.0)
+
+    # Segments out of order with number 3 missing
+    for result in (results[3], results[0], results[1]):
+        assert tracker.add(result, 1.0)
+    assert not tracker.add(results[0], 2.0)
+    assert tracker.getMissing() == [3]
+    assert tracker.getGaps() == [(results[2].imageSegmentationInformationHeader.line_num_of_segment - 1, results[3].imageSegmentationInformationHeader.line_num_of_segment - 1)]
+
+    # Each segment is added to the pass image once, later calls only add what arrived since
+    assert [segmentNum for segmentNum, path in tracker.takePending()] == [1, 2, 4]
+    tracker.assemble([(1, segmentPaths[0]), (2, segmentPaths[1]), (4, segmentPaths[3])])
+    assert not tracker.assemble([]).isComplete()
+
+    assert tracker.add(results[2], 3.0)
+    assert tracker.isComplete()
+    assembler = tracker.assemble(tracker.takePending())
+    assert assembler.isComplete()
+    np.testing.assert_array_equal(assembler.getImage(), SegmentAssembler.fromFiles(segmentPaths).getImage())
+
+
+def test_partial_products(tmp_path):
+    incoming = fillIncoming(tmp_path / "incoming", segmentPaths)
+    products, stats = runOnce(incoming, tmp_path / "output")
+
+    kinds = [kind for kind, name, outputPath in products]
+    assert kinds[-1] == "image"
+    assert set(kinds[:-1]) <= {"partial"}
+    assert stats['assemble']['count'] == len(kinds)
+    assert stats['passes_incomplete'] == 0
+
+
+def test_incomplete_pass(tmp_path):
+    incoming = fillIncoming(tmp_path / "incoming", segmentPaths[:2] + segmentPaths[3:])
+    products, stats = runOnce(incoming, tmp_path / "output", partial=False)
+
+    assert [kind for kind, name, outputPath in products] == ["incomplete"]
+    width, height, colourType = readPngHeader(products[0][2])
+    assert (width, height, colourType) == (1547, 1234, 4)  # Greyscale with alpha, missing lines transparent
+    assert stats['passes_incomplete'] == 1
+    assert stats['passes_pending'] == 0
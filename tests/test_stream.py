@@ -0,0 +1,98 @@
+import asyncio
+import glob
+import json
+import os
+import subprocess
+import sys
+from conftest import repoDir, samplesDir
+from stream import StreamParser, serveTcp
+
+samplePaths = sorted(glob.glob(os.path.join(samplesDir, "lrit", "*.lrit")))
+
+
+def readSamples():
+    samples = []
+    for path in samplePaths:
+        with open(path, "rb") as lritFile:
+            samples.append(lritFile.read())
+    return samples
+
+
+def feedChunks(data, chunkSize, maxFileSize=64 * 1024 * 1024):
+    parser = StreamParser(maxFileSize)
+    events = []
+    for start in range(0, len(data), chunkSize):
+        events += parser.feed(data[start:start + chunkSize])
+    return parser, events
+
+
+def test_feed_chunks():
+    samples = readSamples()
+    smallest = sorted(samples, key=len)[:2]
+
+    # Small chunks split headers and data fields at every kind of boundary
+    for files, chunkSize in ((smallest, 1), (smallest, 7), (samples, 4093), (samples, sum(map(len, samples)))):
+        parser, events = feedChunks(b"".join(files), chunkSize)
+        assert [event.data for event in events if event.kind == "file"] == files
+        assert len([event for event in events if event.kind == "headers"]) == len(files)
+        assert parser.resyncBytes == 0
+        assert len(parser.buffer) == 0
+
+
+def test_resync_and_drop():
+    samples = readSamples()
+    small = min(samples, key=len)
+    large = max(samples, key=len)
+
+    parser = StreamParser(maxFileSize=len(small))
+    events = parser.feed(b"\x17\x42garbage" + large + small)
+    assert parser.resyncBytes == 9
+    assert [event.kind for event in events] == ["headers", "dropped", "headers", "file"]
+    assert events[-1].data == small
+    assert bytes(events[-1].getDataField()) == small[events[-1].headers.primaryHeader.total_header_len:]
+
+
+def test_tcp_loopback():
+    samples = readSamples()
+
+    async def run():
+        events = []
+        server = await serveTcp("127.0.0.1", 0, events.append)
+        host, port = server.sockets[0].getsockname()[:2]
+        async with server:
+            # Stand-in for the demodulator, sending files back to back in small writes
+            reader, writer = await asyncio.open_connection(host, port)
+            data = b"".join(samples)
+            for start in range(0, len(data), 65000):
+                writer.write(data[start:start + 65000])
+                await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+
+            for attempt in range(200):
+                if len([event for event in events if event.kind == "file"]) == len(samples):
+                    break
+                await asyncio.sleep(0.01)
+        return events
+
+    events = asyncio.run(run())
+    files = [event for event in events if event.kind == "file"]
+    assert [event.data for event in files] == samples
+    assert [event.headers.path for event in files] == [os.path.basename(path) for path in samplePaths]
+
+    lrit = files[0].open()
+    assert lrit.primaryHeader.valid
+    lrit.close()
+
+
+def test_stdin_redirected_file(tmp_path):
+    capturePath = tmp_path / "capture.bin"
+    capturePath.write_bytes(b"".join(readSamples()))
+
+    # "lrit-stream.py < capture.bin", stdin is a regular file rather than a pipe
+    with open(capturePath, "rb") as captureFile:
+        output = subprocess.run([sys.executable, os.path.join(repoDir, "lrit-stream.py")], stdin=captureFile,
+                                stdout=subprocess.PIPE, check=True).stdout
+    records = [json.loads(line) for line in output.decode().splitlines()]
+    assert [record['event'] for record in records] == ["file"] * len(samplePaths)
+    assert [record['path'] for record in records] == [os.path.basename(path) for path in samplePaths]